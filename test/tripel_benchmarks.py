@@ -0,0 +1,404 @@
+'''
+rough before/after timings for the performance-sensitive paths in tripel_core.  these run against the same test
+databases as tripel_tests.py, and some of them create neo nodes that they don't clean up, so point them at a
+scratch neo instance.
+
+not collected by nose (no *_test functions).  run from the test directory:
+  python tripel_benchmarks.py                   (runs everything)
+  python tripel_benchmarks.py gremlin_lib_bench (runs just the named benchmarks)
+'''
+import os
+import sys
+import json
+import time
+import random
+import getpass
+
+import web
+
+from tripel.tripel_core import PgUtil, NeoUtil, GremlinLibRegistry, NeoRestBatchBackend, TripelNode, TripelEdge
+from tripel.tripel_core import NodespaceNode, RootCategoryNode, UserNode, CategoryNode, WriteupNode, CommentNode
+from tripel.tripel_core import AdhocNeoQueries, CategoryTreeCache, ContentSearch, User, Nodespace
+from tripel.tripel_core import PooledPostgresDB, PgStatementRegistry, MetaspaceSession, NodespaceAccessEntry, NodespacePrivilegeSet, AuthEvent
+from tripel.util import DateTimeUtil
+import tripel.config.parameters as params
+
+os.chdir('..')
+os.chdir('tripel')
+
+pgdb_password_test = getpass.getpass('please enter the postgres database password: ')
+
+PGDB_TEST = PgUtil.get_db_conn_ssl(params.PG_DBNAME_TEST, params.PG_USERNAME_TEST, pgdb_password_test, params.PG_HOST_ADDR_TEST)
+NEODB_TEST = NeoUtil.get_db_conn(params.NEO_DB_URI_TEST)
+DB_TUPLE_TEST = (PGDB_TEST, NEODB_TEST)
+
+# nodespace ids for neo-only benchmark data, well away from anything real in the test pg db
+BENCH_NODESPACE_ID_BASE = 1000000000
+
+
+def time_calls(fn, num_iterations):
+    timings = []
+    for i in range(num_iterations):
+        start_time = time.time()
+        fn(i)
+        timings.append(time.time() - start_time)
+    return timings
+
+def percentile(sorted_vals, pct):
+    if not sorted_vals:
+        return None
+    idx = min(len(sorted_vals) - 1, int(round(pct / 100.0 * (len(sorted_vals) - 1))))
+    return sorted_vals[idx]
+
+def print_timings(label, timings):
+    sorted_timings = sorted(timings)
+    print '%-40s n=%-5i mean=%8.2fms  p50=%8.2fms  p95=%8.2fms  p99=%8.2fms  max=%8.2fms' % \
+            (label, len(timings), 1000 * sum(timings) / len(timings), 1000 * percentile(sorted_timings, 50),
+            1000 * percentile(sorted_timings, 95), 1000 * percentile(sorted_timings, 99), 1000 * sorted_timings[-1])
+
+
+def _get_bench_nodespace_stmt_defs(i):
+    nodespace_id = BENCH_NODESPACE_ID_BASE + i
+    stmt_defs = []
+    stmt_defs.extend(NodespaceNode.create_new_nodespace_node(DB_TUPLE_TEST, nodespace_id, {}, False))
+    stmt_defs.extend(RootCategoryNode.create_new_root_category_node(DB_TUPLE_TEST, nodespace_id, {}, False))
+    return stmt_defs
+
+def _get_request_size(stmt_defs, should_pre_init):
+    stmt_block, master_params = NeoUtil.render_gremlin_statements(stmt_defs)
+    if should_pre_init:
+        stmt_block = NeoUtil._prefix_gremlin_lib_scripts(stmt_block)
+    return len(json.dumps({'script': stmt_block, 'params': master_params}))
+
+def gremlin_lib_bench(num_iterations=50):
+    '''in-lining GremlinUtils in every write vs. installing it once via GremlinLibRegistry.'''
+    sample_stmt_defs = _get_bench_nodespace_stmt_defs(0)
+    print 'request body bytes, in-lined lib:  %i' % _get_request_size(sample_stmt_defs, True)
+    print 'request body bytes, registered lib: %i' % _get_request_size(sample_stmt_defs, False)
+    
+    pre_init_fn = lambda i: NeoUtil.run_gremlin_statements(NEODB_TEST, _get_bench_nodespace_stmt_defs(i), should_pre_init=True)
+    print_timings('nodespace create, in-lined lib', time_calls(pre_init_fn, num_iterations))
+    
+    GremlinLibRegistry.forget_installs(NEODB_TEST)
+    registry_fn = lambda i: NeoUtil.run_gremlin_statements(NEODB_TEST, _get_bench_nodespace_stmt_defs(num_iterations + i), should_pre_init=None)
+    print_timings('nodespace create, registered lib', time_calls(registry_fn, num_iterations))
+    if GremlinLibRegistry.is_non_caching(NEODB_TEST):
+        print 'note: server does not retain the lib between scripts, so the registered lib run fell back to in-lining'
+
+
+def _create_bench_nodespace(bench_id):
+    '''creates a neo-only nodespace and user to hang benchmark content off of.  returns (root_cat_unq_id, user_id).'''
+    nodespace_id = user_id = BENCH_NODESPACE_ID_BASE + bench_id
+    NodespaceNode.create_new_nodespace_node(DB_TUPLE_TEST, nodespace_id, {})
+    root_cat_node = RootCategoryNode.create_new_root_category_node(DB_TUPLE_TEST, nodespace_id, {})
+    UserNode.create_new_user_node(DB_TUPLE_TEST, user_id, {})
+    return root_cat_node._properties[RootCategoryNode.UNIQUE_NODE_ID_FIELD_NAME], user_id
+
+def stmt_backend_bench(num_iterations=50):
+    '''creating categories, writeups and comments through the gremlin backend vs. the REST batch backend.'''
+    root_cat_unq_id, user_id = _create_bench_nodespace(2 * num_iterations)
+    
+    for stmt_backend in [NeoUtil.STMT_BACKEND_GREMLIN, NeoUtil.STMT_BACKEND_REST_BATCH]:
+        def create_category(i):
+            stmt_defs = CategoryNode.create_new_category_node(DB_TUPLE_TEST, root_cat_unq_id, user_id, 'bench cat %i' % i, 'desc', {}, False)
+            NeoUtil.run_gremlin_statements(NEODB_TEST, stmt_defs, stmt_backend=stmt_backend)
+            return stmt_defs[0]['py_result']
+        cat_timings = []
+        cat_unq_ids = []
+        for i in range(num_iterations):
+            start_time = time.time()
+            cat_unq_ids.append(create_category(i)._properties[CategoryNode.UNIQUE_NODE_ID_FIELD_NAME])
+            cat_timings.append(time.time() - start_time)
+        print_timings('%s: create category' % stmt_backend, cat_timings)
+        
+        def create_writeup(i):
+            stmt_defs = WriteupNode.create_new_writeup_node(DB_TUPLE_TEST, cat_unq_ids[i], user_id, 'bench wrup %i' % i, 'body', {}, False)
+            NeoUtil.run_gremlin_statements(NEODB_TEST, stmt_defs, stmt_backend=stmt_backend)
+        print_timings('%s: create writeup' % stmt_backend, time_calls(create_writeup, num_iterations))
+        
+        def create_comment(i):
+            stmt_defs = CommentNode.start_new_comment_thread(DB_TUPLE_TEST, cat_unq_ids[i], user_id, 'bench cmnt %i' % i, 'body', {}, False)
+            NeoUtil.run_gremlin_statements(NEODB_TEST, stmt_defs, stmt_backend=stmt_backend)
+        print_timings('%s: create comment' % stmt_backend, time_calls(create_comment, num_iterations))
+
+
+def _count_index_lookups(stmt_defs):
+    '''how many index lookups createAndIndexEdge has to do for stmt_defs (one per endpoint not given as a StmtResultRef).'''
+    edge_stmt_defs = filter(lambda stmt_def: stmt_def['method_name'] == NeoRestBatchBackend.EDGE_METHOD_NAME, stmt_defs)
+    return len(filter(lambda lookup_info: not isinstance(lookup_info, NeoUtil.StmtResultRef), 
+                    [stmt_def['param_values'][endpoint] for stmt_def in edge_stmt_defs for endpoint in ['out_node_lookup_info', 'in_node_lookup_info']]))
+
+def _without_result_refs(stmt_defs):
+    '''the same stmt_defs, but with each StmtResultRef replaced by a unique id lookup, the way they were built before refs.'''
+    deref_stmt_defs = []
+    for stmt_def in stmt_defs:
+        stmt_def = stmt_def.copy()
+        stmt_def['param_values'] = stmt_def['param_values'].copy()
+        for param_name, param_value in stmt_def['param_values'].items():
+            if isinstance(param_value, NeoUtil.StmtResultRef):
+                ref_unq_id = param_value.stmt_def['py_result']._properties[TripelNode.UNIQUE_NODE_ID_FIELD_NAME]
+                stmt_def['param_values'][param_name] = TripelEdge._get_node_lookup_info(TripelNode.UNIQUE_NODE_ID_INDEX_NAME, TripelNode.UNIQUE_NODE_ID_FIELD_NAME, ref_unq_id)
+        deref_stmt_defs.append(stmt_def)
+    return deref_stmt_defs
+
+def stmt_result_ref_bench(num_iterations=50):
+    '''comment creation with edges that look their new node up by unique id vs. edges that refer to the earlier result.'''
+    root_cat_unq_id, user_id = _create_bench_nodespace(2 * num_iterations + 1)
+    cat_node = CategoryNode.create_new_category_node(DB_TUPLE_TEST, root_cat_unq_id, user_id, 'bench ref cat', 'desc', {})
+    cat_unq_id = cat_node._properties[CategoryNode.UNIQUE_NODE_ID_FIELD_NAME]
+    
+    get_comment_stmt_defs = lambda i: CommentNode.start_new_comment_thread(DB_TUPLE_TEST, cat_unq_id, user_id, 'bench ref cmnt %i' % i, 'body', {}, False)
+    sample_stmt_defs = get_comment_stmt_defs(0)
+    print 'index lookups per comment, unique id lookups: %i' % _count_index_lookups(_without_result_refs(sample_stmt_defs))
+    print 'index lookups per comment, result refs:       %i' % _count_index_lookups(sample_stmt_defs)
+    
+    lookup_fn = lambda i: NeoUtil.run_gremlin_statements(NEODB_TEST, _without_result_refs(get_comment_stmt_defs(i)), stmt_backend=NeoUtil.STMT_BACKEND_GREMLIN)
+    print_timings('create comment, unique id lookups', time_calls(lookup_fn, num_iterations))
+    ref_fn = lambda i: NeoUtil.run_gremlin_statements(NEODB_TEST, get_comment_stmt_defs(i), stmt_backend=NeoUtil.STMT_BACKEND_GREMLIN)
+    print_timings('create comment, result refs', time_calls(ref_fn, num_iterations))
+
+
+def _create_synthetic_nodespace(bench_id, branching_factor, depth, wrups_per_cat):
+    '''a category tree with branching_factor subcategories per category, depth levels deep, and wrups_per_cat writeups per category.'''
+    root_cat_unq_id, user_id = _create_bench_nodespace(bench_id)
+    nodespace_id = BENCH_NODESPACE_ID_BASE + bench_id
+    parent_cat_unq_ids = [root_cat_unq_id]
+    for level in range(depth):
+        # one transaction per level, so that each level's parents are committed before anything gets linked to them
+        stmt_defs = []
+        for parent_cat_unq_id in parent_cat_unq_ids:
+            for i in range(branching_factor):
+                stmt_defs.extend(CategoryNode.create_new_category_node(DB_TUPLE_TEST, parent_cat_unq_id, user_id, 'synth cat', 'desc', {}, False, nodespace_id))
+        NeoUtil.run_gremlin_statements(NEODB_TEST, stmt_defs)
+        parent_cat_unq_ids = [stmt_def['py_result']._properties[CategoryNode.UNIQUE_NODE_ID_FIELD_NAME] 
+                                for stmt_def in stmt_defs if stmt_def['method_name'] == NeoRestBatchBackend.NODE_METHOD_NAME]
+        
+        stmt_defs = []
+        for cat_unq_id in parent_cat_unq_ids:
+            for i in range(wrups_per_cat):
+                stmt_defs.extend(WriteupNode.create_new_writeup_node(DB_TUPLE_TEST, cat_unq_id, user_id, 'synth wrup', 'body', {}, False, nodespace_id))
+        NeoUtil.run_gremlin_statements(NEODB_TEST, stmt_defs)
+    return nodespace_id
+
+def _count_cypher_rows(fn):
+    '''calls fn, and returns (its result, number of cypher queries it ran, total rows those returned).'''
+    execute_cypher, orig_execute_cypher_attr = NeoUtil.execute_cypher, NeoUtil.__dict__['execute_cypher']
+    counts = {'num_queries': 0, 'num_rows': 0}
+    def counting_execute_cypher(neodb, query, query_params):
+        rows = execute_cypher(neodb, query, query_params)
+        counts['num_queries'] += 1
+        counts['num_rows'] += len(rows)
+        return rows
+    
+    NeoUtil.execute_cypher = staticmethod(counting_execute_cypher)
+    try:
+        result = fn()
+    finally:
+        NeoUtil.execute_cypher = orig_execute_cypher_attr
+    return result, counts['num_queries'], counts['num_rows']
+
+def nodespace_overview_bench(num_iterations=5, sizes=[(3, 2, 2), (3, 3, 4), (4, 3, 6), (4, 4, 8)]):
+    '''get_nodespace_categories_and_writeups, the cartesian single query vs. the category cache plus one row per writeup.'''
+    for i in range(len(sizes)):
+        branching_factor, depth, wrups_per_cat = sizes[i]
+        # bench ids well past the ones the other benchmarks use with their default num_iterations
+        nodespace_id = _create_synthetic_nodespace(1000 + i, branching_factor, depth, wrups_per_cat)
+        label = 'branching=%i depth=%i wrups/cat=%i' % sizes[i]
+        
+        old_fn = lambda: AdhocNeoQueries._get_nodespace_categories_and_writeups_cartesian(NEODB_TEST, nodespace_id)
+        old_graph_dict, num_queries, num_rows = _count_cypher_rows(old_fn)
+        print '%s: %i nodes, %i edges' % (label, len(old_graph_dict['nodes']), len(old_graph_dict['edges']))
+        print '  cartesian: %i queries, %i rows' % (num_queries, num_rows)
+        print_timings('  cartesian', time_calls(lambda j: old_fn(), num_iterations))
+        
+        def new_fn():
+            CategoryTreeCache.get_cache().forget_nodespace(nodespace_id)
+            return AdhocNeoQueries.get_nodespace_categories_and_writeups(NEODB_TEST, nodespace_id)
+        new_graph_dict, num_queries, num_rows = _count_cypher_rows(new_fn)
+        print '  linear:    %i queries, %i rows (%i nodes, %i edges)' % (num_queries, num_rows, len(new_graph_dict['nodes']), len(new_graph_dict['edges']))
+        print_timings('  linear, cold category cache', time_calls(lambda j: new_fn(), num_iterations))
+        warm_fn = lambda j: AdhocNeoQueries.get_nodespace_categories_and_writeups(NEODB_TEST, nodespace_id)
+        print_timings('  linear, warm category cache', time_calls(warm_fn, num_iterations))
+
+
+SEARCH_BENCH_VOCABULARY = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliet', 
+                            'kilo', 'lima', 'mike', 'november', 'oscar', 'papa', 'quebec', 'romeo', 'sierra', 'tango']
+
+def _create_search_bench_writeups(bench_id, num_writeups, chunk_size=500):
+    '''
+    num_writeups writeups in a new bench nodespace, with bodies of words from SEARCH_BENCH_VOCABULARY (skewed, so that 
+    the first words are common and the last ones are rare), plus one word that's unique to the writeup.
+    '''
+    root_cat_unq_id, user_id = _create_bench_nodespace(bench_id)
+    nodespace_id = BENCH_NODESPACE_ID_BASE + bench_id
+    cat_unq_id = CategoryNode.create_new_category_node(DB_TUPLE_TEST, root_cat_unq_id, user_id, 'search bench cat', 'desc', {}, 
+                                                        nodespace_id=nodespace_id)._properties[CategoryNode.UNIQUE_NODE_ID_FIELD_NAME]
+    rand = random.Random(bench_id)
+    vocab_len = len(SEARCH_BENCH_VOCABULARY)
+    for chunk_start in range(0, num_writeups, chunk_size):
+        stmt_defs = []
+        for i in range(chunk_start, min(chunk_start + chunk_size, num_writeups)):
+            words = [SEARCH_BENCH_VOCABULARY[min(int(rand.expovariate(5.0 / vocab_len)), vocab_len - 1)] for j in range(60)]
+            body = ' '.join(words + ['uniq%ix%i' % (bench_id, i)])
+            stmt_defs.extend(WriteupNode.create_new_writeup_node(DB_TUPLE_TEST, cat_unq_id, user_id, 'search bench wrup %i' % i, body, {}, False, nodespace_id))
+        NeoUtil.run_gremlin_statements(NEODB_TEST, stmt_defs, should_coalesce=False)
+    return nodespace_id
+
+def nodespace_search_bench(num_iterations=200, num_nodespaces=10, wrups_per_nodespace=10000):
+    '''ContentSearch over num_nodespaces * wrups_per_nodespace writeups, searching one nodespace at a time, with and without the cache.'''
+    nodespace_ids = [_create_search_bench_writeups(2000 + i, wrups_per_nodespace) for i in range(num_nodespaces)]
+    search_cache = ContentSearch.get_cache()
+    queries = [('common term', lambda i: 'alpha'), ('rare term', lambda i: 'tango'), ('two terms', lambda i: 'bravo sierra'),
+                ('unique term', lambda i: 'uniq%ix%i' % (2000 + i % num_nodespaces, i)), ('no match', lambda i: 'zulu')]
+    for label, get_query_text in queries:
+        def cold_search(i):
+            search_cache.forget_all()
+            return search_cache.search(NEODB_TEST, [nodespace_ids[i % num_nodespaces]], get_query_text(i))
+        print_timings('%s, first page' % label, time_calls(cold_search, num_iterations))
+        
+        def next_page_search(i):
+            search_cache.forget_all()
+            return search_cache.search(NEODB_TEST, [nodespace_ids[i % num_nodespaces]], get_query_text(i), cursor=str(params.SEARCH_PAGE_SIZE * 10))
+        print_timings('%s, 11th page' % label, time_calls(next_page_search, num_iterations))
+        
+        warm_search = lambda i: search_cache.search(NEODB_TEST, [nodespace_ids[0]], get_query_text(0))
+        print_timings('%s, cached' % label, time_calls(warm_search, num_iterations))
+    print 'cache stats: %s' % json.dumps(search_cache.get_stats())
+
+def _create_instance_from_query_row_dict(pg_class, query_row):
+    '''the way PgPersistent used to build objects:  a plain instance with a __dict__, filled in by a setattr loop.'''
+    result = pg_class()
+    for field_name in pg_class.FIELD_NAMES:
+        setattr(result, field_name, query_row[field_name])
+    result._massage_raw_pg_output_vals()
+    return result
+
+def _get_obj_size(obj):
+    '''bytes for the object and its __dict__ (if it has one), not counting the field values, which are shared either way.'''
+    if type(obj).__dict__.get('_is_row_class'):
+        # asking a row object for its __dict__ would create one
+        return sys.getsizeof(obj)
+    return sys.getsizeof(obj) + sys.getsizeof(obj.__dict__)
+
+def pg_row_materialize_bench(num_iterations=20, num_rows=10000):
+    '''turning num_rows synthetic users and nodespaces rows into objects:  the old setattr loop vs. the row class materializer.  no db needed.'''
+    user_rows = [web.storage(user_id=i, email_addr='user%i@example.com' % i, username='user%i' % i, encrypted_password='x' * 60, 
+                            user_statement='statement %i' % i, is_enabled=True, metaspace_privileges='{create_space}', creator=1, 
+                            creation_date=None, modifier=None, modification_date=None) for i in range(num_rows)]
+    nodespace_rows = [web.storage(nodespace_id=i, nodespace_name='nodespace%i' % i, nodespace_description='description %i' % i, 
+                                creator=1, creation_date=None, modifier=None, modification_date=None) for i in range(num_rows)]
+    for pg_class, query_rows in [(User, user_rows), (Nodespace, nodespace_rows)]:
+        materializers = [('%s, setattr loop' % pg_class.__name__, lambda: [_create_instance_from_query_row_dict(pg_class, row) for row in query_rows]),
+                        ('%s, row class list' % pg_class.__name__, lambda: pg_class._query_results_to_obj_list(query_rows)),
+                        ('%s, row class iter' % pg_class.__name__, lambda: sum(1 for obj in pg_class.iter_objs_from_query_results(query_rows)))]
+        for label, materialize in materializers:
+            timings = time_calls(lambda i: materialize(), num_iterations)
+            print_timings(label, timings)
+            print '%-40s %.2fus/row' % ('', 1000000 * sum(timings) / len(timings) / num_rows)
+        old_obj, row_obj = _create_instance_from_query_row_dict(pg_class, query_rows[0]), pg_class._create_instance_from_query_row(query_rows[0])
+        print '%-40s setattr loop %i bytes/obj, row class %i bytes/obj' % (pg_class.__name__ + ' size', _get_obj_size(old_obj), _get_obj_size(row_obj))
+
+def prepared_statement_bench(num_iterations=500):
+    '''the PgStatementRegistry queries (the ones that run on every request or login), as plain queries and as prepared statements.'''
+    if not isinstance(PGDB_TEST, PooledPostgresDB):
+        print 'skipping, prepared statements need PG_POOL_ENABLED'
+        return
+    users = User.get_all_users(PGDB_TEST)
+    if not users:
+        print 'skipping, needs at least one user in the test db'
+        return
+    user = users[0]
+    queries = [('get_existing_session', lambda i: MetaspaceSession.get_existing_session(PGDB_TEST, 'no such session %i' % i)),
+                ('get_existing_user_by_id', lambda i: User.get_existing_user_by_id(PGDB_TEST, user.user_id)),
+                ('get_existing_access_entry', lambda i: NodespaceAccessEntry.get_existing_access_entry(PGDB_TEST, 1, user.user_id)),
+                ('can_check_password', lambda i: user.can_check_password(PGDB_TEST))]
+    orig_prepared_stmts_enabled = params.PG_PREPARED_STATEMENTS_ENABLED
+    try:
+        for label, run_query in queries:
+            for is_enabled in [False, True]:
+                params.PG_PREPARED_STATEMENTS_ENABLED = is_enabled
+                # all in one request scope, so the timings aren't about connection checkout
+                with PGDB_TEST.request_scope():
+                    run_query(-1)
+                    print_timings('%s, %s' % (label, 'prepared' if is_enabled else 'plain'), time_calls(run_query, num_iterations))
+    finally:
+        params.PG_PREPARED_STATEMENTS_ENABLED = orig_prepared_stmts_enabled
+    print 'statement stats: %s' % json.dumps(PgStatementRegistry.get_stats())
+
+
+class _SetPrivilegeSet(object):
+    '''the way PrivilegeSet used to work:  a set of privilege strings, parsed by stripping, splitting and filtering the pg literal.'''
+    def __init__(self, priv_list_string, recognized_privileges):
+        priv_list = priv_list_string.strip(' {}').replace(' ', '').split(',')
+        self._privileges = set(filter(lambda priv: priv in recognized_privileges, priv_list))
+    
+    def has_privilege(self, privilege):
+        return privilege in self._privileges
+    
+    def has_one_or_more_privileges(self, privileges):
+        return len(privileges.intersection(self._privileges)) > 0
+
+def privilege_set_bench(num_iterations=20, num_rows=10000):
+    '''parsing num_rows privilege literals and checking them:  the old set-based way vs. interned bitmasks.  no db needed.'''
+    privs = NodespacePrivilegeSet._ORDERED_PRIV_LIST
+    priv_literals = ['{%s}' % ','.join(random.sample(privs, random.randint(0, len(privs)))) for i in range(num_rows)]
+    recognized_privs = NodespacePrivilegeSet.RECOGNIZED_PRIVILEGES
+    parsers = [('parse, set', lambda: [_SetPrivilegeSet(priv_literal, recognized_privs) for priv_literal in priv_literals]),
+                ('parse, interned bitmask', lambda: [NodespacePrivilegeSet.create_from_pg_array(priv_literal) for priv_literal in priv_literals])]
+    for label, parse in parsers:
+        timings = time_calls(lambda i: parse(), num_iterations)
+        print_timings(label, timings)
+        print '%-40s %.2fus/row' % ('', 1000000 * sum(timings) / len(timings) / num_rows)
+    
+    old_priv_sets, new_priv_sets = parsers[0][1](), parsers[1][1]()
+    sufficient_privs = frozenset([NodespacePrivilegeSet.CONTRIBUTOR, NodespacePrivilegeSet.ADMIN])
+    sufficient_privs_interned = NodespacePrivilegeSet.create_interned_from_list_of_strings(sufficient_privs)
+    checkers = [('has_one_or_more, set', lambda: [priv_set.has_one_or_more_privileges(sufficient_privs) for priv_set in old_priv_sets]),
+                ('has_one_or_more, bitmask', lambda: [priv_set.has_one_or_more_privileges(sufficient_privs_interned) for priv_set in new_priv_sets]),
+                ('has_privilege, set', lambda: [priv_set.has_privilege(NodespacePrivilegeSet.ADMIN) for priv_set in old_priv_sets]),
+                ('has_privilege, bitmask', lambda: [priv_set.has_privilege(NodespacePrivilegeSet.ADMIN) for priv_set in new_priv_sets])]
+    for label, check in checkers:
+        timings = time_calls(lambda i: check(), num_iterations)
+        print_timings(label, timings)
+        print '%-40s %.2fus/check' % ('', 1000000 * sum(timings) / len(timings) / num_rows)
+    print 'distinct interned nodespace privilege sets: %i' % len(set(map(id, new_priv_sets)))
+
+
+def bulk_insert_bench(num_rows=10000, chunk_sizes=[100, 1000]):
+    '''inserting num_rows auth events one at a time vs. with a bulk insert.  each run is rolled back, so it leaves nothing behind.'''
+    users = User.get_all_users(PGDB_TEST, limit=1)
+    if not users:
+        print 'skipping, needs at least one user in the test db'
+        return
+    user_id = users[0].user_id
+    ins_params_list = [{'user_id': user_id, 'auth_event': AuthEvent.SESSION_CLEANED, 'auth_event_date': DateTimeUtil.datetime_now_utc_aware()} 
+                        for i in range(num_rows)]
+    
+    def ins_singly():
+        for ins_params in ins_params_list:
+            AuthEvent()._ins_obj_instance_and_set_pk_att(PGDB_TEST, ins_params)
+    inserters = [('one at a time', ins_singly)]
+    for chunk_size in chunk_sizes:
+        inserters.append(('bulk, %i rows/stmt' % chunk_size, 
+                            lambda chunk_size=chunk_size: AuthEvent._bulk_ins_obj_instances_and_set_pk_atts(PGDB_TEST, [AuthEvent() for i in range(num_rows)], 
+                                                                                                            ins_params_list, chunk_size)))
+    for label, insert_rows in inserters:
+        trans = PGDB_TEST.transaction()
+        try:
+            start_time = time.time()
+            insert_rows()
+            elapsed_secs = time.time() - start_time
+        finally:
+            trans.rollback()
+        print '%-40s %i rows in %.2fs, %8.0f rows/s' % (label, num_rows, elapsed_secs, num_rows / elapsed_secs)
+
+
+ALL_BENCHMARKS = [gremlin_lib_bench, stmt_backend_bench, stmt_result_ref_bench, nodespace_overview_bench, nodespace_search_bench, 
+                    pg_row_materialize_bench, prepared_statement_bench, privilege_set_bench, bulk_insert_bench]
+
+if __name__ == '__main__':
+    benchmark_names = sys.argv[1:]
+    for benchmark in ALL_BENCHMARKS:
+        if not benchmark_names or benchmark.__name__ in benchmark_names:
+            print '\n== %s: %s' % (benchmark.__name__, benchmark.__doc__)
+            benchmark()
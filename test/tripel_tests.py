@@ -1,6 +1,14 @@
 import os
 import getpass
 import traceback
+import threading
+import json
+import time
+import errno
+import socket
+import httplib
+import BaseHTTPServer
+import SocketServer
 
 import nose
 from mock import Mock, create_autospec
@@ -8,10 +16,15 @@ from mock import Mock, create_autospec
 import web
 from py2neo import neo4j
 
-from tripel.tripel_core import PgUtil, NeoUtil, init_neodb, User, Invitation, MetaspaceInvitation, Nodespace, NodespaceInvitation
-from tripel.tripel_core import PasswordChangeAuditEntry, MetaspacePrivilegeAuditEntry
+from tripel.tripel_core import PgUtil, PgConnectionPool, PooledPostgresDB, PgStatementRegistry, NeoUtil, init_neodb, User, Invitation, MetaspaceInvitation, Nodespace, NodespaceInvitation
+from tripel.tripel_core import NodespaceAccessEntry, ReplicaRoutedDB
+from tripel.tripel_core import PasswordChangeAuditEntry, MetaspacePrivilegeAuditEntry, AuthEvent
+from tripel.tripel_core import NeoRestBatchBackend, UniqueIdAllocator, TripelNode, NeoWriteCoalescer, NeoHttpPool, NeoRequestError, NeoIndexRegistry, NeoRestElement
+from tripel.tripel_core import NodespaceNode, NodespaceContentNode, RootCategoryNode, CategoryNode, WriteupNode, CommentNode, CategoryTreeCache, AdhocNeoQueries, ContentSearch
+from tripel.tripel_core import SavedSearch, NotificationNode, RecommendationNode, AlertNode
 from tripel.tripel_core import MetaspacePrivilegeSet, NodespacePrivilegeSet, PrivilegeChecker, MetaspacePrivilegeChecker, NodespacePrivilegeChecker, MetaspaceSession
-from tripel.util import DateTimeUtil
+from tripel.saved_search_evaluator import SavedSearchIndex, SavedSearchEvaluator
+from tripel.util import DateTimeUtil, CompactIdSet, iter_json_array_items, iter_adhoc_graph_elements, get_text_snippet
 import tripel.config.parameters as params
 
 os.chdir('..')
@@ -337,6 +350,28 @@ def Privileges_tests():
     with AssertExceptionThrown(TypeError):
         ns_privs3 == ms_privs1
 
+def PrivilegeSet_interning_test():
+    ns_privs1 = NodespacePrivilegeSet.create_from_pg_string_literal('{editor, moderator}')
+    ns_privs2 = NodespacePrivilegeSet.create_from_pg_array(['moderator', 'editor', 'bogus'])
+    assert ns_privs1 is ns_privs2
+    assert ns_privs1 is NodespacePrivilegeSet.create_from_pg_array('{editor, moderator}')
+    assert ns_privs1 == NodespacePrivilegeSet.create_from_list_of_strings([NodespacePrivilegeSet.EDITOR, NodespacePrivilegeSet.MODERATOR])
+    assert ns_privs1.get_pg_string_literal() == '{editor,moderator}'
+    assert list(ns_privs1) == [NodespacePrivilegeSet.EDITOR, NodespacePrivilegeSet.MODERATOR]
+    assert NodespacePrivilegeSet.create_from_pg_string_literal('{}').get_pg_string_literal() == '{}'
+    
+    assert ns_privs1.has_one_or_more_privileges(NodespacePrivilegeChecker.CONTENT_CREATION_PRIVS) == False
+    assert ns_privs1.has_one_or_more_privileges([NodespacePrivilegeSet.ADMIN, NodespacePrivilegeSet.EDITOR])
+    assert not ns_privs1.has_all_privileges([NodespacePrivilegeSet.EDITOR, 'bogus'])
+    
+    # interned sets are shared, so they can't be changed
+    with AssertExceptionThrown(TypeError):
+        ns_privs1.add_privilege(NodespacePrivilegeSet.ADMIN)
+    assert not ns_privs1.has_privilege(NodespacePrivilegeSet.ADMIN)
+    
+    # metaspace and nodespace sets are interned separately
+    assert MetaspacePrivilegeSet.create_from_pg_string_literal('{}') is not NodespacePrivilegeSet.create_from_pg_string_literal('{}')
+
 def PrivilegeChecker_tests():
     with AssertExceptionThrown(PrivilegeChecker.UnrecognizedActionException):
         MetaspacePrivilegeChecker.is_allowed_to_do(DB_TUPLE_PT_NM, 'MOVE_IMMOVABLE_OBJ', None, User())
@@ -437,4 +472,732 @@ def MetaspaceSession_tests():
         ms_session.kill_session(PGDB_TEST)
         assert ms_session.metaspace_session_id is None
         assert MetaspaceSession.get_existing_session(PGDB_TEST, old_ms_session_id) is None
-        
\ No newline at end of file
+        
+
+def PgPersistent_row_class_test():
+    user_rows = [{'user_id': i, 'email_addr': 'u%i@example.com' % i, 'username': 'u%i' % i, 'encrypted_password': 'x', 'user_statement': '', 
+                    'is_enabled': True, 'metaspace_privileges': '{create_space}', 'creator': 1, 'creation_date': None, 'modifier': None, 
+                    'modification_date': None} for i in range(3)]
+    user_iter = User.iter_objs_from_query_results(iter(user_rows))
+    user = next(user_iter)
+    assert isinstance(user, User) and type(user) is User._get_row_class() and type(user).__name__ == 'User'
+    assert user.metaspace_privileges == MetaspacePrivilegeSet.create_from_list_of_strings(['create_space'])
+    assert user.as_dict() == dict(user_rows[0], metaspace_privileges=user.metaspace_privileges)
+    assert [u.user_id for u in user_iter] == [1, 2]
+    
+    # attributes outside of FIELD_NAMES still work, and the row classes aren't shared between classes
+    user.extra_info = 'foo'
+    assert user.as_dict()['extra_info'] == 'foo'
+    assert User._get_row_class() is User._get_row_class()._get_row_class()
+    assert Nodespace._get_row_class() is not User._get_row_class()
+    nodespace_row = dict((field_name, None) for field_name in Nodespace.FIELD_NAMES)
+    assert User._create_instance_from_query_row(user_rows[2]).username == 'u2'
+    assert Nodespace._query_results_to_obj_list([nodespace_row])[0].as_dict() == nodespace_row
+
+def PgPersistent_bulk_insert_test():
+    class FakeBulkPgdb(object):
+        def __init__(self):
+            self.num_transactions, self.inserts, self.next_seq_val = 0, [], 100
+        def transaction(self):
+            self.num_transactions += 1
+            return self
+        def __enter__(self):
+            pass
+        def __exit__(self, exc_type, exc_value, exc_traceback):
+            pass
+        def query(self, sql_query, vars):
+            seq_vals = range(self.next_seq_val, self.next_seq_val + vars['num_vals'])
+            self.next_seq_val += vars['num_vals']
+            return [{'next_seq_val': seq_val} for seq_val in seq_vals]
+        def multiple_insert(self, tablename, values, seqname):
+            assert seqname is False
+            self.inserts.append((tablename, values))
+    
+    pgdb = FakeBulkPgdb()
+    access_entries = NodespaceAccessEntry.create_new_access_entries(pgdb, 7, NodespacePrivilegeSet.create_from_list_of_strings(['editor']), range(5), 1, None)
+    assert [access_entry.nodespace_access_id for access_entry in access_entries] == range(100, 105)
+    assert [access_entry.user_id for access_entry in access_entries] == range(5)
+    assert pgdb.num_transactions == 1 and len(pgdb.inserts) == 1
+    tablename, rows = pgdb.inserts[0]
+    assert tablename == NodespaceAccessEntry.TABLE_NAME
+    assert [(row['nodespace_access_id'], row['user_id'], row['nodespace_privileges']) for row in rows] == [(100 + i, i, '{editor}') for i in range(5)]
+    assert len(set([tuple(row.keys()) for row in rows])) == 1
+    
+    # chunked, still in one transaction
+    audit_entries = [AuthEvent() for i in range(5)]
+    AuthEvent._bulk_ins_obj_instances_and_set_pk_atts(pgdb, audit_entries, [{'user_id': i, 'auth_event': AuthEvent.SESSION_CLEANED, 'auth_event_date': None} for i in range(5)], chunk_size=2)
+    assert [audit_entry.auth_event_id for audit_entry in audit_entries] == range(105, 110)
+    assert pgdb.num_transactions == 2
+    assert [len(rows) for tablename, rows in pgdb.inserts[1:]] == [2, 2, 1]
+    
+    with AssertExceptionThrown(ValueError):
+        AuthEvent._bulk_ins_obj_instances_and_set_pk_atts(pgdb, [AuthEvent(), AuthEvent()], [{'user_id': 1}, {'auth_event': AuthEvent.SESSION_CLEANED}])
+    
+    invitations = NodespaceInvitation.create_new_invitations(pgdb, ['a@example.com', 'b@example.com'], 7, None, 'hi', 1)
+    assert [invitation.invitee_email_addr for invitation in invitations] == ['a@example.com', 'b@example.com']
+    assert invitations[0].nodespace_invitation_code != invitations[1].nodespace_invitation_code
+    assert pgdb.inserts[-1][1][0]['initial_nodespace_privileges'] == '{}'
+
+def PgConnectionPool_test():
+    class FakeConn(object):
+        def __init__(self):
+            self.closed, self.num_rollbacks, self.is_broken = 0, 0, False
+        def rollback(self):
+            self.num_rollbacks += 1
+        def close(self):
+            self.closed = 1
+        def cursor(self):
+            if self.is_broken:
+                raise Exception('server closed the connection')
+            return Mock()
+    
+    pool = PgConnectionPool(FakeConn, min_size=1, max_size=2, wait_timeout_secs=0.01, health_check_idle_secs=60, max_idle_secs=60, max_conn_age_secs=60)
+    conn1, conn2 = pool.checkout(), pool.checkout()
+    with AssertExceptionThrown(PgConnectionPool.PoolTimeoutError):
+        pool.checkout()
+    
+    # a returned conn gets rolled back and reused
+    pool.checkin(conn1)
+    assert conn1.num_rollbacks == 1
+    assert pool.checkout() is conn1
+    
+    # a conn that's been idle a while gets checked, and replaced if it's gone bad
+    pool.checkin(conn1)
+    conn1.is_broken = True
+    pool._idle_conns = [(conn1, time.time() - 120)]
+    conn3 = pool.checkout()
+    assert conn3 is not conn1 and conn1.closed
+    
+    # old conns get closed on checkin
+    pool._open_times[id(conn2)] -= 120
+    pool.checkin(conn2)
+    assert conn2.closed
+    
+    # idle conns past min_size get closed once they've sat long enough
+    conn4 = pool.checkout()
+    pool.checkin(conn3)
+    pool._idle_conns[0] = (conn3, time.time() - 120)
+    pool.checkin(conn4)
+    assert conn3.closed and not conn4.closed
+    assert [conn for conn, idle_since in pool._idle_conns] == [conn4]
+    
+    stats = pool.get_stats()
+    assert (stats['num_checkouts'], stats['num_timeouts'], stats['num_waits'], stats['num_health_check_failures']) == (5, 1, 1, 1)
+    assert (stats['num_conns_opened'], stats['num_conns_discarded'], stats['num_in_use'], stats['num_idle']) == (4, 3, 0, 1)
+
+def PgStatementRegistry_test():
+    stmt_name = PgStatementRegistry.register('trpl_test_stmt', 'select * from foo where a = $a and b > $b and c < $a;')
+    assert stmt_name == 'trpl_test_stmt'
+    assert PgStatementRegistry._statements[stmt_name][1:] == ('select * from foo where a = $1 and b > $2 and c < $1;', ['a', 'b'])
+    
+    # not a pooled db, so it's a regular query
+    pgdb = Mock()
+    pgdb.query.return_value = iter([{'a': 1}])
+    assert PgStatementRegistry.query(pgdb, stmt_name, {'a': 1, 'b': 2}) == [{'a': 1}]
+    pgdb.query.assert_called_once_with('select * from foo where a = $a and b > $b and c < $a;', vars={'a': 1, 'b': 2})
+    
+    pooled_pgdb = PooledPostgresDB.__new__(PooledPostgresDB)
+    pooled_pgdb.execute_prepared = Mock(return_value=[{'a': 1}])
+    pooled_pgdb.query = Mock()
+    orig_prepared_stmts_enabled = params.PG_PREPARED_STATEMENTS_ENABLED
+    try:
+        params.PG_PREPARED_STATEMENTS_ENABLED = True
+        assert PgStatementRegistry.query(pooled_pgdb, stmt_name, {'a': 1, 'b': 2}) == [{'a': 1}]
+        pooled_pgdb.execute_prepared.assert_called_once_with(stmt_name, 'select * from foo where a = $1 and b > $2 and c < $1;', [1, 2])
+        
+        params.PG_PREPARED_STATEMENTS_ENABLED = False
+        pooled_pgdb.query.return_value = iter([])
+        assert PgStatementRegistry.query(pooled_pgdb, stmt_name, {'a': 1, 'b': 2}) == []
+        assert pooled_pgdb.query.call_count == 1 and pooled_pgdb.execute_prepared.call_count == 1
+    finally:
+        params.PG_PREPARED_STATEMENTS_ENABLED = orig_prepared_stmts_enabled
+
+def PgUtil_keyset_test():
+    order_cols = [('creation_date', True), ('user_id', False)]
+    assert PgUtil.get_keyset_clauses(order_cols, None) == (None, {}, 'creation_date desc, user_id asc')
+    
+    cursor = PgUtil.encode_page_cursor(['2013-05-01 12:00:00', 42])
+    assert PgUtil.decode_page_cursor(cursor, 2) == ['2013-05-01 12:00:00', 42]
+    where_clause, query_vars, order_clause = PgUtil.get_keyset_clauses(order_cols, cursor)
+    assert where_clause == '((creation_date < $keyset_after_0) or (creation_date = $keyset_after_0 and user_id > $keyset_after_1))'
+    assert query_vars == {'keyset_after_0': '2013-05-01 12:00:00', 'keyset_after_1': 42}
+    
+    with AssertExceptionThrown(ValueError):
+        PgUtil.decode_page_cursor(cursor, 1)
+    with AssertExceptionThrown(ValueError):
+        PgUtil.decode_page_cursor('not a cursor', 2)
+    
+    # values have to fit their columns:  ints for ids, timestamps for everything else
+    PgUtil.get_keyset_clauses(order_cols, PgUtil.encode_page_cursor(['2013-05-01 12:00:00.123456+00:00', 42]))
+    for bad_vals in [[42, '2013-05-01 12:00:00'], ['2013-05-01', '42'], ['2013-13-01', 42], ['2013-05-01; drop table', 42], ['2013-05-01', True]]:
+        with AssertExceptionThrown(ValueError):
+            PgUtil.get_keyset_clauses(order_cols, PgUtil.encode_page_cursor(bad_vals))
+    with AssertExceptionThrown(ValueError):
+        PgUtil.get_keyset_clauses(User.USER_LIST_ORDER_COLS, cursor)
+    
+    # the pk always goes on the end, so the order is total
+    assert User._get_order_cols(None) == [('user_id', False)]
+    assert AuthEvent._get_order_cols(None) == [('auth_event_date', True), ('auth_event_id', True)]
+    assert AuthEvent._get_order_cols('user_id, auth_event_id desc') == [('user_id', False), ('auth_event_id', True)]
+    
+    class Row(object):
+        def __init__(self, auth_event_date, auth_event_id):
+            self.auth_event_date, self.auth_event_id = auth_event_date, auth_event_id
+    rows = [Row('2013-05-02', 7), Row('2013-05-01', 3)]
+    assert AuthEvent.get_next_page_cursor(rows, 3) is None
+    assert PgUtil.decode_page_cursor(AuthEvent.get_next_page_cursor(rows, 2), 2) == ['2013-05-01', 3]
+    assert PgUtil.get_next_page_cursor([web.storage(user_id=5)], User.USER_LIST_ORDER_COLS, 1) == PgUtil.encode_page_cursor([5])
+
+def ReplicaRoutedDB_test():
+    class FakeDB(object):
+        def __init__(self, name, lag_info):
+            self.name, self.lag_info, self._ctx, self.is_down = name, lag_info, {}, False
+        def query(self, sql_query, vars=None):
+            if sql_query == ReplicaRoutedDB.REPLICA_LAG_SQL:
+                return [self.lag_info]
+            if self.is_down:
+                raise Exception('connection refused')
+            return self.name
+        def select(self, tables, **kwargs):
+            return self.name
+        def update(self, tables, **kwargs):
+            return self.name
+    
+    primary = FakeDB('primary', None)
+    replica, lagging_replica = FakeDB('replica', {'is_in_recovery': False, 'lag_secs': None}), FakeDB('lagging', {'is_in_recovery': True, 'lag_secs': 60.0})
+    pgdb = ReplicaRoutedDB(primary, [replica, lagging_replica], sticky_secs=10, max_lag_secs=5, lag_check_interval_secs=60)
+    
+    # reads go to the replica that's caught up, writes and locking reads go to the primary
+    with pgdb.routing_scope(None) as routing_state:
+        assert pgdb.select('foo') == 'replica'
+        assert pgdb.query('select * from foo where a = $a;', vars={'a': 1}) == 'replica'
+        assert pgdb.query('select nextval($seqname) next_seq_val;', vars={'seqname': 'foo_seq'}) == 'primary'
+        assert routing_state.did_write
+        # and once the request has written, its reads stay on the primary
+        assert pgdb.select('foo') == 'primary'
+    assert pgdb.get_stats()['replica_lag_secs'] == [0.0, 60.0]
+    
+    # sticky after a write in an earlier request, until primary_until passes
+    with pgdb.routing_scope(str(pgdb.get_primary_until())) as routing_state:
+        assert pgdb.select('foo') == 'primary'
+        assert not routing_state.did_write
+    with pgdb.routing_scope(str(time.time() - 1)):
+        assert pgdb.select('foo') == 'replica'
+    with pgdb.routing_scope('junk'):
+        assert pgdb.select('foo') == 'replica'
+    
+    # reads inside a transaction go to the primary
+    with pgdb.routing_scope(None):
+        primary._ctx['transactions'] = [None]
+        assert pgdb.get_read_db() is primary
+        primary._ctx['transactions'] = []
+    
+    # bookkeeping writes straight to the primary don't make the client sticky
+    with pgdb.routing_scope(None) as routing_state:
+        assert PgUtil.get_primary_db(pgdb).update('foo') == 'primary'
+        assert not routing_state.did_write
+    
+    # a failed replica read gets retried on the primary, and the replica sits out until it's rechecked
+    replica.is_down = True
+    with pgdb.routing_scope(None):
+        assert pgdb.query('select 1;') == 'primary'
+        replica.is_down = False
+        assert pgdb.query('select 1;') == 'primary'
+    assert pgdb.get_stats()['num_replica_failures'] == 1
+    pgdb._replica_lags[0] = (None, 0)
+    with pgdb.routing_scope(None):
+        assert pgdb.query('select 1;') == 'replica'
+
+def NeoRestBatchBackend_compile_test():
+    node_stmt_def = NeoUtil.get_create_and_index_node_stmt_def({'_TRPL_UNQ_NODE_ID': 5, 'name': 'n'}, {'UNQ_NODE_ID_IDX': ['_TRPL_UNQ_NODE_ID']}, None)
+    local_lookup_info = {'lookupIndexName': 'UNQ_NODE_ID_IDX', 'lookupKey': '_TRPL_UNQ_NODE_ID', 'lookupValue': 5}
+    ext_lookup_info = {'lookupIndexName': 'USER_IDX', 'lookupKey': '_TRPL_USER_ID', 'lookupValue': 1}
+    edge_stmt_def = NeoUtil.get_create_and_index_edge_stmt_def(local_lookup_info, ext_lookup_info, 'CREATED_BY', {'_TRPL_UNQ_EDGE_ID': 7}, 
+                                                                {'UNQ_EDGE_ID_IDX': ['_TRPL_UNQ_EDGE_ID']}, None)
+    stmt_defs = [node_stmt_def, edge_stmt_def]
+    
+    ext_lookup_key = ('USER_IDX', '_TRPL_USER_ID', '1')
+    assert NeoRestBatchBackend.get_external_lookup_keys(stmt_defs) == [ext_lookup_key]
+    
+    jobs, result_job_ids = NeoRestBatchBackend.compile_stmt_defs('http://localhost/db/data/', stmt_defs, {ext_lookup_key: 42})
+    assert result_job_ids == [0, 2]
+    assert [job['id'] for job in jobs] == range(4)
+    assert jobs[0]['to'] == '/node' and jobs[0]['body'] == node_stmt_def['param_values']['node_props']
+    assert jobs[1]['to'] == '/index/node/UNQ_NODE_ID_IDX' and jobs[1]['body'] == {'uri': '{0}', 'key': '_TRPL_UNQ_NODE_ID', 'value': 5}
+    assert jobs[2]['to'] == '{0}/relationships'
+    assert jobs[2]['body'] == {'to': 'http://localhost/db/data/node/42', 'type': 'CREATED_BY', 'data': {'_TRPL_UNQ_EDGE_ID': 7}}
+    assert jobs[3]['to'] == '/index/relationship/UNQ_EDGE_ID_IDX' and jobs[3]['body']['uri'] == '{2}'
+    
+    with AssertExceptionThrown(NeoRestBatchBackend.StatementCompileError):
+        NeoRestBatchBackend.get_external_lookup_keys([{'method_name': 'GremlinUtils.somethingElse', 'param_values': {}}])
+    
+    # an endpoint given as a reference to an earlier statement's result never needs an external lookup
+    ref_edge_stmt_def = NeoUtil.get_create_and_index_edge_stmt_def(NeoUtil.StmtResultRef(node_stmt_def), ext_lookup_info, 'CREATED_BY', 
+                                                                    {'_TRPL_UNQ_EDGE_ID': 8}, {}, None)
+    assert NeoRestBatchBackend.get_external_lookup_keys([node_stmt_def, ref_edge_stmt_def]) == [ext_lookup_key]
+    jobs, result_job_ids = NeoRestBatchBackend.compile_stmt_defs('http://localhost/db/data/', [node_stmt_def, ref_edge_stmt_def], {ext_lookup_key: 42})
+    assert jobs[result_job_ids[1]]['to'] == '{0}/relationships'
+
+def NeoUtil_render_gremlin_statements_test():
+    node_stmt_def = NeoUtil.get_create_and_index_node_stmt_def({'_TRPL_UNQ_NODE_ID': 5}, {}, None)
+    ext_lookup_info = {'lookupIndexName': 'USER_IDX', 'lookupKey': '_TRPL_USER_ID', 'lookupValue': 1}
+    edge_stmt_def = NeoUtil.get_create_and_index_edge_stmt_def(NeoUtil.StmtResultRef(node_stmt_def), ext_lookup_info, 'CREATED_BY', {}, {}, None)
+    
+    stmt_block, master_params = NeoUtil.render_gremlin_statements([node_stmt_def, edge_stmt_def], False)
+    assert 'result_1 = GremlinUtils.createAndIndexEdge(g, result_0, in_node_lookup_info_1, edge_type_1, edge_props_1, fields_to_index_1)' in stmt_block
+    assert 'out_node_lookup_info_1' not in master_params
+    assert master_params['in_node_lookup_info_1'] == ext_lookup_info
+    
+    # references have to point backwards within the batch
+    with AssertExceptionThrown(ValueError):
+        NeoUtil.render_gremlin_statements([edge_stmt_def, node_stmt_def])
+
+def UniqueIdAllocator_test():
+    allocator = UniqueIdAllocator(TripelNode.UNIQUE_NODE_ID_PG_SEQ_NAME, 3)
+    single_ids = [allocator.get_next_id(PGDB_TEST) for i in range(4)]
+    assert allocator.get_metrics()['num_refills'] == 2
+    assert allocator.get_metrics()['num_ids_buffered'] == 2
+    
+    reserved_ids = allocator.reserve_ids(PGDB_TEST, 5)
+    assert len(reserved_ids) == 5
+    assert len(set(single_ids + reserved_ids)) == 9
+    
+    metrics = allocator.get_metrics()
+    assert metrics['num_refills'] == 3 and metrics['num_ids_issued'] == 9 and metrics['num_ids_buffered'] == 0
+    
+    allocator.get_next_id(PGDB_TEST)
+    allocator.shutdown()
+    assert allocator.get_metrics()['num_ids_wasted'] == 2
+
+def NeoWriteCoalescer_test():
+    # stand-in for the neo backend:  "runs" stmt_defs by echoing them back, fails the whole batch like a gremlin error if
+    # any are 'bad', and times out if any are 'slow'
+    class EchoCoalescer(NeoWriteCoalescer):
+        run_sizes = []
+        @staticmethod
+        def _run_uncoalesced(neodb, stmt_defs):
+            EchoCoalescer.run_sizes.append(len(stmt_defs))
+            if 'bad' in stmt_defs:
+                raise NeoRequestError(400, 'bad stmt')
+            if 'slow' in stmt_defs:
+                raise socket.timeout('timed out')
+            return list(stmt_defs)
+    
+    coalescer = EchoCoalescer(max_wait_ms=200, max_stmts=7)
+    def run_writes(caller_stmt_defs):
+        caller_outcomes = {}
+        def write(i):
+            try:
+                caller_outcomes[i] = coalescer.run_statements(NEODB_MOCK, caller_stmt_defs[i])
+            except (NeoRequestError, socket.timeout) as ex:
+                caller_outcomes[i] = ex
+        threads = [threading.Thread(target=write, args=(i,)) for i in range(len(caller_stmt_defs))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return caller_outcomes
+    
+    # one merged attempt that neo rejects, then one retry per caller
+    caller_outcomes = run_writes([['a0', 'a1'], ['b0', 'bad'], ['c0', 'c1', 'c2']])
+    assert EchoCoalescer.run_sizes[0] == 7 and sorted(EchoCoalescer.run_sizes[1:]) == [2, 2, 3]
+    assert caller_outcomes[0] == ['a0', 'a1']
+    assert isinstance(caller_outcomes[1], NeoRequestError)
+    assert caller_outcomes[2] == ['c0', 'c1', 'c2']
+    assert coalescer.get_metrics()['num_failed_batches'] == 1
+    
+    # the merged attempt might have committed before timing out, so everyone gets the timeout and nothing's re-run
+    EchoCoalescer.run_sizes = []
+    caller_outcomes = run_writes([['a0', 'a1'], ['b0', 'slow'], ['c0', 'c1', 'c2']])
+    assert EchoCoalescer.run_sizes == [7]
+    assert all(isinstance(caller_outcomes[i], socket.timeout) for i in range(3))
+    assert coalescer.get_metrics()['num_failed_batches'] == 1
+
+def NeoHttpPool_test():
+    # stand-in for neo:  echoes the request body back, or sends a neo style error body if asked to
+    class EchoHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        def do_POST(self):
+            req_body = json.loads(self.rfile.read(int(self.headers.getheader('content-length'))))
+            status, resp_body = (400, {'message': 'bad script', 'stacktrace': ['line 1']}) if 'fail' in req_body else (200, req_body)
+            resp_body = json.dumps(resp_body)
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(resp_body)))
+            self.end_headers()
+            self.wfile.write(resp_body)
+        def log_message(self, *args):
+            pass
+    class EchoServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+        daemon_threads = True
+        def handle_error(self, request, client_address):
+            # clients hanging up mid-response is expected here
+            pass
+    
+    echo_server = EchoServer(('127.0.0.1', 0), EchoHandler)
+    threading.Thread(target=echo_server.serve_forever).start()
+    try:
+        db_uri = 'http://127.0.0.1:%i/db/data/' % echo_server.server_address[1]
+        pool = NeoHttpPool(db_uri, max_size=2)
+        for i in range(3):
+            assert pool.request('POST', db_uri + 'cypher', {'i': i}) == {'i': i}
+        stats = pool.get_stats()
+        assert stats['num_requests'] == 3 and stats['num_conns_opened'] == 1 and stats['num_idle'] == 1 and stats['num_in_use'] == 0
+        
+        with AssertExceptionThrown(NeoRequestError):
+            pool.request('POST', db_uri + 'cypher', {'fail': True})
+        assert pool.get_stats()['num_in_use'] == 0
+        
+        # streamed responses come back in read_size pieces, and the connection goes back to the pool once they're all read
+        resp_chunks = list(pool.request_stream('POST', db_uri + 'cypher', {'data': range(20)}, read_size=16))
+        assert len(resp_chunks) > 1 and json.loads(''.join(resp_chunks)) == {'data': range(20)}
+        assert pool.get_stats()['num_in_use'] == 0 and pool.get_stats()['num_idle'] == 1
+        # ...but a stream that's abandoned partway through takes its connection with it
+        resp_chunk_iter = pool.request_stream('POST', db_uri + 'cypher', {'data': range(20)}, read_size=16)
+        resp_chunk_iter.next()
+        resp_chunk_iter.close()
+        assert pool.get_stats()['num_in_use'] == 0 and pool.get_stats()['num_idle'] == 0
+        with AssertExceptionThrown(NeoRequestError):
+            list(pool.request_stream('POST', db_uri + 'cypher', {'fail': True}))
+        pool.close_idle_conns()
+    finally:
+        echo_server.shutdown()
+    
+    # only failures that mean neo never got the request are worth resending on a fresh connection
+    assert NeoHttpPool._is_safe_to_resend(httplib.BadStatusLine("''"))
+    assert NeoHttpPool._is_safe_to_resend(socket.error(errno.ECONNRESET, 'reset'))
+    assert not NeoHttpPool._is_safe_to_resend(socket.timeout('timed out'))
+    assert not NeoHttpPool._is_safe_to_resend(httplib.BadStatusLine('garbage'))
+    assert not NeoHttpPool._is_safe_to_resend(socket.error(errno.ECONNREFUSED, 'refused'))
+
+def NeoIndexRegistry_test():
+    neodb = Mock()
+    neodb.__uri__ = 'http://idx-registry-test/db/data/'
+    fulltext_config = {'type': 'fulltext'}
+    stats_before = NeoIndexRegistry.get_stats()
+    
+    idx = NeoIndexRegistry.get_index(neodb, NeoIndexRegistry.NODE_INDEX, 'TEST_IDX', fulltext_config)
+    assert NeoIndexRegistry.get_index(neodb, NeoIndexRegistry.NODE_INDEX, 'TEST_IDX') is idx
+    assert neodb.get_or_create_index.call_count == 1
+    stats_after = NeoIndexRegistry.get_stats()
+    assert stats_after['num_misses'] == stats_before['num_misses'] + 1
+    assert stats_after['num_hits'] == stats_before['num_hits'] + 1
+    
+    # a forgotten index gets re-resolved with the config it was originally asked for
+    NeoIndexRegistry.forget_index(neodb, NeoIndexRegistry.NODE_INDEX, 'TEST_IDX')
+    NeoIndexRegistry.get_index(neodb, NeoIndexRegistry.NODE_INDEX, 'TEST_IDX')
+    assert neodb.get_or_create_index.call_count == 2
+    assert neodb.get_or_create_index.call_args[1]['config'] == fulltext_config
+
+def NodespaceContentNode_test():
+    for node_class in [RootCategoryNode, CategoryNode, WriteupNode, CommentNode]:
+        assert TripelNode.get_node_class_for_type(node_class.NODE_TYPE) is node_class
+        assert node_class._get_fields_to_index()[NodespaceContentNode.NS_CONTENT_INDEX_NAME] == [NodespaceContentNode.NODESPACE_ID_FIELD_NAME]
+    assert TripelNode.UNIQUE_NODE_ID_INDEX_NAME in CategoryNode._get_fields_to_index()
+    assert TripelNode.get_node_class_for_type(NodespaceNode.NODE_TYPE) is NodespaceNode
+    assert TripelNode.get_node_class_for_type('not a node type') is None
+    
+    # a node that has its nodespace id shouldn't need to ask neo for it
+    neodb = Mock()
+    cat_node = CategoryNode._init_from_properties({TripelNode.UNIQUE_NODE_ID_FIELD_NAME: 1, TripelNode.NODE_TYPE_FIELD_NAME: CategoryNode.NODE_TYPE,
+                                                    CategoryNode.CAT_NAME_FIELD_NAME: 'c', CategoryNode.CAT_DESC_FIELD_NAME: 'd',
+                                                    NodespaceContentNode.NODESPACE_ID_FIELD_NAME: 12})
+    assert cat_node.get_parent_nodespace_id(neodb) == 12
+    assert CommentNode._add_nodespace_id(neodb, {}, 1, 12) == {NodespaceContentNode.NODESPACE_ID_FIELD_NAME: 12}
+    assert neodb.method_calls == []
+    
+    # a missing node is None with or without field_names, and replying to a missing comment says so
+    orig_get_single_indexed_node, orig_get_nodes = NeoUtil.__dict__['get_single_indexed_node'], TripelNode.__dict__['get_existing_nodes_by_unique_ids']
+    NeoUtil.get_single_indexed_node = staticmethod(lambda neodb, index_name, key, value: None)
+    TripelNode.get_existing_nodes_by_unique_ids = classmethod(lambda cls, neodb, unique_node_ids, field_names=None: [None] * len(unique_node_ids))
+    try:
+        assert CommentNode.get_existing_node_by_unique_id(neodb, 404) is None
+        assert CommentNode.get_existing_node_by_unique_id(neodb, 404, [CommentNode.COMMENT_SUBJECT_FIELD_NAME]) is None
+        with AssertExceptionThrown(ValueError):
+            CommentNode.reply_to_comment((None, neodb), 404, 1, 'subj', 'body', {})
+        with AssertExceptionThrown(ValueError):
+            CommentNode.get_nodespace_id_for_unique_id(neodb, 404)
+    finally:
+        NeoUtil.get_single_indexed_node = orig_get_single_indexed_node
+        TripelNode.get_existing_nodes_by_unique_ids = orig_get_nodes
+
+def NotificationNode_test():
+    # the notification subclasses pick up NotificationNode's fields without recursing back into its overrides
+    for node_class in [NotificationNode, RecommendationNode, AlertNode]:
+        assert node_class._get_fields_to_index()[NotificationNode.NOTIFICATION_INDEX_NAME] == [NotificationNode.USER_ID_FIELD_NAME]
+        assert TripelNode.UNIQUE_NODE_ID_INDEX_NAME in node_class._get_fields_to_index()
+        required_fields = node_class._get_required_fields()
+        assert NotificationNode.TARGET_NODE_ID_FIELD_NAME in required_fields and TripelNode.UNIQUE_NODE_ID_FIELD_NAME in required_fields
+
+def CategoryTreeCache_test():
+    # root 1 <- 2 <- 3, and root 1 <- 4.  rows are (root cat id, cat id, cat name, parent edge id, parent cat id)
+    tree_rows = [(1, 3, 'c3', 103, 2), (1, 1, None, None, None), (1, 2, 'c2', 102, 1), (1, 4, 'c4', 104, 1)]
+    neodb = Mock()
+    cache = CategoryTreeCache(max_nodespaces=2)
+    cache._load_tree = lambda neodb, nodespace_id: CategoryTreeCache._CategoryTree.from_rows(tree_rows)
+    
+    assert cache.get_ancestor_ids(neodb, 10, 3) == [2, 1]
+    assert sorted(cache.get_descendant_ids(neodb, 10, 1)) == [2, 3, 4]
+    graph_dict = cache.get_subtree_graph_dict(neodb, 10)
+    assert sorted(graph_dict['nodes'].keys()) == [2, 3, 4]
+    assert graph_dict['edges'].keys() == [103] and graph_dict['edges'][103]['source'] == 3 and graph_dict['edges'][103]['target'] == 2
+    assert sorted(cache.get_subtree_graph_dict(neodb, 10, 2)['nodes'].keys()) == [2, 3]
+    assert cache.get_stats()['num_misses'] == 1 and cache.get_stats()['num_hits'] == 3
+    
+    # new categories get added in place
+    cache.note_category_created(10, 5, 'c5', '3', 105)
+    assert cache.get_ancestor_ids(neodb, 10, 5) == [3, 2, 1]
+    assert cache.get_subtree_graph_dict(neodb, 10)['nodes'][5]['node_properties'][CategoryNode.CAT_NAME_FIELD_NAME] == 'c5'
+    
+    # least recently used nodespace gets dropped first
+    cache.get_descendant_ids(neodb, 11, 1)
+    cache.get_descendant_ids(neodb, 10, 1)
+    cache.get_descendant_ids(neodb, 12, 1)
+    assert cache.get_stats()['num_evictions'] == 1
+    assert cache.get_descendant_ids(neodb, 10, 3) == [5]
+    
+    # a tree that's outlived its ttl gets reloaded, which picks up categories other processes created
+    tree_rows.append((1, 6, 'c6', 106, 4))
+    cache.ttl_secs = 0
+    assert cache.get_descendant_ids(neodb, 10, 4) == [6]
+    assert cache.get_stats()['num_expirations'] == 1
+    
+    # writeups filed under a category that isn't in the cached tree get left out, edges and all
+    cache.ttl_secs = 60
+    orig_cache, orig_iter_cypher_rows = CategoryTreeCache._cache, NeoUtil.__dict__['iter_cypher_rows']
+    CategoryTreeCache._cache = cache
+    NeoUtil.iter_cypher_rows = staticmethod(lambda neodb, query, query_params: iter([(3, 203, 23, 'w23'), (7, 207, 27, 'w27')]))
+    try:
+        graph_dict = AdhocNeoQueries.get_nodespace_categories_and_writeups(neodb, 10)
+        assert 23 in graph_dict['nodes'] and 203 in graph_dict['edges']
+        assert 27 not in graph_dict['nodes'] and 207 not in graph_dict['edges']
+    finally:
+        CategoryTreeCache._cache = orig_cache
+        NeoUtil.iter_cypher_rows = orig_iter_cypher_rows
+
+def get_category_subgraph_test():
+    # root 1 <- 2 <- 3, 1 <- 4, 2 <- 6.  writeups 21, 22, 23 are filed under 2.
+    tree_rows = [(1, 1, None, None, None), (1, 2, 'c2', 102, 1), (1, 3, 'c3', 103, 2), (1, 4, 'c4', 104, 1), (1, 6, 'c6', 106, 2)]
+    wrup_rows = {2: [[201, 21, 'w21'], [202, 22, 'w22'], [203, 23, 'w23']]}
+    cache = CategoryTreeCache()
+    cache._load_tree = lambda neodb, nodespace_id: CategoryTreeCache._CategoryTree.from_rows(tree_rows)
+    orig_cache, orig_get_writeup_pages = CategoryTreeCache._cache, AdhocNeoQueries.__dict__['_get_writeup_pages']
+    CategoryTreeCache._cache = cache
+    AdhocNeoQueries._get_writeup_pages = staticmethod(lambda neodb, page_specs: 
+                                                    dict((cat_id, wrup_rows.get(cat_id, [])[skip:skip+limit]) for cat_id, skip, limit in page_specs))
+    try:
+        # 2's subcategories fill its page, so its writeups are only checked for
+        subgraph = AdhocNeoQueries.get_category_subgraph(Mock(), 10, None, 2, 2)
+        assert sorted(subgraph['nodes'].keys()) == [2, 3, 4, 6]
+        assert sorted(subgraph['edges'].keys()) == [103, 106]
+        assert subgraph['has_more_children'] == {2: 2}
+        
+        # the next page of 2's children is writeups
+        subgraph = AdhocNeoQueries.get_category_subgraph(Mock(), 10, 2, 1, 2, 2)
+        assert sorted(subgraph['nodes'].keys()) == [2, 21, 22]
+        assert sorted(subgraph['edges'].keys()) == [201, 202] and subgraph['edges'][201]['target'] == 2
+        assert subgraph['has_more_children'] == {2: 4}
+        subgraph = AdhocNeoQueries.get_category_subgraph(Mock(), 10, 2, 1, 2, 4)
+        assert sorted(subgraph['nodes'].keys()) == [2, 23] and subgraph['has_more_children'] == {}
+        
+        with AssertExceptionThrown(KeyError):
+            AdhocNeoQueries.get_category_subgraph(Mock(), 10, 99, 1, 2)
+    finally:
+        CategoryTreeCache._cache = orig_cache
+        AdhocNeoQueries._get_writeup_pages = orig_get_writeup_pages
+
+def get_existing_nodes_by_unique_ids_test():
+    def make_rest_node(unq_id, node_type, title=None):
+        properties = {TripelNode.UNIQUE_NODE_ID_FIELD_NAME: unq_id, TripelNode.NODE_TYPE_FIELD_NAME: node_type, 
+                        NodespaceContentNode.NODESPACE_ID_FIELD_NAME: 10}
+        if title is not None:
+            properties.update({WriteupNode.WRITEUP_TITLE_FIELD_NAME: title, WriteupNode.WRITEUP_BODY_FIELD_NAME: 'a long body'})
+        else:
+            properties.update({CategoryNode.CAT_NAME_FIELD_NAME: 'c%i' % unq_id, CategoryNode.CAT_DESC_FIELD_NAME: ''})
+        return {'self': 'http://localhost/node/%i' % unq_id, 'data': properties}
+    rest_nodes = dict((rest_node['data'][TripelNode.UNIQUE_NODE_ID_FIELD_NAME], rest_node) 
+                        for rest_node in [make_rest_node(5, WriteupNode.NODE_TYPE, 'w5'), make_rest_node(6, CategoryNode.NODE_TYPE), 
+                                            make_rest_node(7, WriteupNode.NODE_TYPE, 'w7')])
+    
+    cypher_calls = []
+    def get_rows(query, query_params):
+        cypher_calls.append(query_params['lucene_query'])
+        unq_ids = [int(unq_id) for unq_id in query_params['lucene_query'].split('(')[1].rstrip(')').split()]
+        return_clause = query.split('RETURN ')[1].rstrip(';')
+        if return_clause == 'node':
+            return [[rest_nodes[unq_id]] for unq_id in unq_ids if unq_id in rest_nodes]
+        fields = [field[len('node.'):].rstrip('?') for field in return_clause.split(', ')]
+        return [[rest_nodes[unq_id]['data'].get(field) for field in fields] for unq_id in unq_ids if unq_id in rest_nodes]
+    
+    orig_execute_cypher, orig_run_rest_batch = NeoUtil.__dict__['execute_cypher'], NeoUtil.__dict__['run_rest_batch']
+    NeoUtil.execute_cypher = classmethod(lambda cls, neodb, query, query_params: map(lambda row: map(NeoRestElement.wrap_if_element, row), get_rows(query, query_params)))
+    NeoUtil.run_rest_batch = classmethod(lambda cls, neodb, jobs: [{'id': job['id'], 'body': {'data': get_rows(job['body']['query'], job['body']['params'])}} for job in jobs])
+    try:
+        nodes = TripelNode.get_existing_nodes_by_unique_ids(Mock(), [7, '5', 99, 'x', 6, 7])
+        assert cypher_calls == ['%s:(5 6 7 99)' % TripelNode.UNIQUE_NODE_ID_FIELD_NAME]
+        assert [type(node) for node in nodes] == [WriteupNode, WriteupNode, type(None), type(None), CategoryNode, WriteupNode]
+        assert nodes[0]._properties[WriteupNode.WRITEUP_BODY_FIELD_NAME] == 'a long body'
+        
+        # only writeups when asked through WriteupNode, and a projection leaves the body behind
+        del cypher_calls[:]
+        nodes = WriteupNode.get_existing_nodes_by_unique_ids(Mock(), [5, 6, 7], [WriteupNode.WRITEUP_TITLE_FIELD_NAME], chunk_size=2)
+        assert len(cypher_calls) == 2
+        assert nodes[1] is None
+        assert [node._properties for node in (nodes[0], nodes[2])] == \
+                [{TripelNode.UNIQUE_NODE_ID_FIELD_NAME: unq_id, TripelNode.NODE_TYPE_FIELD_NAME: WriteupNode.NODE_TYPE, WriteupNode.WRITEUP_TITLE_FIELD_NAME: 'w%i' % unq_id} 
+                    for unq_id in (5, 7)]
+        
+        assert TripelNode.get_existing_nodes_by_unique_ids(Mock(), ['x', None]) == [None, None]
+    finally:
+        NeoUtil.execute_cypher = orig_execute_cypher
+        NeoUtil.run_rest_batch = orig_run_rest_batch
+
+def TripelNode_partial_load_test():
+    assert WriteupNode.get_eager_field_names() == [TripelNode.UNIQUE_NODE_ID_FIELD_NAME, TripelNode.NODE_TYPE_FIELD_NAME, WriteupNode.WRITEUP_TITLE_FIELD_NAME, 
+                                                    NodespaceContentNode.NODESPACE_ID_FIELD_NAME]
+    
+    # the body isn't required if it wasn't loaded, but the title still is
+    loaded_fields = [TripelNode.UNIQUE_NODE_ID_FIELD_NAME, TripelNode.NODE_TYPE_FIELD_NAME, WriteupNode.WRITEUP_TITLE_FIELD_NAME]
+    wrup_props = {TripelNode.UNIQUE_NODE_ID_FIELD_NAME: 5, TripelNode.NODE_TYPE_FIELD_NAME: WriteupNode.NODE_TYPE, WriteupNode.WRITEUP_TITLE_FIELD_NAME: 'w5'}
+    wrup = WriteupNode._init_from_properties(wrup_props, loaded_fields)
+    with AssertExceptionThrown(WriteupNode.MissingRequiredFieldError):
+        WriteupNode._init_from_properties({TripelNode.UNIQUE_NODE_ID_FIELD_NAME: 5, TripelNode.NODE_TYPE_FIELD_NAME: WriteupNode.NODE_TYPE}, loaded_fields)
+    with AssertExceptionThrown(WriteupNode.MissingRequiredFieldError):
+        WriteupNode._init_from_properties(wrup_props)
+    
+    cypher_calls = []
+    def execute_cypher(cls, neodb, query, query_params):
+        cypher_calls.append((query, query_params))
+        return [['a long body', None]]
+    orig_execute_cypher = NeoUtil.__dict__['execute_cypher']
+    NeoUtil.execute_cypher = classmethod(execute_cypher)
+    try:
+        # unloaded fields get fetched once, loaded ones (even if they're unset) never do
+        assert wrup.get_field(Mock(), WriteupNode.WRITEUP_TITLE_FIELD_NAME) == 'w5'
+        assert not wrup.is_field_loaded(WriteupNode.WRITEUP_BODY_FIELD_NAME)
+        assert wrup.get_field(Mock(), WriteupNode.WRITEUP_BODY_FIELD_NAME) == 'a long body'
+        assert wrup.get_field(Mock(), WriteupNode.WRITEUP_BODY_FIELD_NAME) == 'a long body'
+        assert len(cypher_calls) == 1 and cypher_calls[0][1] == {'lucene_query': '%s:5' % TripelNode.UNIQUE_NODE_ID_FIELD_NAME}
+        
+        neo_node = NeoRestElement({'self': 'http://localhost/node/5', 'data': dict(wrup_props, **{WriteupNode.WRITEUP_BODY_FIELD_NAME: 'a long body'})})
+        wrup = WriteupNode._init_from_neo_node(neo_node, [WriteupNode.WRITEUP_TITLE_FIELD_NAME])
+        assert WriteupNode.WRITEUP_BODY_FIELD_NAME not in wrup._properties
+        assert WriteupNode._init_from_neo_node(neo_node).get_field(Mock(), WriteupNode.WRITEUP_BODY_FIELD_NAME) == 'a long body'
+        assert len(cypher_calls) == 1
+    finally:
+        NeoUtil.execute_cypher = orig_execute_cypher
+
+def ContentSearch_test():
+    assert ContentSearch.get_search_terms(u'Foo, bar-baz foo!') == [u'foo', u'bar', u'baz']
+    assert ContentSearch.get_search_terms(' *:) ') == []
+    lucene_query = ContentSearch.build_lucene_query([3, 5], WriteupNode.NODE_TYPE, ['foo', 'bar'])
+    assert lucene_query == '+%(ns)s:(3 5) +(%(title)s:foo %(body)s:foo) +(%(title)s:bar %(body)s:bar)' % \
+            {'ns': NodespaceContentNode.NODESPACE_ID_FIELD_NAME, 'title': WriteupNode.WRITEUP_TITLE_FIELD_NAME, 'body': WriteupNode.WRITEUP_BODY_FIELD_NAME}
+    
+    search_cache = ContentSearch(max_entries=2, ttl_secs=60)
+    search_calls = []
+    def run_search(neodb, nodespace_ids, node_type, search_terms, offset, page_size):
+        search_calls.append((nodespace_ids, search_terms, offset))
+        return {'results': [], 'next_cursor': str(offset + page_size)}
+    search_cache._run_search = run_search
+    
+    assert search_cache.search(Mock(), [3, 5], 'Foo', cursor='20')['next_cursor'] == str(20 + params.SEARCH_PAGE_SIZE)
+    search_cache.search(Mock(), [5, 3], 'foo', cursor='20')
+    assert len(search_calls) == 1 and search_cache.get_stats()['num_hits'] == 1
+    # content created in one of the nodespaces makes the cached page stale
+    search_cache.note_nodespace_changed(5)
+    search_cache.search(Mock(), [3, 5], 'foo', cursor='20')
+    assert len(search_calls) == 2
+    # nothing to search for, or nowhere to search, doesn't go to neo
+    assert search_cache.search(Mock(), [3], '  ') == {'results': [], 'next_cursor': None}
+    assert search_cache.search(Mock(), [], 'foo') == {'results': [], 'next_cursor': None}
+    assert len(search_calls) == 2
+    with AssertExceptionThrown(ValueError):
+        search_cache.search(Mock(), [3], 'foo', cursor='-1')
+    
+    search_cache.search(Mock(), [3], 'bar')
+    search_cache.search(Mock(), [3], 'baz')
+    assert search_cache.get_stats()['num_entries'] == 2 and search_cache.get_stats()['num_evictions'] == 1
+
+def get_text_snippet_test():
+    text = ' '.join(['word%i' % i for i in range(100)])
+    assert get_text_snippet(text, ['nomatch'], 30) == 'word0 word1 word2 word3 word4...'
+    snippet = get_text_snippet(text, ['word50'], 30)
+    assert snippet.startswith('...') and snippet.endswith('...') and 'word50' in snippet and len(snippet) <= 36
+    assert get_text_snippet('short text', ['text'], 30) == 'short text'
+    assert get_text_snippet(None, ['text'], 30) == ''
+
+def CommentNode_thread_path_test():
+    root_path = CommentNode.build_thread_path(None, 26)
+    reply_path = CommentNode.build_thread_path(root_path, 300)
+    reply_reply_path = CommentNode.build_thread_path(reply_path, 0x2000)
+    later_reply_path = CommentNode.build_thread_path(root_path, 0x1000)
+    assert CommentNode.parse_thread_path(reply_reply_path) == [26, 300, 0x2000]
+    # sorting by path is tree order:  each comment comes right after its parent, and before its parent's later replies
+    assert sorted([later_reply_path, reply_reply_path, root_path, reply_path]) == [root_path, reply_path, reply_reply_path, later_reply_path]
+    
+    properties = {}
+    CommentNode._add_thread_fields(properties, reply_reply_path)
+    assert properties == {CommentNode.THREAD_PATH_FIELD_NAME: reply_reply_path, CommentNode.THREAD_ROOT_ID_FIELD_NAME: 26, CommentNode.THREAD_DEPTH_FIELD_NAME: 2}
+    properties.update({CommentNode.UNIQUE_NODE_ID_FIELD_NAME: 0x2000, CommentNode.NODE_TYPE_FIELD_NAME: CommentNode.NODE_TYPE, 
+                        CommentNode.COMMENT_SUBJECT_FIELD_NAME: 'subj', CommentNode.COMMENT_BODY_FIELD_NAME: 'body'})
+    assert CommentNode._init_from_properties(properties).get_thread_root_id(Mock()) == 26
+
+def SavedSearchEvaluator_test():
+    def make_saved_search(saved_search_id, user_id, nodespace_id, search_query):
+        saved_search = SavedSearch()
+        saved_search.saved_search_id, saved_search.user_id, saved_search.nodespace_id = saved_search_id, user_id, nodespace_id
+        saved_search.search_query, saved_search.is_enabled = search_query, True
+        return saved_search
+    
+    search_index = SavedSearchIndex()
+    assert search_index.add(make_saved_search(1, 1, None, 'Neo graphs'))
+    assert search_index.add(make_saved_search(2, 2, 20, 'graphs'))
+    assert search_index.add(make_saved_search(3, 3, None, 'graphs'))
+    assert not search_index.add(make_saved_search(4, 1, None, '!!'))
+    assert search_index.num_searches == 3
+    assert sorted([ss.saved_search_id for ss in search_index.get_matches(set(['neo', 'graphs', 'etc']))]) == [1, 2, 3]
+    assert [ss.saved_search_id for ss in search_index.get_matches(set(['neo']))] == []
+    
+    def make_writeup_info(unq_id, nodespace_id, creator_id, title, body):
+        wrup = WriteupNode._init_from_properties({WriteupNode.UNIQUE_NODE_ID_FIELD_NAME: unq_id, WriteupNode.NODE_TYPE_FIELD_NAME: WriteupNode.NODE_TYPE,
+                                                    WriteupNode.NODESPACE_ID_FIELD_NAME: nodespace_id, 
+                                                    WriteupNode.WRITEUP_TITLE_FIELD_NAME: title, WriteupNode.WRITEUP_BODY_FIELD_NAME: body})
+        return {'creation_date': '2013-01-01 00:00:00+00:00', 'edge_id': unq_id, 'creator_id': creator_id, 'node': wrup}
+    
+    evaluator = SavedSearchEvaluator((Mock(), Mock()))
+    # user 3 can't see anything
+    evaluator._can_view = lambda user_id, nodespace_id: user_id != 3
+    new_content = [make_writeup_info(100, 20, 9, 'About graphs', 'and neo'), make_writeup_info(101, 30, 9, 'graphs', 'only'),
+                    make_writeup_info(102, 20, 1, 'neo graphs', 'by user 1'), make_writeup_info(103, 20, 9, 'nothing', 'relevant')]
+    notifications = [(saved_search.saved_search_id, target_id) for saved_search, target_id in evaluator.get_notifications(search_index, new_content)]
+    assert sorted(notifications) == [(1, 100), (2, 100), (2, 102)]
+
+def CompactIdSet_test():
+    id_set = CompactIdSet()
+    # enough ids in one block to push it over to a bitmap, plus some in other blocks, and some that aren't ids
+    vals = range(0, 3 * CompactIdSet.ARRAY_MAX_LEN, 2) + [1 << 20, (1 << 40) + 5, -1, 'n7', None]
+    for val in vals:
+        assert id_set.add(val)
+    for val in vals:
+        assert not id_set.add(val)
+        assert val in id_set
+    assert len(id_set) == len(vals)
+    assert 1 not in id_set and (1 << 20) + 1 not in id_set and 'n8' not in id_set
+
+def iter_json_array_items_test():
+    data = [[1, 'a'], [23456, {'b': [1, 2]}], [None, 'c, d]'], [1.5, -0.25, 12345.678, 1e-07, 2.5e+20, True]]
+    doc = json.dumps({'z': 1.5, 'columns': ['data', 'x'], 'data': data, 'stats': 9})
+    # split into every chunk size from 1 char on up, so that every item gets cut off somewhere (including numbers right 
+    # after a '.' or an 'e')
+    for chunk_size in range(1, len(doc) + 1):
+        chunks = [doc[i:i+chunk_size] for i in range(0, len(doc), chunk_size)]
+        assert list(iter_json_array_items(chunks, 'data')) == data
+    assert list(iter_json_array_items(['{"data": []}'], 'data')) == []
+    with AssertExceptionThrown(ValueError):
+        list(iter_json_array_items(['{"data": [[1], [2'], 'data'))
+
+def iter_adhoc_graph_elements_test():
+    get_node_and_edge_dicts = lambda row: ([{'node_id': row[0]}, {'node_id': row[1]}], [{'edge_id': row[2]}])
+    elements = list(iter_adhoc_graph_elements([(1, 2, 10), (1, 3, 11), (1, 2, 10)], get_node_and_edge_dicts))
+    assert [(element_type, element.get('node_id', element.get('edge_id'))) for element_type, element in elements] == \
+            [('node', 1), ('node', 2), ('edge', 10), ('node', 3), ('edge', 11)]
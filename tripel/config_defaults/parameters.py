@@ -18,10 +18,93 @@ PG_HOST_ADDR_TEST = PG_HOST_ADDR
 PG_DBNAME_TEST = 'tripel_test'
 PG_USERNAME_TEST = 'tripel_test'
 
+# pooled postgres connections (False leaves it to web.py, which opens them through DBUtils if that's installed)
+PG_POOL_ENABLED = True
+PG_POOL_MIN_SIZE = 2
+PG_POOL_MAX_SIZE = 10
+PG_POOL_WAIT_TIMEOUT_SECS = 10
+# a connection that's been idle longer than this gets a 'select 1' before it's handed out again
+PG_POOL_HEALTH_CHECK_IDLE_SECS = 30
+# idle connections past MIN_SIZE get closed after this long, and any connection gets replaced after MAX_CONN_AGE_SECS
+PG_POOL_MAX_IDLE_SECS = 600
+PG_POOL_MAX_CONN_AGE_SECS = 3600
+# run the hot path queries (PgStatementRegistry) as server-side prepared statements on pooled connections
+PG_PREPARED_STATEMENTS_ENABLED = True
+# rows per multi-row insert statement in PgPersistent bulk inserts
+PG_BULK_INSERT_CHUNK_SIZE = 1000
+# read replicas for the web app:  a dict of connection settings for each, which override the primary's (e.g.
+# {'hostaddr': '10.0.0.2'}, or {'port': 5433} for a second local postgres standing in as a replica).  empty means
+# everything goes to the primary.
+PG_REPLICAS = []
+# after a request writes, that client's reads stick to the primary for this long (tracked with a cookie)
+PG_REPLICA_STICKY_SECS = 10
+PG_REPLICA_STICKY_COOKIE_NAME = 'trpl_primary_until'
+# a replica that's further behind than this gets no reads until it catches up.  lag gets rechecked every LAG_CHECK_INTERVAL_SECS.
+PG_REPLICA_MAX_LAG_SECS = 5
+PG_REPLICA_LAG_CHECK_INTERVAL_SECS = 5
+
+# how many neo node/edge ids to grab from postgres at a time (1 means a nextval call per id, like the old behavior)
+UNIQUE_ID_BLOCK_SIZE = 50
+
 NEO_DB_URI = 'http://localhost:7474/db/data/'
 NEO_DB_URI_TEST = 'http://localhost:6474/test_db/data/'
 
+# pooled keep-alive connections for neo REST calls (False sends everything through py2neo instead)
+NEO_HTTP_POOL_ENABLED = True
+NEO_HTTP_POOL_MAX_SIZE = 10
+NEO_HTTP_POOL_WAIT_TIMEOUT_SECS = 10
+NEO_HTTP_CONNECT_TIMEOUT_SECS = 5
+NEO_HTTP_READ_TIMEOUT_SECS = 60
+# bytes per socket read when streaming a neo response (e.g. NeoUtil.iter_cypher_rows)
+NEO_HTTP_STREAM_READ_SIZE = 8192
+# unique ids per index query in TripelNode.get_existing_nodes_by_unique_ids (lucene allows 1024 clauses per query)
+NEO_MULTI_GET_CHUNK_SIZE = 500
+
 GREMLIN_LIB_FILES = ['groovy_scripts/GremlinUtils.groovy']
+# install the gremlin lib once per neo server and only send statement blocks, instead of in-lining the lib every time
+GREMLIN_USE_LIB_REGISTRY = True
+# what executes stmt_defs:  'gremlin' (GremlinPlugin scripts) or 'rest_batch' (neo's REST batch endpoint, no plugin needed)
+NEO_STMT_BACKEND = 'gremlin'
+# merge concurrent neo writes into shared transactions, waiting at most MAX_WAIT_MS or until MAX_STMTS are pending
+NEO_WRITE_COALESCING = False
+NEO_WRITE_COALESCE_MAX_WAIT_MS = 5
+NEO_WRITE_COALESCE_MAX_STMTS = 200
+
+# neo_bulk_loader defaults:  postgres rows per neo transaction, and number of worker threads
+NEO_BULK_LOAD_CHUNK_SIZE = 200
+NEO_BULK_LOAD_NUM_WORKERS = 4
+# streamed graph json responses get sent in chunks of about this many bytes
+GRAPH_JSON_CHUNK_SIZE = 8192
+# how many nodespaces' category trees to keep in memory (least recently used get dropped first)
+CATEGORY_TREE_CACHE_MAX_NODESPACES = 500
+# ...and how long before a cached tree gets reloaded, so categories created by other processes show up
+CATEGORY_TREE_CACHE_TTL_SECS = 30
+# nodespace_subgraph:  levels and children per category when the client doesn't say, and the most it can ask for
+GRAPH_LOD_DEFAULT_MAX_DEPTH = 2
+GRAPH_LOD_DEFAULT_CHILDREN_PAGE_SIZE = 25
+GRAPH_LOD_MAX_DEPTH = 6
+GRAPH_LOD_MAX_CHILDREN_PAGE_SIZE = 200
+# nodespace_search:  results per page (default and most the client can ask for), how many words of the query get used, 
+# how much of each result's body gets pulled from neo and how long a snippet gets made from it, and how many pages of 
+# results get cached for how long
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_MAX_TERMS = 8
+SEARCH_BODY_PREFIX_LEN = 2000
+SEARCH_SNIPPET_LEN = 200
+SEARCH_CACHE_MAX_ENTRIES = 1000
+SEARCH_CACHE_TTL_SECS = 60
+# comment_thread_view:  comments per page (default and most the client can ask for)
+COMMENT_THREAD_PAGE_SIZE = 50
+COMMENT_THREAD_MAX_PAGE_SIZE = 500
+# saved_search_evaluator:  new content nodes to match per checkpoint, and notifications per neo transaction
+SAVED_SEARCH_CONTENT_CHUNK_SIZE = 1000
+SAVED_SEARCH_NOTIFICATION_BATCH_SIZE = 200
+# user and nodespace list pages (json):  rows per page (default and most the client can ask for)
+LIST_PAGE_SIZE = 100
+LIST_MAX_PAGE_SIZE = 1000
+# neo_maintenance:  content nodes per neo transaction when backfilling their nodespace ids
+NEO_NS_ID_BACKFILL_BATCH_SIZE = 500
 
 SMTP_SERVER = 'mail.my-server.com'
 SMTP_PORT = 587
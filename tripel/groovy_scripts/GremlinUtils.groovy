@@ -86,9 +86,23 @@ class GremlinUtils {
 		return e
 	}
 	
-	static Neo4jEdge createAndIndexEdge(Neo4jGraph g, Map outVLookupInfo, Map inVLookupInfo, String edgeType, Map edgeProperties, Map fieldsToIndex) {
-		Neo4jVertex outV = getUniquelyIndexedVertex(g, outVLookupInfo['lookupIndexName'], outVLookupInfo['lookupKey'], (String) outVLookupInfo['lookupValue'])
-		Neo4jVertex inV = getUniquelyIndexedVertex(g, inVLookupInfo['lookupIndexName'], inVLookupInfo['lookupKey'], (String) inVLookupInfo['lookupValue'])
+	//the endpoints of an edge can either be lookup info for an existing vertex, or the result of an earlier statement
+	//in the same script (i.e. the node returned by createAndIndexNode), which saves an index lookup.
+	static Neo4jVertex resolveVertex(Neo4jGraph g, Map lookupInfo) {
+		return getUniquelyIndexedVertex(g, lookupInfo['lookupIndexName'], lookupInfo['lookupKey'], (String) lookupInfo['lookupValue'])
+	}
+	
+	static Neo4jVertex resolveVertex(Neo4jGraph g, Node rawNode) {
+		return new Neo4jVertex(rawNode, g)
+	}
+	
+	static Neo4jVertex resolveVertex(Neo4jGraph g, Neo4jVertex v) {
+		return v
+	}
+	
+	static Neo4jEdge createAndIndexEdge(Neo4jGraph g, def outVInfo, def inVInfo, String edgeType, Map edgeProperties, Map fieldsToIndex) {
+		Neo4jVertex outV = resolveVertex(g, outVInfo)
+		Neo4jVertex inV = resolveVertex(g, inVInfo)
 		Neo4jEdge e = createEdge(g, outV, inV, edgeType, edgeProperties)
 		addEdgeToIndexes(g, e, fieldsToIndex)
 		return e
@@ -0,0 +1,197 @@
+'''
+bulk version of tripel_core.init_neodb, for populating neo from an existing postgres db with lots of users and
+nodespaces.  streams rows out of postgres in PK ordered chunks, and creates the corresponding neo nodes with one
+transaction per chunk, spread across a few worker threads.  progress gets checkpointed to a file, and rows that
+already have neo nodes get skipped, so an interrupted load can just be re-run.
+
+run from the tripel directory (so that config paths resolve):
+  python neo_bulk_loader.py --checkpoint-file /tmp/neo_load.json
+'''
+import os
+import sys
+import json
+import time
+import Queue
+import logging
+import argparse
+import threading
+
+import tripel_core as tc
+import config.parameters as params
+import util
+
+logger = logging.getLogger(__name__)
+
+
+class NeoBulkLoader(object):
+    ENTITY_TYPE_USERS = 'users'
+    ENTITY_TYPE_NODESPACES = 'nodespaces'
+    ENTITY_TYPES = [ENTITY_TYPE_USERS, ENTITY_TYPE_NODESPACES]
+    
+    def __init__(self, pgdb, neo_db_uri, checkpoint_filename=None, chunk_size=params.NEO_BULK_LOAD_CHUNK_SIZE,
+                    num_workers=params.NEO_BULK_LOAD_NUM_WORKERS):
+        self.pgdb = pgdb
+        self.neo_db_uri = neo_db_uri
+        self.checkpoint_filename = checkpoint_filename
+        self.chunk_size = chunk_size
+        self.num_workers = num_workers
+        
+        self._lock = threading.Lock()
+        self._checkpoint = self._read_checkpoint()
+        self._failure_exc_info = None
+        self._stats = {}
+    
+    def _read_checkpoint(self):
+        if self.checkpoint_filename is None or not os.path.exists(self.checkpoint_filename):
+            return {}
+        with open(self.checkpoint_filename) as checkpoint_file:
+            return json.load(checkpoint_file)
+    
+    def _write_checkpoint(self):
+        # caller should hold self._lock.  write then rename, so a crash mid-write doesn't clobber the old checkpoint.
+        if self.checkpoint_filename is None:
+            return
+        tmp_filename = '%s.tmp' % self.checkpoint_filename
+        with open(tmp_filename, 'w') as checkpoint_file:
+            json.dump(self._checkpoint, checkpoint_file)
+        os.rename(tmp_filename, self.checkpoint_filename)
+    
+    @staticmethod
+    def _get_existing_ids(neodb, index_name, id_field_name, id_vals):
+        """returns the subset of id_vals that are already indexed under id_field_name in index_name, in one query."""
+        if not id_vals:
+            return set()
+        existing_ids_cql = 'START n=node:%(idx_name)s({lucene_query}) RETURN n.`%(id_field_name)s`;' % \
+                            {'idx_name': index_name, 'id_field_name': id_field_name}
+        lucene_query = '%s:(%s)' % (id_field_name, ' '.join([str(id_val) for id_val in id_vals]))
+        query_results = tc.NeoUtil.execute_cypher(neodb, existing_ids_cql, {'lucene_query': lucene_query})
+        return set([int(row[0]) for row in query_results])
+    
+    def _get_user_stmt_defs(self, db_tuple, users):
+        pgdb, neodb = db_tuple
+        existing_ids = self._get_existing_ids(neodb, tc.UserNode.USER_INDEX_NAME, tc.UserNode.USER_ID_FIELD_NAME, [user.user_id for user in users])
+        stmt_defs = []
+        num_created = 0
+        for user in users:
+            if user.user_id not in existing_ids:
+                stmt_defs.extend(tc.UserNode.create_new_user_node(db_tuple, user.user_id, {}, False))
+                num_created += 1
+        return stmt_defs, num_created
+    
+    def _get_nodespace_stmt_defs(self, db_tuple, nodespaces):
+        pgdb, neodb = db_tuple
+        existing_ids = self._get_existing_ids(neodb, tc.NodespaceNode.NODESPACE_INDEX_NAME, tc.NodespaceNode.NODESPACE_ID_FIELD_NAME,
+                                                [nodespace.nodespace_id for nodespace in nodespaces])
+        stmt_defs = []
+        num_created = 0
+        for nodespace in nodespaces:
+            if nodespace.nodespace_id not in existing_ids:
+                # same as Nodespace._neo_create_nodespace, but batched with the rest of the chunk
+                stmt_defs.extend(tc.NodespaceNode.create_new_nodespace_node(db_tuple, nodespace.nodespace_id, {}, False))
+                stmt_defs.extend(tc.RootCategoryNode.create_new_root_category_node(db_tuple, nodespace.nodespace_id, {}, False))
+                num_created += 1
+        return stmt_defs, num_created
+    
+    def _get_entity_type_info(self, entity_type):
+        """returns (pg class, stmt_defs fn) for entity_type."""
+        if entity_type == self.ENTITY_TYPE_USERS:
+            return tc.User, self._get_user_stmt_defs
+        elif entity_type == self.ENTITY_TYPE_NODESPACES:
+            return tc.Nodespace, self._get_nodespace_stmt_defs
+        else:
+            raise ValueError('unknown entity_type: %s' % entity_type)
+    
+    def _mark_chunk_done(self, entity_type, chunk_info, chunk_seq_num, last_pk_val, num_rows, num_created):
+        with self._lock:
+            chunk_info['done_chunks'][chunk_seq_num] = last_pk_val
+            # chunks can finish out of order, so only advance the checkpoint past a contiguous run of finished chunks
+            while chunk_info['next_seq_num_to_checkpoint'] in chunk_info['done_chunks']:
+                self._checkpoint[entity_type] = chunk_info['done_chunks'].pop(chunk_info['next_seq_num_to_checkpoint'])
+                chunk_info['next_seq_num_to_checkpoint'] += 1
+            self._write_checkpoint()
+            
+            stats = self._stats[entity_type]
+            stats['num_rows'] += num_rows
+            stats['num_created'] += num_created
+            stats['num_skipped'] += num_rows - num_created
+            elapsed_secs = time.time() - stats['start_time']
+            logger.info('%s: %i rows (%i created, %i skipped), %.1f rows/sec' %
+                        (entity_type, stats['num_rows'], stats['num_created'], stats['num_skipped'], stats['num_rows'] / max(elapsed_secs, 0.001)))
+    
+    def _work(self, entity_type, chunk_queue, chunk_info):
+        pg_class, get_stmt_defs_fn = self._get_entity_type_info(entity_type)
+        # py2neo connections aren't shared between threads.  web.py already gives each thread its own pg connection.
+        db_tuple = (self.pgdb, tc.NeoUtil.get_db_conn(self.neo_db_uri))
+        while True:
+            chunk = chunk_queue.get()
+            if chunk is None:
+                return
+            chunk_seq_num, rows = chunk
+            if self._failure_exc_info is not None:
+                continue
+            
+            try:
+                stmt_defs, num_created = get_stmt_defs_fn(db_tuple, rows)
+                if stmt_defs:
+                    tc.NeoUtil.run_gremlin_statements(db_tuple[1], stmt_defs, should_coalesce=False)
+                self._mark_chunk_done(entity_type, chunk_info, chunk_seq_num, getattr(rows[-1], pg_class.PK_COL_NAME), len(rows), num_created)
+            except Exception:
+                logger.exception('%s: chunk %i failed' % (entity_type, chunk_seq_num))
+                with self._lock:
+                    if self._failure_exc_info is None:
+                        self._failure_exc_info = sys.exc_info()
+    
+    def _load_entity_type(self, entity_type):
+        pg_class, get_stmt_defs_fn = self._get_entity_type_info(entity_type)
+        chunk_info = {'done_chunks': {}, 'next_seq_num_to_checkpoint': 0}
+        self._stats[entity_type] = {'num_rows': 0, 'num_created': 0, 'num_skipped': 0, 'start_time': time.time()}
+        
+        # bounded, so that we only read ahead of the workers by a bit instead of pulling the whole table into memory
+        chunk_queue = Queue.Queue(maxsize=2*self.num_workers)
+        workers = [threading.Thread(target=self._work, args=(entity_type, chunk_queue, chunk_info)) for i in range(self.num_workers)]
+        for worker in workers:
+            worker.start()
+        
+        try:
+            after_pk_val = self._checkpoint.get(entity_type)
+            chunk_seq_num = 0
+            while self._failure_exc_info is None:
+                rows = pg_class.get_obj_chunk_after_pk(self.pgdb, after_pk_val, self.chunk_size)
+                if not rows:
+                    break
+                chunk_queue.put((chunk_seq_num, rows))
+                after_pk_val = getattr(rows[-1], pg_class.PK_COL_NAME)
+                chunk_seq_num += 1
+        finally:
+            for worker in workers:
+                chunk_queue.put(None)
+            for worker in workers:
+                worker.join()
+        
+        self._stats[entity_type]['elapsed_secs'] = time.time() - self._stats[entity_type]['start_time']
+        if self._failure_exc_info is not None:
+            raise self._failure_exc_info[0], self._failure_exc_info[1], self._failure_exc_info[2]
+    
+    def load(self, entity_types=None):
+        """loads each of entity_types (default: all of them, users first).  returns a dict of stats per entity type."""
+        tc.init_neo_indexes(tc.NeoUtil.get_db_conn(self.neo_db_uri))
+        for entity_type in (entity_types if entity_types is not None else self.ENTITY_TYPES):
+            self._load_entity_type(entity_type)
+        return self._stats
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='create neo nodes for all existing postgres users and nodespaces')
+    arg_parser.add_argument('--checkpoint-file', help='where to record progress, so that an interrupted load can pick up where it left off')
+    arg_parser.add_argument('--chunk-size', type=int, default=params.NEO_BULK_LOAD_CHUNK_SIZE, help='rows per neo transaction')
+    arg_parser.add_argument('--num-workers', type=int, default=params.NEO_BULK_LOAD_NUM_WORKERS)
+    arg_parser.add_argument('--entity-type', action='append', choices=NeoBulkLoader.ENTITY_TYPES, help='defaults to all of them')
+    args = arg_parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    pgdb = tc.PgUtil.get_db_conn_ssl(params.PG_DBNAME, params.PG_USERNAME, util.get_file_contents(params.PG_PASS_FILENAME))
+    loader = NeoBulkLoader(pgdb, params.NEO_DB_URI, args.checkpoint_file, args.chunk_size, args.num_workers)
+    for entity_type, stats in loader.load(args.entity_type).items():
+        print '%s: %i rows (%i created, %i skipped) in %.1f sec, %.1f rows/sec' % \
+                (entity_type, stats['num_rows'], stats['num_created'], stats['num_skipped'], stats['elapsed_secs'],
+                stats['num_rows'] / max(stats['elapsed_secs'], 0.001))
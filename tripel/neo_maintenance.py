@@ -0,0 +1,242 @@
+'''
+upkeep jobs for data that tripel_core denormalizes into neo.
+
+content nodes (root categories, categories, writeups, comments) carry the id of their nodespace, see
+tripel_core.NodespaceContentNode.  nodes created before that field existed don't have it:  backfill walks each
+nodespace's content tree and fills in (and indexes) the field where it's missing.  verify checks that the field and
+NS_CONTENT_IDX agree with what the tree actually looks like.  both go one nodespace at a time, so they're safe to
+interrupt and re-run.
+
+the full-text indexes (used by tripel_core.ContentSearch) also need the nodespace id, so that searches can filter on it.
+reindex_search adds it for content that was indexed without it, which includes everything backfill fills in.
+
+comments also carry their thread root id, thread path and depth (see tripel_core.CommentNode).  backfill_comment_threads
+fills those in for comments created before they existed, once the comments have their nodespace ids.
+
+run from the tripel directory (so that config paths resolve):
+  python neo_maintenance.py backfill
+  python neo_maintenance.py verify
+  python neo_maintenance.py reindex_search
+  python neo_maintenance.py backfill_comment_threads
+'''
+import json
+import urllib
+import logging
+import argparse
+
+import tripel_core as tc
+import config.parameters as params
+import util
+
+logger = logging.getLogger(__name__)
+
+
+class NodespaceIdMaintenance(object):
+    # every content edge points from child to parent, so everything in a nodespace is some number of these hops from the root category
+    CONTENT_EDGE_TYPES = [tc.SubcategoryEdge.EDGE_TYPE, tc.CategorizationEdge.EDGE_TYPE, tc.CommentAttachEdge.EDGE_TYPE, tc.CommentReplyEdge.EDGE_TYPE]
+    NS_PAGE_SIZE = 100
+    
+    def __init__(self, db_tuple, batch_size=params.NEO_NS_ID_BACKFILL_BATCH_SIZE):
+        self.pgdb, self.neodb = db_tuple
+        self.batch_size = batch_size
+    
+    def _get_all_nodespace_ids(self):
+        after_pk_val = None
+        while True:
+            nodespaces = tc.Nodespace.get_obj_chunk_after_pk(self.pgdb, after_pk_val, self.NS_PAGE_SIZE)
+            if not nodespaces:
+                return
+            for nodespace in nodespaces:
+                yield nodespace.nodespace_id
+            after_pk_val = getattr(nodespaces[-1], tc.Nodespace.PK_COL_NAME)
+    
+    def get_reachable_content(self, nodespace_id):
+        '''returns a list of (neo node id, stored nodespace id or None) for everything under the nodespace's root category.'''
+        content_cql = '''START nodespace=node:%(ns_idx_name)s(%(ns_id_field_name)s={nodespace_id})
+                        MATCH nodespace<-[:%(catroot_edge_type)s]-root_cat<-[:%(content_edge_types)s*0..]-content
+                        RETURN DISTINCT id(content), content.%(ns_id_field_name)s?;''' % \
+                        {'ns_idx_name': tc.NodespaceNode.NODESPACE_INDEX_NAME,
+                        'ns_id_field_name': tc.NodespaceNode.NODESPACE_ID_FIELD_NAME,
+                        'catroot_edge_type': tc.CategoryRootEdge.EDGE_TYPE,
+                        'content_edge_types': '|'.join(self.CONTENT_EDGE_TYPES)}
+        return [(row[0], row[1]) for row in tc.NeoUtil.execute_cypher(self.neodb, content_cql, {'nodespace_id': str(nodespace_id)})]
+    
+    def get_indexed_content(self, nodespace_id):
+        '''returns the set of neo node ids filed under nodespace_id in NS_CONTENT_IDX.'''
+        indexed_cql = 'START content=node:%(idx_name)s(%(field_name)s={nodespace_id}) RETURN id(content);' % \
+                        {'idx_name': tc.NodespaceContentNode.NS_CONTENT_INDEX_NAME, 'field_name': tc.NodespaceContentNode.NODESPACE_ID_FIELD_NAME}
+        return set([row[0] for row in tc.NeoUtil.execute_cypher(self.neodb, indexed_cql, {'nodespace_id': str(nodespace_id)})])
+    
+    def get_searchable_content(self, nodespace_id):
+        '''returns a dict of node type -> list of neo node ids, for the nodespace's content that has a full-text index.'''
+        content_cql = '''START content=node:%(idx_name)s(%(ns_id_field_name)s={nodespace_id})
+                        WHERE content.%(node_type_field_name)s IN {node_types}
+                        RETURN id(content), content.%(node_type_field_name)s;''' % \
+                        {'idx_name': tc.NodespaceContentNode.NS_CONTENT_INDEX_NAME,
+                        'ns_id_field_name': tc.NodespaceContentNode.NODESPACE_ID_FIELD_NAME,
+                        'node_type_field_name': tc.TripelNode.NODE_TYPE_FIELD_NAME}
+        query_params = {'nodespace_id': str(nodespace_id), 'node_types': tc.ContentSearch.SEARCHABLE_TYPES.keys()}
+        content_by_type = {}
+        for neo_node_id, node_type in tc.NeoUtil.execute_cypher(self.neodb, content_cql, query_params):
+            content_by_type.setdefault(node_type, []).append(neo_node_id)
+        return content_by_type
+    
+    def get_search_indexed_content(self, nodespace_id, node_type):
+        '''returns the set of neo node ids filed under nodespace_id in node_type's full-text index.'''
+        idx_name = tc.ContentSearch.SEARCHABLE_TYPES[node_type][0]
+        indexed_cql = 'START content=node:%(idx_name)s({lucene_query}) RETURN id(content);' % {'idx_name': idx_name}
+        lucene_query = '%s:%s' % (tc.NodespaceContentNode.NODESPACE_ID_FIELD_NAME, nodespace_id)
+        return set([row[0] for row in tc.NeoUtil.execute_cypher(self.neodb, indexed_cql, {'lucene_query': lucene_query})])
+    
+    def _get_index_jobs(self, neo_node_ids, idx_name, idx_val, idx_key=tc.NodespaceContentNode.NODESPACE_ID_FIELD_NAME):
+        db_uri = tc.NeoUtil.get_db_uri(self.neodb)
+        idx_path = '/index/node/%s' % urllib.quote(idx_name, '')
+        return [{'method': 'POST', 'to': idx_path, 'id': i,
+                'body': {'uri': '%snode/%i' % (db_uri, neo_node_ids[i]), 'key': idx_key, 'value': idx_val}}
+                for i in range(len(neo_node_ids))]
+    
+    def reindex_search_nodespace(self, nodespace_id):
+        '''adds the nodespace id to the full-text index entries of the nodespace's content that doesn't have it.  returns how many it updated.'''
+        num_updated = 0
+        for node_type, neo_node_ids in self.get_searchable_content(nodespace_id).items():
+            indexed_ids = self.get_search_indexed_content(nodespace_id, node_type)
+            missing_ids = [neo_node_id for neo_node_id in neo_node_ids if neo_node_id not in indexed_ids]
+            idx_name = tc.ContentSearch.SEARCHABLE_TYPES[node_type][0]
+            for i in range(0, len(missing_ids), self.batch_size):
+                tc.NeoUtil.run_rest_batch(self.neodb, self._get_index_jobs(missing_ids[i:i+self.batch_size], idx_name, nodespace_id))
+            num_updated += len(missing_ids)
+        return num_updated
+    
+    def get_unthreaded_comments(self, nodespace_id):
+        '''returns a list of (neo node id, CommentNode) for the nodespace's comments that don't have a thread path.'''
+        comments_cql = '''START cmnt=node:%(idx_name)s(%(ns_id_field_name)s={nodespace_id})
+                        WHERE cmnt.%(node_type_field_name)s = {node_type} AND NOT(has(cmnt.%(thrd_path_field_name)s))
+                        RETURN id(cmnt), cmnt;''' % \
+                        {'idx_name': tc.NodespaceContentNode.NS_CONTENT_INDEX_NAME,
+                        'ns_id_field_name': tc.NodespaceContentNode.NODESPACE_ID_FIELD_NAME,
+                        'node_type_field_name': tc.TripelNode.NODE_TYPE_FIELD_NAME,
+                        'thrd_path_field_name': tc.CommentNode.THREAD_PATH_FIELD_NAME}
+        query_params = {'nodespace_id': str(nodespace_id), 'node_type': tc.CommentNode.NODE_TYPE}
+        return [(row[0], tc.CommentNode._init_from_neo_node(row[1])) for row in tc.NeoUtil.execute_cypher(self.neodb, comments_cql, query_params)]
+    
+    def _get_comment_thread_jobs(self, neo_node_id, thread_path, first_job_id):
+        thread_fields = {}
+        tc.CommentNode._add_thread_fields(thread_fields, thread_path)
+        jobs = [{'method': 'PUT', 'to': '/node/%i/properties/%s' % (neo_node_id, field_name), 'body': field_val, 'id': first_job_id + i}
+                for i, (field_name, field_val) in enumerate(sorted(thread_fields.items()))]
+        idx_job = self._get_index_jobs([neo_node_id], tc.CommentNode.COMMENT_THREAD_INDEX_NAME, thread_fields[tc.CommentNode.THREAD_ROOT_ID_FIELD_NAME],
+                                        tc.CommentNode.THREAD_ROOT_ID_FIELD_NAME)[0]
+        idx_job['id'] = first_job_id + len(jobs)
+        return jobs + [idx_job]
+    
+    def backfill_comment_threads_nodespace(self, nodespace_id):
+        '''sets and indexes the thread fields on the nodespace's comments that don't have them.  returns how many it updated.'''
+        unthreaded_comments = self.get_unthreaded_comments(nodespace_id)
+        for i in range(0, len(unthreaded_comments), self.batch_size):
+            jobs = []
+            for neo_node_id, comment in unthreaded_comments[i:i+self.batch_size]:
+                # one traversal per comment, but this only has to happen once
+                jobs.extend(self._get_comment_thread_jobs(neo_node_id, comment.get_thread_path(self.neodb), len(jobs)))
+            tc.NeoUtil.run_rest_batch(self.neodb, jobs)
+        return len(unthreaded_comments)
+    
+    def _get_backfill_jobs(self, neo_node_ids, nodespace_id):
+        db_uri = tc.NeoUtil.get_db_uri(self.neodb)
+        field_name = tc.NodespaceContentNode.NODESPACE_ID_FIELD_NAME
+        idx_path = '/index/node/%s' % urllib.quote(tc.NodespaceContentNode.NS_CONTENT_INDEX_NAME, '')
+        jobs = []
+        for neo_node_id in neo_node_ids:
+            jobs.append({'method': 'PUT', 'to': '/node/%i/properties/%s' % (neo_node_id, field_name), 'body': nodespace_id, 'id': len(jobs)})
+            jobs.append({'method': 'POST', 'to': idx_path, 'id': len(jobs),
+                        'body': {'uri': '%snode/%i' % (db_uri, neo_node_id), 'key': field_name, 'value': nodespace_id}})
+        return jobs
+    
+    def backfill_nodespace(self, nodespace_id):
+        '''sets and indexes the nodespace id on the nodespace's content nodes that don't have it.  returns how many it updated.'''
+        missing_ids = [neo_node_id for neo_node_id, stored_ns_id in self.get_reachable_content(nodespace_id) if stored_ns_id is None]
+        for i in range(0, len(missing_ids), self.batch_size):
+            tc.NeoUtil.run_rest_batch(self.neodb, self._get_backfill_jobs(missing_ids[i:i+self.batch_size], nodespace_id))
+        return len(missing_ids)
+    
+    def verify_nodespace(self, nodespace_id):
+        '''
+        returns a dict of problem type -> list of neo node ids, only including problem types that turned up:
+        * missing:  under the nodespace, but has no nodespace id (not backfilled yet)
+        * mismatched:  under the nodespace, but has some other nodespace's id
+        * unindexed:  has the right nodespace id, but isn't in NS_CONTENT_IDX under it
+        * stale_index:  in NS_CONTENT_IDX under the nodespace, but not actually in it
+        '''
+        problems = {'missing': [], 'mismatched': [], 'unindexed': [], 'stale_index': []}
+        indexed_ids = self.get_indexed_content(nodespace_id)
+        reachable_ids = set()
+        for neo_node_id, stored_ns_id in self.get_reachable_content(nodespace_id):
+            reachable_ids.add(neo_node_id)
+            if stored_ns_id is None:
+                problems['missing'].append(neo_node_id)
+            elif str(stored_ns_id) != str(nodespace_id):
+                problems['mismatched'].append(neo_node_id)
+            elif neo_node_id not in indexed_ids:
+                problems['unindexed'].append(neo_node_id)
+        problems['stale_index'] = sorted(indexed_ids - reachable_ids)
+        return dict((problem_type, neo_node_ids) for problem_type, neo_node_ids in problems.items() if neo_node_ids)
+    
+    def backfill(self):
+        '''returns the total number of content nodes updated.'''
+        num_updated = 0
+        for nodespace_id in self._get_all_nodespace_ids():
+            num_ns_updated = self.backfill_nodespace(nodespace_id)
+            num_updated += num_ns_updated
+            logger.info('nodespace %s: backfilled %i content nodes' % (nodespace_id, num_ns_updated))
+        return num_updated
+    
+    def reindex_search(self):
+        '''returns the total number of content nodes reindexed.'''
+        num_updated = 0
+        for nodespace_id in self._get_all_nodespace_ids():
+            num_ns_updated = self.reindex_search_nodespace(nodespace_id)
+            num_updated += num_ns_updated
+            logger.info('nodespace %s: reindexed %i content nodes for search' % (nodespace_id, num_ns_updated))
+        return num_updated
+    
+    def backfill_comment_threads(self):
+        '''returns the total number of comments updated.'''
+        num_updated = 0
+        for nodespace_id in self._get_all_nodespace_ids():
+            num_ns_updated = self.backfill_comment_threads_nodespace(nodespace_id)
+            num_updated += num_ns_updated
+            logger.info('nodespace %s: backfilled thread fields on %i comments' % (nodespace_id, num_ns_updated))
+        return num_updated
+    
+    def verify(self):
+        '''returns a dict of nodespace id -> problems (as from verify_nodespace), for the nodespaces that have any.'''
+        all_problems = {}
+        for nodespace_id in self._get_all_nodespace_ids():
+            problems = self.verify_nodespace(nodespace_id)
+            if problems:
+                logger.warning('nodespace %s: %s' % (nodespace_id, ', '.join(['%i %s' % (len(ids), problem_type) for problem_type, ids in problems.items()])))
+                all_problems[nodespace_id] = problems
+        return all_problems
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='maintain the nodespace ids and comment thread fields stored on neo content nodes')
+    arg_parser.add_argument('command', choices=['backfill', 'verify', 'reindex_search', 'backfill_comment_threads'])
+    arg_parser.add_argument('--batch-size', type=int, default=params.NEO_NS_ID_BACKFILL_BATCH_SIZE, help='content nodes per neo transaction')
+    args = arg_parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    pgdb = tc.PgUtil.get_db_conn_ssl(params.PG_DBNAME, params.PG_USERNAME, util.get_file_contents(params.PG_PASS_FILENAME))
+    neodb = tc.NeoUtil.get_db_conn(params.NEO_DB_URI)
+    tc.init_neo_indexes(neodb)
+    maintenance = NodespaceIdMaintenance((pgdb, neodb), args.batch_size)
+    if args.command == 'backfill':
+        print 'backfilled %i content nodes' % maintenance.backfill()
+    elif args.command == 'reindex_search':
+        print 'reindexed %i content nodes for search' % maintenance.reindex_search()
+    elif args.command == 'backfill_comment_threads':
+        print 'backfilled thread fields on %i comments' % maintenance.backfill_comment_threads()
+    else:
+        all_problems = maintenance.verify()
+        print '%i nodespaces with problems' % len(all_problems)
+        for nodespace_id, problems in sorted(all_problems.items()):
+            print '%s: %s' % (nodespace_id, json.dumps(problems))
@@ -0,0 +1,199 @@
+'''
+runs users' saved searches (tripel_core.SavedSearch) against new content, and creates a NotificationNode for each match.
+
+rather than re-running every saved search over the whole graph, each run only looks at the categories, writeups and
+comments created since the last run's checkpoint, found with a range query on the creation dates in CREATED_BY_IDX.
+the saved searches are loaded into an inverted index by search term, so each new node is checked against just the
+searches that could match it, and every search gets considered in one pass over the new content.  notifications are
+written in batched transactions, and the checkpoint advances after each chunk of content.  so a run takes time in
+proportion to the new content (and the matches), not to the size of the graph.
+
+if a run dies between writing a chunk's notifications and saving the checkpoint, the next run will redo that chunk,
+and its notifications will show up twice.
+
+the first run just records where to start from, since there's no way to tell what earlier runs would've already
+covered.  run periodically from the tripel directory (so that config paths resolve):
+  python saved_search_evaluator.py
+'''
+import time
+import logging
+import argparse
+
+import tripel_core as tc
+import config.parameters as params
+import util
+
+logger = logging.getLogger(__name__)
+
+
+class SavedSearchIndex(object):
+    """
+    saved searches by search term.  a search only matches content that has all of its terms, so each search is filed
+    under just one of them (the longest, as a cheap stand-in for the rarest), and the rest get checked on lookup.
+    """
+    def __init__(self):
+        self._searches_by_term = {}
+        self.num_searches = 0
+    
+    def add(self, saved_search):
+        """returns False (and doesn't add it) if the search has no terms to match on."""
+        search_terms = tc.ContentSearch.get_search_terms(saved_search.search_query)
+        if not search_terms:
+            return False
+        key_term = max(search_terms, key=len)
+        self._searches_by_term.setdefault(key_term, []).append((saved_search, frozenset(search_terms)))
+        self.num_searches += 1
+        return True
+    
+    def get_matches(self, content_terms):
+        """the saved searches whose terms are all in content_terms (a set), each at most once."""
+        matches = []
+        for term in content_terms:
+            for saved_search, search_terms in self._searches_by_term.get(term, []):
+                if search_terms <= content_terms:
+                    matches.append(saved_search)
+        return matches
+
+
+class SavedSearchEvaluator(object):
+    CHECKPOINT_NAME = 'saved_search_evaluator'
+    SAVED_SEARCH_PAGE_SIZE = 1000
+    
+    def __init__(self, db_tuple, content_chunk_size=params.SAVED_SEARCH_CONTENT_CHUNK_SIZE,
+                    notification_batch_size=params.SAVED_SEARCH_NOTIFICATION_BATCH_SIZE):
+        self.db_tuple = db_tuple
+        self.pgdb, self.neodb = db_tuple
+        self.content_chunk_size = content_chunk_size
+        self.notification_batch_size = notification_batch_size
+        # (user id, nodespace id) -> whether the user can view the nodespace, for the length of a run
+        self._can_view_cache = {}
+    
+    def _load_search_index(self):
+        search_index = SavedSearchIndex()
+        after_pk_val = None
+        while True:
+            saved_searches = tc.SavedSearch.get_obj_chunk_after_pk(self.pgdb, after_pk_val, self.SAVED_SEARCH_PAGE_SIZE)
+            if not saved_searches:
+                return search_index
+            for saved_search in saved_searches:
+                if saved_search.is_enabled:
+                    search_index.add(saved_search)
+            after_pk_val = saved_searches[-1].saved_search_id
+    
+    def get_new_content(self, after_creation_date, after_edge_id, limit):
+        """
+        up to limit content nodes created after (after_creation_date, after_edge_id), oldest first, as dicts with
+        'creation_date', 'edge_id', 'creator_id' and 'node' (a tripel_core node object).
+        """
+        content_types = [tc.CategoryNode, tc.WriteupNode, tc.CommentNode]
+        new_content_cql = '''START created_by=relationship:%(created_by_idx_name)s({date_range_query})
+                            MATCH content-[created_by]->creator
+                            WHERE content.%(node_type_field_name)s IN {node_types}
+                                AND (created_by.%(creation_date_field_name)s > {after_creation_date} OR created_by.%(unq_edge_id_field_name)s > {after_edge_id})
+                            RETURN created_by.%(creation_date_field_name)s, created_by.%(unq_edge_id_field_name)s, created_by.%(user_id_field_name)s, content
+                            ORDER BY created_by.%(creation_date_field_name)s, created_by.%(unq_edge_id_field_name)s
+                            LIMIT {limit};''' % \
+                            {'created_by_idx_name': tc.CreatedByEdge.CREATED_BY_INDEX_NAME,
+                            'node_type_field_name': tc.TripelNode.NODE_TYPE_FIELD_NAME,
+                            'creation_date_field_name': tc.CreatedByEdge.CREATION_DATE_FIELD_NAME,
+                            'unq_edge_id_field_name': tc.CreatedByEdge.UNIQUE_EDGE_ID_FIELD_NAME,
+                            'user_id_field_name': tc.CreatedByEdge.USER_ID_FIELD_NAME}
+        # inclusive at the bottom, since there can be more than one edge with the checkpoint's date.  dates all start
+        # with a 4 digit year, so anything starting with a 9 is an upper bound for a good long while.
+        date_range_query = '%s:["%s" TO "9"]' % (tc.CreatedByEdge.CREATION_DATE_FIELD_NAME, after_creation_date)
+        query_params = {'date_range_query': date_range_query, 'node_types': [content_type.NODE_TYPE for content_type in content_types],
+                        'after_creation_date': after_creation_date, 'after_edge_id': after_edge_id, 'limit': limit}
+        content_classes = dict((content_type.NODE_TYPE, content_type) for content_type in content_types)
+        new_content = []
+        for creation_date, edge_id, creator_id, content in tc.NeoUtil.execute_cypher(self.neodb, new_content_cql, query_params):
+            properties = content.get_properties().copy()
+            node = content_classes[properties[tc.TripelNode.NODE_TYPE_FIELD_NAME]]._init_from_properties(properties)
+            new_content.append({'creation_date': creation_date, 'edge_id': edge_id, 'creator_id': creator_id, 'node': node})
+        return new_content
+    
+    @staticmethod
+    def get_content_terms(node):
+        idx_name, title_field_name, body_field_name = tc.ContentSearch.SEARCHABLE_TYPES[node.NODE_TYPE]
+        return tc.ContentSearch.get_text_terms(node._properties.get(title_field_name)) | tc.ContentSearch.get_text_terms(node._properties.get(body_field_name))
+    
+    def _can_view(self, user_id, nodespace_id):
+        cache_key = (user_id, str(nodespace_id))
+        if cache_key not in self._can_view_cache:
+            user = tc.User.get_existing_user_by_id(self.pgdb, user_id)
+            nodespace = tc.Nodespace.get_existing_nodespace_by_id(self.pgdb, nodespace_id)
+            self._can_view_cache[cache_key] = (user is not None and nodespace is not None and user.is_enabled and
+                                                tc.NodespacePrivilegeChecker.is_allowed_to_do(self.db_tuple, tc.NodespacePrivilegeChecker.VIEW_NODESPACE_ACTION,
+                                                                                                nodespace, user, False))
+        return self._can_view_cache[cache_key]
+    
+    def get_notifications(self, search_index, new_content):
+        """(saved search, content unique node id) for each match in new_content that the search's user is allowed to see."""
+        notifications = []
+        for content_info in new_content:
+            node = content_info['node']
+            nodespace_id = node.get_parent_nodespace_id(self.neodb)
+            for saved_search in search_index.get_matches(self.get_content_terms(node)):
+                if saved_search.user_id == content_info['creator_id']:
+                    continue
+                if saved_search.nodespace_id is not None and str(saved_search.nodespace_id) != str(nodespace_id):
+                    continue
+                if self._can_view(saved_search.user_id, nodespace_id):
+                    notifications.append((saved_search, node._properties[tc.TripelNode.UNIQUE_NODE_ID_FIELD_NAME]))
+        return notifications
+    
+    def _write_notifications(self, notifications):
+        for i in range(0, len(notifications), self.notification_batch_size):
+            stmt_defs = []
+            for saved_search, target_unq_id in notifications[i:i+self.notification_batch_size]:
+                stmt_defs.extend(tc.NotificationNode.create_new_notification_node(self.db_tuple, saved_search.user_id, target_unq_id,
+                                                                                    saved_search.saved_search_id, {}, False))
+            tc.NeoUtil.run_gremlin_statements(self.neodb, stmt_defs, should_coalesce=False)
+    
+    def run(self):
+        """evaluates everything created since the last run.  returns a dict of stats about the run."""
+        stats = {'num_searches': 0, 'num_content_nodes': 0, 'num_notifications': 0, 'start_time': time.time()}
+        self._can_view_cache = {}
+        checkpoint = tc.SavedSearchCheckpoint.get_checkpoint(self.pgdb, self.CHECKPOINT_NAME)
+        if checkpoint is None:
+            now_str = tc.CreatedByEdge.get_creation_date_str(util.DateTimeUtil.datetime_now_utc_aware())
+            tc.SavedSearchCheckpoint.save_checkpoint(self.pgdb, self.CHECKPOINT_NAME, now_str, 0)
+            logger.info('no checkpoint yet, starting from %s on the next run' % now_str)
+            stats['elapsed_secs'] = time.time() - stats['start_time']
+            return stats
+        
+        search_index = self._load_search_index()
+        stats['num_searches'] = search_index.num_searches
+        last_creation_date, last_edge_id = checkpoint.last_creation_date, checkpoint.last_edge_id
+        while True:
+            new_content = self.get_new_content(last_creation_date, last_edge_id, self.content_chunk_size)
+            if not new_content:
+                break
+            notifications = self.get_notifications(search_index, new_content) if search_index.num_searches else []
+            self._write_notifications(notifications)
+            last_creation_date, last_edge_id = new_content[-1]['creation_date'], new_content[-1]['edge_id']
+            tc.SavedSearchCheckpoint.save_checkpoint(self.pgdb, self.CHECKPOINT_NAME, last_creation_date, last_edge_id)
+            
+            stats['num_content_nodes'] += len(new_content)
+            stats['num_notifications'] += len(notifications)
+            logger.info('%i new content nodes, %i notifications so far' % (stats['num_content_nodes'], stats['num_notifications']))
+            if len(new_content) < self.content_chunk_size:
+                break
+        
+        stats['elapsed_secs'] = time.time() - stats['start_time']
+        return stats
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='notify users of new content that matches their saved searches')
+    arg_parser.add_argument('--content-chunk-size', type=int, default=params.SAVED_SEARCH_CONTENT_CHUNK_SIZE, help='new content nodes per checkpoint')
+    arg_parser.add_argument('--notification-batch-size', type=int, default=params.SAVED_SEARCH_NOTIFICATION_BATCH_SIZE, help='notifications per neo transaction')
+    args = arg_parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    pgdb = tc.PgUtil.get_db_conn_ssl(params.PG_DBNAME, params.PG_USERNAME, util.get_file_contents(params.PG_PASS_FILENAME))
+    neodb = tc.NeoUtil.get_db_conn(params.NEO_DB_URI)
+    tc.init_neo_indexes(neodb)
+    evaluator = SavedSearchEvaluator((pgdb, neodb), args.content_chunk_size, args.notification_batch_size)
+    stats = evaluator.run()
+    print '%i searches, %i new content nodes, %i notifications in %.1f sec' % \
+            (stats['num_searches'], stats['num_content_nodes'], stats['num_notifications'], stats['elapsed_secs'])
@@ -256,6 +256,32 @@ trplApp.service('trplBackendSvc',
 			this.reqObjList('GET', callbackFn, subUrl, params);
 		};
 		
+		//for list pages that page by keyset:  follows the next page cursor header until it runs out, and calls back 
+		//once with the whole list (or null if any page fails).
+		this.getObjListAllPages = function(callbackFn, subUrl, params) {
+			var httpReq = this.httpReq;
+			var objList = [];
+			var reqPage = function(after) {
+				var pageParams = jQuery.extend({}, params, (after !== null) ? {after: after} : {});
+				var successCallbackFn = function(respData, status, headers, config) {
+					if(respData.length !== undefined) objList = objList.concat(respData);
+					var nextCursor = headers('X-Trpl-Next-Cursor');
+					if(nextCursor) {
+						reqPage(nextCursor);
+					} else {
+						callbackFn(objList);
+					}
+				};
+				
+				var errorCallbackFn = function(respData, status, headers, config) {
+					callbackFn(null);
+				};
+				
+				httpReq('GET', subUrl, pageParams, successCallbackFn, errorCallbackFn);
+			};
+			reqPage(null);
+		};
+		
 		this.getObj = function(callbackFn, subUrl, params) {
 			this.reqObj('GET', callbackFn, subUrl, params);
 		};
@@ -272,23 +298,47 @@ trplApp.service('trplBackendSvc',
 		};
 
 		this.getAllNodespaces = function(callbackFn) {
-			return this.getObjList(callbackFn, '/nodespace_list_all', {});
+			return this.getObjListAllPages(callbackFn, '/nodespace_list_all', {});
 		};
 		
 		this.getGraphElements = function(callbackFn, nodespaceId) {
 			return this.getObjList(callbackFn, '/nodespace_overview', {nodespace_id: nodespaceId});
 		};
 		
+		//rootNodeId is a category's unique node id (null for the top of the nodespace).  the response's has_more_children 
+		//maps element ids to the childrenOffset to pass here to expand them.
+		this.getSubgraph = function(callbackFn, nodespaceId, rootNodeId, maxDepth, childrenPageSize, childrenOffset) {
+			return this.getObj(callbackFn, '/nodespace_subgraph', 
+								{nodespace_id: nodespaceId, root_node_id: rootNodeId, max_depth: maxDepth, 
+								children_page_size: childrenPageSize, children_offset: childrenOffset});
+		};
+		
+		//nodespaceId can be null to search every nodespace the user can view.  cursor is null for the first page, and 
+		//the response's next_cursor after that.
+		this.searchNodespace = function(callbackFn, nodespaceId, queryText, contentType, cursor) {
+			return this.getObj(callbackFn, '/nodespace_search', 
+								{nodespace_id: nodespaceId, q: queryText, content_type: contentType, cursor: cursor});
+		};
+		
+		this.getCommentThreads = function(callbackFn, parentNodeId) {
+			return this.getObj(callbackFn, '/comment_thread_list', {parent_node_id: parentNodeId});
+		};
+		
+		//cursor is null for the first page, and the response's next_cursor after that.
+		this.getCommentThread = function(callbackFn, commentId, cursor) {
+			return this.getObj(callbackFn, '/comment_thread_view', {comment_id: commentId, cursor: cursor});
+		};
+		
 		this.getAllUsers = function(callbackFn) {
-			return this.getObjList(callbackFn, '/user_list_all', {});
+			return this.getObjListAllPages(callbackFn, '/user_list_all', {});
 		};
 		
 		this.getNodespaceUsers = function(callbackFn, nodespaceId) {
-			return this.getObjList(callbackFn, '/user_list_nodespace', {nodespace_id: nodespaceId});
+			return this.getObjListAllPages(callbackFn, '/user_list_nodespace', {nodespace_id: nodespaceId});
 		};
 		
 		this.getNodespaceAbsentUsers = function(callbackFn, nodespaceId) {
-			return this.getObjList(callbackFn, '/user_list_nodespace_absent', {nodespace_id: nodespaceId});
+			return this.getObjListAllPages(callbackFn, '/user_list_nodespace_absent', {nodespace_id: nodespaceId});
 		};
 		
 		this.getNodespaceViewInfo = function(callbackFn, nodespaceId) {
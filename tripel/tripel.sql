@@ -110,5 +110,21 @@ CREATE TABLE :SCHEMA_NAME.metaspace_sessions (
 	last_visit TIMESTAMP WITH TIME ZONE NOT NULL
 );
 
+CREATE TABLE :SCHEMA_NAME.saved_searches (
+	saved_search_id SERIAL PRIMARY KEY,
+	user_id INTEGER REFERENCES :SCHEMA_NAME.users(user_id) NOT NULL,
+	nodespace_id INTEGER REFERENCES :SCHEMA_NAME.nodespaces(nodespace_id), --null means every nodespace the user can view
+	search_query VARCHAR(500) NOT NULL,
+	is_enabled BOOLEAN NOT NULL,
+	creation_date TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE TABLE :SCHEMA_NAME.saved_search_checkpoints (
+	checkpoint_name VARCHAR(100) PRIMARY KEY,
+	last_creation_date VARCHAR(100) NOT NULL, --in the same string form as the creation dates on CREATED_BY edges in neo
+	last_edge_id BIGINT NOT NULL,
+	modification_date TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
 CREATE SEQUENCE :SCHEMA_NAME.unique_neo_node_id;
 CREATE SEQUENCE :SCHEMA_NAME.unique_neo_edge_id;
@@ -8,7 +8,23 @@ TODO:
 * break things out into more specialized modules
 """
 
+import re
+import sys
 import logging
+import hashlib
+import threading
+import json
+import time
+import base64
+import random
+import socket
+import errno
+import urllib
+import atexit
+import httplib
+import urlparse
+import collections
+import contextlib
 
 import web
 import cryptacular.bcrypt
@@ -24,16 +40,641 @@ logger = logging.getLogger(__name__)
 SCHEMA_NAME = 'tripel'
 
 
+class PgConnectionPool(object):
+    """
+    a pool of open postgres (dbapi) connections, shared by all the threads using one PooledPostgresDB.  at most max_size 
+    are open at once; a thread that needs one when they're all checked out waits up to wait_timeout_secs.  since 
+    connections stay open between checkouts, the SSL handshake happens once per connection instead of once per use 
+    (libpq doesn't do SSL session resumption, so keeping connections around is the only way to reuse a session).
+    
+    a connection that's sat idle for health_check_idle_secs gets a 'select 1' on checkout, and is replaced if that 
+    fails.  on checkin, anything left uncommitted gets rolled back, connections older than max_conn_age_secs get 
+    replaced, and idle connections beyond min_size get closed after max_idle_secs.
+    """
+    class PoolTimeoutError(Exception):
+        pass
+    
+    def __init__(self, connect_fn, min_size=params.PG_POOL_MIN_SIZE, max_size=params.PG_POOL_MAX_SIZE, 
+                    wait_timeout_secs=params.PG_POOL_WAIT_TIMEOUT_SECS, health_check_idle_secs=params.PG_POOL_HEALTH_CHECK_IDLE_SECS, 
+                    max_idle_secs=params.PG_POOL_MAX_IDLE_SECS, max_conn_age_secs=params.PG_POOL_MAX_CONN_AGE_SECS):
+        self._connect_fn = connect_fn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.wait_timeout_secs = wait_timeout_secs
+        self.health_check_idle_secs = health_check_idle_secs
+        self.max_idle_secs = max_idle_secs
+        self.max_conn_age_secs = max_conn_age_secs
+        
+        self._cond = threading.Condition()
+        # (conn, idle since) pairs, most recently returned last
+        self._idle_conns = []
+        # id(conn) -> when it was opened, for every open conn (idle or checked out)
+        self._open_times = {}
+        # id(conn) -> a dict for whatever needs to be remembered per connection (e.g. which statements it has prepared)
+        self._conn_states = {}
+        self._num_in_use = 0
+        self._stats = {'num_checkouts': 0, 'num_conns_opened': 0, 'num_conns_discarded': 0, 'num_health_checks': 0, 
+                        'num_health_check_failures': 0, 'num_waits': 0, 'num_timeouts': 0, 'total_wait_secs': 0.0, 'max_wait_secs': 0.0}
+    
+    def _open_conn(self):
+        conn = self._connect_fn()
+        with self._cond:
+            self._open_times[id(conn)] = time.time()
+            self._conn_states[id(conn)] = {}
+            self._stats['num_conns_opened'] += 1
+        return conn
+    
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._open_times.pop(id(conn), None)
+            self._conn_states.pop(id(conn), None)
+            self._stats['num_conns_discarded'] += 1
+    
+    def fill_to_min_size(self):
+        """opens connections until there are min_size, so the first requests don't have to."""
+        new_conns = []
+        with self._cond:
+            num_to_open = self.min_size - len(self._open_times)
+        for i in range(num_to_open):
+            new_conns.append(self._open_conn())
+        with self._cond:
+            self._idle_conns.extend([(conn, time.time()) for conn in new_conns])
+            self._cond.notify_all()
+    
+    def _is_healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.time() - idle_since < self.health_check_idle_secs:
+            return True
+        with self._cond:
+            self._stats['num_health_checks'] += 1
+        try:
+            cursor = conn.cursor()
+            cursor.execute('select 1;')
+            cursor.fetchall()
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception:
+            logger.warning('pooled postgres connection failed its health check, replacing it')
+            with self._cond:
+                self._stats['num_health_check_failures'] += 1
+            return False
+    
+    def checkout(self):
+        with self._cond:
+            wait_start_time = None
+            while not self._idle_conns and self._num_in_use >= self.max_size:
+                if wait_start_time is None:
+                    wait_start_time = time.time()
+                    self._stats['num_waits'] += 1
+                remaining_secs = self.wait_timeout_secs - (time.time() - wait_start_time)
+                if remaining_secs <= 0:
+                    self._stats['total_wait_secs'] += time.time() - wait_start_time
+                    self._stats['num_timeouts'] += 1
+                    raise self.PoolTimeoutError('no postgres connection free after %s secs' % self.wait_timeout_secs)
+                self._cond.wait(remaining_secs)
+            if wait_start_time is not None:
+                wait_secs = time.time() - wait_start_time
+                self._stats['total_wait_secs'] += wait_secs
+                self._stats['max_wait_secs'] = max(self._stats['max_wait_secs'], wait_secs)
+            
+            self._num_in_use += 1
+            self._stats['num_checkouts'] += 1
+            idle_conn_info = self._idle_conns.pop() if self._idle_conns else None
+        
+        try:
+            while idle_conn_info is not None:
+                if self._is_healthy(*idle_conn_info):
+                    return idle_conn_info[0]
+                self._discard(idle_conn_info[0])
+                with self._cond:
+                    idle_conn_info = self._idle_conns.pop() if self._idle_conns else None
+            return self._open_conn()
+        except:
+            with self._cond:
+                self._num_in_use -= 1
+                self._cond.notify()
+            raise
+    
+    def checkin(self, conn):
+        """returns a connection from checkout to the pool.  anything left uncommitted on it gets rolled back."""
+        is_reusable = not conn.closed
+        if is_reusable:
+            try:
+                # no round trip unless there's actually a transaction open
+                conn.rollback()
+            except Exception:
+                is_reusable = False
+        
+        now = time.time()
+        with self._cond:
+            open_time = self._open_times.get(id(conn), now)
+        if is_reusable and self.max_conn_age_secs and now - open_time > self.max_conn_age_secs:
+            is_reusable = False
+        if not is_reusable:
+            self._discard(conn)
+        
+        with self._cond:
+            self._num_in_use -= 1
+            if is_reusable:
+                self._idle_conns.append((conn, now))
+            # the least recently used idle conns are at the front
+            stale_conns = []
+            while (self._idle_conns and len(self._open_times) - len(stale_conns) > self.min_size and 
+                    now - self._idle_conns[0][1] > self.max_idle_secs):
+                stale_conns.append(self._idle_conns.pop(0)[0])
+            self._cond.notify()
+        for stale_conn in stale_conns:
+            self._discard(stale_conn)
+    
+    def get_conn_state(self, conn):
+        """the per connection state dict for a checked out conn.  it goes away when the conn is closed."""
+        with self._cond:
+            return self._conn_states[id(conn)]
+    
+    def close_idle_conns(self):
+        with self._cond:
+            idle_conns = self._idle_conns
+            self._idle_conns = []
+        for conn, idle_since in idle_conns:
+            self._discard(conn)
+    
+    def get_stats(self):
+        now = time.time()
+        with self._cond:
+            stats = self._stats.copy()
+            conn_ages = [now - open_time for open_time in self._open_times.values()]
+            stats.update({'num_in_use': self._num_in_use, 'num_idle': len(self._idle_conns), 'min_size': self.min_size, 'max_size': self.max_size, 
+                            'max_conn_age_secs': max(conn_ages) if conn_ages else 0.0, 
+                            'mean_conn_age_secs': sum(conn_ages) / len(conn_ages) if conn_ages else 0.0})
+            return stats
+
+class PooledPostgresDB(web.db.PostgresDB):
+    """
+    a web.py postgres db that gets its connections from a PgConnectionPool instead of opening them itself, so it works 
+    anywhere a plain web.database does.  outside of a request_scope, a connection gets checked out for each statement 
+    (or transaction) and returned after it commits or rolls back, which is how web.py's own pooling works.  inside 
+    one, the thread's first statement checks out a connection, and the thread keeps it until the scope ends, so a 
+    request does at most one checkout.  transactions work the same either way, since web.py only releases a 
+    connection once the outermost transaction is done.
+    """
+    def __init__(self, **keywords):
+        # web.py's DBUtils pooling is off, but has_pooling tells it to get and release connections through the methods below
+        keywords['pooling'] = False
+        web.db.PostgresDB.__init__(self, **keywords)
+        self.has_pooling = True
+        self.pool = PgConnectionPool(lambda: self._connect(self.keywords))
+    
+    def _connect_with_pooling(self, keywords):
+        return self.pool.checkout()
+    
+    def _unload_context(self, ctx):
+        if ctx.get('is_request_scoped'):
+            return
+        self._release_conn(ctx)
+    
+    def _release_conn(self, ctx):
+        conn = ctx.get('db')
+        if conn is not None:
+            del ctx.db
+            self.pool.checkin(conn)
+    
+    @contextlib.contextmanager
+    def request_scope(self):
+        """the calling thread keeps one connection for the length of the with block."""
+        self._ctx.is_request_scoped = True
+        try:
+            yield
+        finally:
+            self._ctx.is_request_scoped = False
+            self._release_conn(self._ctx)
+    
+    def execute_prepared(self, stmt_name, pg_sql, param_vals):
+        """
+        runs the prepared statement stmt_name (pg_sql, with $1, $2, ... placeholders) with param_vals, preparing it first 
+        if the connection hasn't yet.  returns the rows as web.storage objects (or the row count, if the statement 
+        doesn't return rows), and commits or not the same way query does.
+        """
+        ctx = self._getctx()
+        prepared_stmt_names = self.pool.get_conn_state(ctx.db).setdefault('prepared_stmt_names', set())
+        try:
+            cursor = ctx.db.cursor()
+            if stmt_name not in prepared_stmt_names:
+                # prepared statements aren't transactional, so this sticks even if the current transaction gets rolled back
+                cursor.execute('PREPARE %s AS %s' % (stmt_name, pg_sql))
+                prepared_stmt_names.add(stmt_name)
+            if param_vals:
+                cursor.execute('EXECUTE %s (%s)' % (stmt_name, ', '.join(['%s'] * len(param_vals))), param_vals)
+            else:
+                cursor.execute('EXECUTE %s' % stmt_name)
+            if cursor.description:
+                col_names = [col_desc[0] for col_desc in cursor.description]
+                result = [web.storage(zip(col_names, row)) for row in cursor.fetchall()]
+            else:
+                result = cursor.rowcount
+            cursor.close()
+        except:
+            if not ctx.transactions:
+                ctx.rollback()
+            raise
+        if not ctx.transactions:
+            ctx.commit()
+        return result
+
+class ReplicaRoutedDB(object):
+    """
+    stands in for the primary db (anything not defined here goes straight to it), but sends reads to the replicas:
+    select and where, and query when the sql is a plain select (not one that takes sequence values or row locks).
+    everything else goes to the primary:  the other writes, transactions, and any read made inside a transaction or
+    after the thread has written something in the current routing_scope.
+    
+    reads also stick to the primary when the routing_scope is given a primary_until that hasn't passed yet.  the web
+    app keeps that in a cookie, set for sticky_secs after any request that writes, so a client sees its own writes
+    even if the replicas haven't caught up.
+    
+    each replica's lag gets checked at most every lag_check_interval_secs.  one that's behind by more than max_lag_secs,
+    or whose lag can't be checked, or that a read just failed on, gets no reads until a later check says it's fine.
+    with no usable replicas, reads go to the primary.  lag is measured from the last transaction replayed, so on a
+    quiet primary it's overstated, which errs on the side of the primary.  a db that isn't a standby at all (e.g. a
+    second local postgres standing in for a replica) counts as having no lag.
+    """
+    REPLICA_LAG_SQL = 'select pg_is_in_recovery() as is_in_recovery, extract(epoch from now() - pg_last_xact_replay_timestamp()) as lag_secs;'
+    _READ_ONLY_SQL_RE = re.compile(r'^\s*select\b(?!.*\b(nextval|setval|for\s+update|for\s+share)\b)', re.IGNORECASE | re.DOTALL)
+    
+    class RoutingState(threading.local):
+        def __init__(self):
+            self.is_pinned_to_primary = False
+            self.did_write = False
+    
+    def __init__(self, primary, replicas, sticky_secs=params.PG_REPLICA_STICKY_SECS, max_lag_secs=params.PG_REPLICA_MAX_LAG_SECS,
+                    lag_check_interval_secs=params.PG_REPLICA_LAG_CHECK_INTERVAL_SECS):
+        self.primary = primary
+        self.replicas = replicas
+        self.sticky_secs = sticky_secs
+        self.max_lag_secs = max_lag_secs
+        self.lag_check_interval_secs = lag_check_interval_secs
+        self._state = self.RoutingState()
+        self._lock = threading.Lock()
+        # replica index -> (lag in secs, or None if it's unusable, and when that was checked)
+        self._replica_lags = dict((i, (None, 0)) for i in range(len(replicas)))
+        self._stats = {'num_primary_reads': 0, 'num_replica_reads': 0, 'num_writes': 0, 'num_replica_failures': 0}
+    
+    def __getattr__(self, name):
+        return getattr(self.primary, name)
+    
+    def _incr_stat(self, stat_name):
+        with self._lock:
+            self._stats[stat_name] += 1
+    
+    @contextlib.contextmanager
+    def routing_scope(self, primary_until=None):
+        """
+        for the length of a request.  primary_until is what get_primary_until returned after the client's last write
+        (None if there's been none, and it's ignored if it's junk).  yields the thread's RoutingState, whose did_write
+        says whether the client should get a new primary_until.
+        """
+        try:
+            primary_until = float(primary_until) if primary_until is not None else None
+        except ValueError:
+            primary_until = None
+        self._state.is_pinned_to_primary = primary_until is not None and time.time() < primary_until
+        self._state.did_write = False
+        try:
+            yield self._state
+        finally:
+            self._state.is_pinned_to_primary = False
+            self._state.did_write = False
+    
+    def get_primary_until(self):
+        return time.time() + self.sticky_secs
+    
+    @contextlib.contextmanager
+    def request_scope(self):
+        """PooledPostgresDB.request_scope on each of the dbs that are pooled."""
+        with contextlib.nested(*[db.request_scope() for db in [self.primary] + self.replicas if isinstance(db, PooledPostgresDB)]):
+            yield
+    
+    def _check_replica_lag(self, replica_idx):
+        try:
+            lag_info = self.replicas[replica_idx].query(self.REPLICA_LAG_SQL)[0]
+            if not lag_info['is_in_recovery']:
+                return 0.0
+            return float(lag_info['lag_secs']) if lag_info['lag_secs'] is not None else None
+        except Exception:
+            logger.exception('could not check the lag on replica %i' % replica_idx)
+            return None
+    
+    def _get_usable_replicas(self):
+        cur_time = time.time()
+        usable_replicas = []
+        for replica_idx, replica in enumerate(self.replicas):
+            with self._lock:
+                lag_secs, checked_time = self._replica_lags[replica_idx]
+                # whoever finds the check due does it, and everyone else goes by the last result in the meantime
+                should_check = cur_time - checked_time >= self.lag_check_interval_secs
+                if should_check:
+                    self._replica_lags[replica_idx] = (lag_secs, cur_time)
+            if should_check:
+                lag_secs = self._check_replica_lag(replica_idx)
+                with self._lock:
+                    self._replica_lags[replica_idx] = (lag_secs, cur_time)
+            if lag_secs is not None and lag_secs <= self.max_lag_secs:
+                usable_replicas.append(replica)
+        return usable_replicas
+    
+    def get_read_db(self):
+        """the db that a read made now should go to."""
+        if not self.replicas or self._state.is_pinned_to_primary or self.primary._ctx.get('transactions'):
+            return self.primary
+        usable_replicas = self._get_usable_replicas()
+        return random.choice(usable_replicas) if usable_replicas else self.primary
+    
+    def run_read(self, read_fn):
+        """read_fn(db) on the db from get_read_db.  if it fails on a replica, the replica gets sidelined and the read is retried on the primary."""
+        read_db = self.get_read_db()
+        if read_db is not self.primary:
+            try:
+                result = read_fn(read_db)
+                self._incr_stat('num_replica_reads')
+                return result
+            except Exception:
+                logger.exception('read failed on a replica, retrying on the primary')
+                self._incr_stat('num_replica_failures')
+                with self._lock:
+                    self._replica_lags[self.replicas.index(read_db)] = (None, time.time())
+        self._incr_stat('num_primary_reads')
+        return read_fn(self.primary)
+    
+    def _note_write(self):
+        self._state.did_write = True
+        self._state.is_pinned_to_primary = True
+        self._incr_stat('num_writes')
+    
+    def query(self, sql_query, *args, **kwargs):
+        if isinstance(sql_query, basestring) and self._READ_ONLY_SQL_RE.match(sql_query):
+            return self.run_read(lambda db: db.query(sql_query, *args, **kwargs))
+        self._note_write()
+        return self.primary.query(sql_query, *args, **kwargs)
+    
+    def select(self, *args, **kwargs):
+        return self.run_read(lambda db: db.select(*args, **kwargs))
+    
+    def where(self, *args, **kwargs):
+        return self.run_read(lambda db: db.where(*args, **kwargs))
+    
+    def insert(self, *args, **kwargs):
+        self._note_write()
+        return self.primary.insert(*args, **kwargs)
+    
+    def multiple_insert(self, *args, **kwargs):
+        self._note_write()
+        return self.primary.multiple_insert(*args, **kwargs)
+    
+    def update(self, *args, **kwargs):
+        self._note_write()
+        return self.primary.update(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        self._note_write()
+        return self.primary.delete(*args, **kwargs)
+    
+    def transaction(self):
+        self._note_write()
+        return self.primary.transaction()
+    
+    def get_stats(self):
+        with self._lock:
+            stats = self._stats.copy()
+            stats['replica_lag_secs'] = [self._replica_lags[i][0] for i in range(len(self.replicas))]
+            return stats
+
+class PgStatementRegistry(object):
+    """
+    named sql statements for the queries that run on (nearly) every request, so that they can be server-side prepared 
+    statements instead of getting parsed and planned by postgres every time.  the sql is written with web.py style 
+    $var_name placeholders.  on a PooledPostgresDB (with PG_PREPARED_STATEMENTS_ENABLED), a statement gets prepared 
+    once per pooled connection, the first time it runs there, and after that it's just executed with the bound values.  
+    otherwise it goes through pgdb.query like any other sql, so the statements have to work both ways.
+    """
+    _lock = threading.Lock()
+    # name -> (web.py sql, postgres sql with positional placeholders, var names in placeholder order)
+    _statements = {}
+    _stats = {'num_prepared_runs': 0, 'num_fallback_runs': 0}
+    
+    @classmethod
+    def register(cls, stmt_name, sql):
+        """returns stmt_name, for keeping in a class constant."""
+        var_names = []
+        def to_positional(match):
+            if match.group(1) not in var_names:
+                var_names.append(match.group(1))
+            return '$%i' % (var_names.index(match.group(1)) + 1)
+        pg_sql = re.sub(r'\$(\w+)', to_positional, sql)
+        with cls._lock:
+            assert stmt_name not in cls._statements or cls._statements[stmt_name][0] == sql, 'statement name already used: %s' % stmt_name
+            cls._statements[stmt_name] = (sql, pg_sql, var_names)
+        return stmt_name
+    
+    @classmethod
+    def query(cls, pgdb, stmt_name, stmt_vars):
+        """runs the statement, and returns its rows as a list of web.storage objects."""
+        if isinstance(pgdb, ReplicaRoutedDB):
+            # these are all lookups
+            return pgdb.run_read(lambda read_db: cls.query(read_db, stmt_name, stmt_vars))
+        sql, pg_sql, var_names = cls._statements[stmt_name]
+        if params.PG_PREPARED_STATEMENTS_ENABLED and isinstance(pgdb, PooledPostgresDB):
+            result = pgdb.execute_prepared(stmt_name, pg_sql, [stmt_vars[var_name] for var_name in var_names])
+            stat_name = 'num_prepared_runs'
+        else:
+            result = list(pgdb.query(sql, vars=stmt_vars))
+            stat_name = 'num_fallback_runs'
+        with cls._lock:
+            cls._stats[stat_name] += 1
+        return result
+    
+    @classmethod
+    def get_stats(cls):
+        with cls._lock:
+            return cls._stats.copy()
+
 class PgUtil(object):
     @staticmethod
-    def get_db_conn_ssl(dbname, username, password, hostaddr=params.PG_HOST_ADDR):
-        return web.database(dbn='postgres', sslmode='require', hostaddr=hostaddr, dbname=dbname, user=username, pw=password)
+    def _get_db_conn(**keywords):
+        if params.PG_POOL_ENABLED:
+            return PooledPostgresDB(**keywords)
+        return web.database(dbn='postgres', **keywords)
+    
+    @staticmethod
+    def get_db_conn_ssl(dbname, username, password, hostaddr=params.PG_HOST_ADDR, replica_settings_list=None):
+        """replica_settings_list is like params.PG_REPLICAS.  if there are any, the primary is wrapped in a ReplicaRoutedDB."""
+        keywords = {'sslmode': 'require', 'hostaddr': hostaddr, 'dbname': dbname, 'user': username, 'pw': password}
+        primary = PgUtil._get_db_conn(**keywords)
+        if not replica_settings_list:
+            return primary
+        replicas = [PgUtil._get_db_conn(**dict(keywords, **replica_settings)) for replica_settings in replica_settings_list]
+        return ReplicaRoutedDB(primary, replicas)
+    
+    @staticmethod
+    def get_primary_db(pgdb):
+        """for reads that can't be even a little stale, and for bookkeeping writes that shouldn't pin a client's reads to the primary."""
+        return pgdb.primary if isinstance(pgdb, ReplicaRoutedDB) else pgdb
     
     @staticmethod
     def get_next_seq_val(pgdb, seqname):
         return pgdb.query("select nextval($seqname) next_seq_val;", vars={'seqname': seqname})[0]['next_seq_val']
+    
+    @staticmethod
+    def encode_page_cursor(vals):
+        """an opaque cursor for the row with these values in the order by columns (see get_keyset_clauses)."""
+        return base64.urlsafe_b64encode(json.dumps(vals, default=str))
+    
+    @staticmethod
+    def decode_page_cursor(cursor, num_vals=None):
+        """raises ValueError if cursor isn't from encode_page_cursor (with num_vals values, unless num_vals is None)."""
+        try:
+            vals = json.loads(base64.urlsafe_b64decode(str(cursor)))
+        except (TypeError, UnicodeEncodeError):
+            raise ValueError('invalid page cursor: %s' % cursor)
+        if not isinstance(vals, list) or (num_vals is not None and len(vals) != num_vals):
+            raise ValueError('invalid page cursor: %s' % cursor)
+        return vals
+    
+    # how a timestamp comes out of encode_page_cursor (via str):  date, then optional time, fraction and utc offset
+    _KEYSET_TIMESTAMP_RE = re.compile(r'^(\d{4}-\d{2}-\d{2})(?:[ T](\d{2}:\d{2}:\d{2})(?:\.\d{1,6})?)?(?:[+-]\d{2}(?::?\d{2})?)?$')
+    
+    @staticmethod
+    def check_keyset_val(col, val):
+        """
+        the columns lists get ordered by are ids (ints) and timestamps, so a cursor value for a column named like an 
+        id has to be an int, and any other has to be a timestamp string.  raises ValueError if val isn't, so that a 
+        tampered cursor doesn't make it as far as postgres.
+        """
+        if col.split('.')[-1].endswith('_id'):
+            if not isinstance(val, (int, long)) or isinstance(val, bool):
+                raise ValueError('invalid page cursor value for %s: %r' % (col, val))
+            return
+        ts_match = PgUtil._KEYSET_TIMESTAMP_RE.match(val) if isinstance(val, basestring) else None
+        if ts_match is None:
+            raise ValueError('invalid page cursor value for %s: %r' % (col, val))
+        # strptime raises ValueError for things like a 13th month
+        time.strptime('%s %s' % (ts_match.group(1), ts_match.group(2) or '00:00:00'), '%Y-%m-%d %H:%M:%S')
+    
+    @staticmethod
+    def get_keyset_clauses(order_cols, after):
+        """
+        for keyset paging:  order_cols is a list of (column, is descending) pairs that make a total order, and after is 
+        a cursor from get_next_page_cursor (or None for the first page).  returns (where clause or None, its vars, order by 
+        clause).  the where clause picks out the rows past the cursor.  it's spelled out column by column, since the 
+        directions can differ, and so that an index on the order by columns gets used.  raises ValueError if after 
+        isn't a cursor for order_cols (see check_keyset_val).
+        """
+        order_clause = ', '.join(['%s %s' % (col, 'desc' if is_desc else 'asc') for col, is_desc in order_cols])
+        if after is None:
+            return None, {}, order_clause
+        after_vals = PgUtil.decode_page_cursor(after, len(order_cols))
+        for (col, is_desc), val in zip(order_cols, after_vals):
+            PgUtil.check_keyset_val(col, val)
+        after_vars = dict(('keyset_after_%i' % i, after_vals[i]) for i in range(len(order_cols)))
+        or_clauses = []
+        for i in range(len(order_cols)):
+            and_clauses = ['%s = $keyset_after_%i' % (order_cols[j][0], j) for j in range(i)]
+            and_clauses.append('%s %s $keyset_after_%i' % (order_cols[i][0], '<' if order_cols[i][1] else '>', i))
+            or_clauses.append('(%s)' % ' and '.join(and_clauses))
+        return '(%s)' % ' or '.join(or_clauses), after_vars, order_clause
+    
+    @staticmethod
+    def get_next_page_cursor(rows, order_cols, limit):
+        """the cursor for the page after rows, or None if rows came up short of limit (i.e. it's the last page)."""
+        if limit is None or len(rows) < limit:
+            return None
+        # rows have attributes named for the columns, without any table alias
+        return PgUtil.encode_page_cursor([getattr(rows[-1], col.split('.')[-1]) for col, is_desc in order_cols])
+    
+    @staticmethod
+    def get_next_seq_vals(pgdb, seqname, num_vals):
+        query_results = pgdb.query("select nextval($seqname) next_seq_val from generate_series(1, $num_vals);", 
+                                    vars={'seqname': seqname, 'num_vals': num_vals})
+        return [row['next_seq_val'] for row in query_results]
+
+class UniqueIdAllocator(object):
+    """
+    hands out values from a postgres sequence, fetching them a block at a time (hi/lo style) so that most calls 
+    don't need a round trip.  one allocator per sequence per process, via get_allocator.  ids get used in the order 
+    they were fetched, but since other processes are pulling from the same sequence, they're unique and not 
+    necessarily contiguous.  ids still buffered when the process exits never get used, which is fine since 
+    nothing cares about gaps, but the number wasted is tracked in case the block size needs tuning.
+    """
+    _allocators = {}
+    _allocators_lock = threading.Lock()
+    
+    def __init__(self, seqname, block_size=params.UNIQUE_ID_BLOCK_SIZE):
+        self.seqname = seqname
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._available_ids = collections.deque()
+        self._num_refills = 0
+        self._num_ids_fetched = 0
+        self._num_ids_issued = 0
+        self._num_ids_wasted = 0
+    
+    @classmethod
+    def get_allocator(cls, seqname):
+        with cls._allocators_lock:
+            if seqname not in cls._allocators:
+                allocator = cls(seqname)
+                cls._allocators[seqname] = allocator
+                atexit.register(allocator.shutdown)
+            return cls._allocators[seqname]
+    
+    def _fetch_ids(self, pgdb, num_ids):
+        # caller should hold self._lock
+        fetched_ids = PgUtil.get_next_seq_vals(pgdb, self.seqname, num_ids)
+        self._num_refills += 1
+        self._num_ids_fetched += len(fetched_ids)
+        return fetched_ids
+    
+    def get_next_id(self, pgdb):
+        with self._lock:
+            if not self._available_ids:
+                self._available_ids.extend(self._fetch_ids(pgdb, self.block_size))
+            self._num_ids_issued += 1
+            return self._available_ids.popleft()
+    
+    def reserve_ids(self, pgdb, num_ids):
+        """returns a list of num_ids ids, taking what's already buffered first and fetching the rest in one query."""
+        with self._lock:
+            reserved_ids = []
+            while self._available_ids and len(reserved_ids) < num_ids:
+                reserved_ids.append(self._available_ids.popleft())
+            if len(reserved_ids) < num_ids:
+                reserved_ids.extend(self._fetch_ids(pgdb, num_ids - len(reserved_ids)))
+            self._num_ids_issued += len(reserved_ids)
+            return reserved_ids
+    
+    def shutdown(self):
+        """discards any buffered ids.  gets called at exit, but can be called any time (e.g. when switching databases)."""
+        with self._lock:
+            num_discarded = len(self._available_ids)
+            self._available_ids.clear()
+            self._num_ids_wasted += num_discarded
+        if num_discarded > 0:
+            logger.info('discarded %i unused ids from %s' % (num_discarded, self.seqname))
+    
+    def get_metrics(self):
+        with self._lock:
+            return {'seqname': self.seqname,
+                    'block_size': self.block_size,
+                    'num_refills': self._num_refills,
+                    'num_ids_fetched': self._num_ids_fetched,
+                    'num_ids_issued': self._num_ids_issued,
+                    'num_ids_buffered': len(self._available_ids),
+                    'num_ids_wasted': self._num_ids_wasted}
 
-#TODO: should have default sort orders for queries
 class PgPersistent(object):
     """
     subclass this and define the following constants to facilitate simple object/row mapping:
@@ -41,15 +682,46 @@ class PgPersistent(object):
      PK_COL_NAME: the name of the primary key column in the table 
      SEQ_NAME: name of the sequence from which the PK col is populated.
      FIELD_NAMES: a list of strings representing the names of the columns in the table.
+    
+    _get_obj_list always returns rows in a total order (DEFAULT_ORDER, if the subclass sets it, followed by the PK), so 
+    that lists can be paged by keyset:  pass limit, and then get_next_page_cursor's cursor as after, to get the next page.
+    
+    objects loaded from the db are instances of a subclass generated from FIELD_NAMES (see _get_row_class), which keeps 
+    the fields in __slots__ instead of a per-object __dict__.  they're still instances of the subclass that loaded them, 
+    and can still be given attributes outside of FIELD_NAMES (those just land in a __dict__ as usual).  use as_dict 
+    rather than __dict__ to get at an object's fields.
     """
+    DEFAULT_ORDER = None
 
+    @classmethod
+    def _get_row_class(cls):
+        # looked up in cls.__dict__, since a subclass would otherwise get its parent's row class
+        if cls.__dict__.get('_is_row_class'):
+            return cls
+        row_class = cls.__dict__.get('_row_class')
+        if row_class is None:
+            row_class = type(cls.__name__, (cls,), {'__slots__': tuple(cls.FIELD_NAMES), '_is_row_class': True, '__module__': cls.__module__})
+            cls._row_class = row_class
+        return row_class
+    
+    @classmethod
+    def iter_objs_from_query_results(cls, query_results):
+        """lazily turns query result rows into objects (of the row class), one per row as they're iterated over."""
+        row_class = cls._get_row_class()
+        new_obj = row_class.__new__
+        field_setters = [(field_name, getattr(row_class, field_name).__set__) for field_name in cls.FIELD_NAMES]
+        should_massage = cls._massage_raw_pg_output_vals.im_func is not PgPersistent._massage_raw_pg_output_vals.im_func
+        for query_row in query_results:
+            obj = new_obj(row_class)
+            for field_name, set_field in field_setters:
+                set_field(obj, query_row[field_name])
+            if should_massage:
+                obj._massage_raw_pg_output_vals()
+            yield obj
+    
     @classmethod
     def _create_instance_from_query_row(cls, query_row):
-        result = cls()
-        for field_name in cls.FIELD_NAMES:
-            setattr(result, field_name, query_row[field_name])
-        result._massage_raw_pg_output_vals()
-        return result
+        return next(cls.iter_objs_from_query_results([query_row]))
 
     @classmethod
     def _get_single_obj_instance(cls, pgdb, where_clause_vars):
@@ -60,13 +732,68 @@ class PgPersistent(object):
             return None
 
     @classmethod
-    def _get_obj_list(cls, pgdb, where_clause_vars, order=None):
-        query_results = pgdb.where(cls.TABLE_NAME, order=order, **where_clause_vars)
+    def _get_single_obj_instance_prepared(cls, pgdb, stmt_name, stmt_vars):
+        """like _get_single_obj_instance, but with a PgStatementRegistry statement."""
+        query_results = PgStatementRegistry.query(pgdb, stmt_name, stmt_vars)
+        if len(query_results) == 1:
+            return cls._create_instance_from_query_row(query_results[0])
+        else:
+            return None
+
+    @classmethod
+    def _get_order_cols(cls, order):
+        """
+        order is an order by clause with plain column names, like 'creation_date desc, username' (None for DEFAULT_ORDER).  
+        returns it as a list of (column, is descending) pairs, with the PK added at the end (same direction as the last 
+        column) if it isn't there already, so that the order is total.
+        """
+        order_cols = []
+        for order_term in (order or cls.DEFAULT_ORDER or '').split(','):
+            order_term_parts = order_term.split()
+            if order_term_parts:
+                order_cols.append((order_term_parts[0], len(order_term_parts) > 1 and order_term_parts[1].lower() == 'desc'))
+        if cls.PK_COL_NAME not in [col for col, is_desc in order_cols]:
+            order_cols.append((cls.PK_COL_NAME, order_cols[-1][1] if order_cols else False))
+        return order_cols
+    
+    @classmethod
+    def _get_obj_list(cls, pgdb, where_clause_vars, order=None, after=None, limit=None):
+        """after is a cursor from get_next_page_cursor, and raises ValueError if it isn't one."""
+        keyset_where_clause, query_vars, order_clause = PgUtil.get_keyset_clauses(cls._get_order_cols(order), after)
+        where_clauses = ['%s = $%s' % (field_name, field_name) for field_name in sorted(where_clause_vars.keys())]
+        if keyset_where_clause is not None:
+            where_clauses.append(keyset_where_clause)
+        query_vars.update(where_clause_vars)
+        query_results = pgdb.select(cls.TABLE_NAME, where=' and '.join(where_clauses) or None, vars=query_vars, order=order_clause, limit=limit)
+        return cls._query_results_to_obj_list(query_results)
+    
+    @classmethod
+    def get_next_page_cursor(cls, objs, limit, order=None):
+        """the after cursor for the page following objs (from _get_obj_list with the same order and limit), or None if that was the last page."""
+        return PgUtil.get_next_page_cursor(objs, cls._get_order_cols(order), limit)
+    
+    @classmethod
+    def get_obj_chunk_after_pk(cls, pgdb, after_pk_val, chunk_size):
+        """keyset paging by PK:  returns up to chunk_size objects with PKs greater than after_pk_val (None for the start), in PK order."""
+        where_clause = '%s > $after_pk_val' % cls.PK_COL_NAME if after_pk_val is not None else None
+        query_results = pgdb.select(cls.TABLE_NAME, where=where_clause, vars={'after_pk_val': after_pk_val}, 
+                                    order=cls.PK_COL_NAME, limit=chunk_size)
         return cls._query_results_to_obj_list(query_results)
     
     @classmethod
     def _query_results_to_obj_list(cls, query_results):
-        return map(cls._create_instance_from_query_row, query_results)
+        return list(cls.iter_objs_from_query_results(query_results))
+    
+    @classmethod
+    def _get_obj_iter(cls, pgdb, where_clause_vars, order=None):
+        """like _get_obj_list, but the objects get built as they're iterated over, instead of all up front."""
+        return cls.iter_objs_from_query_results(pgdb.where(cls.TABLE_NAME, order=order, **where_clause_vars))
+    
+    def as_dict(self):
+        """the object's fields (and any other attributes it's been given), as a new dict."""
+        obj_dict = dict((field_name, getattr(self, field_name)) for field_name in self.FIELD_NAMES if hasattr(self, field_name))
+        obj_dict.update(getattr(self, '__dict__', {}))
+        return obj_dict
     
     def _ins_obj_instance_and_set_pk_att(self, pgdb, ins_params=None):
         if ins_params == None:
@@ -74,6 +801,39 @@ class PgPersistent(object):
         pk_val = pgdb.insert(self.TABLE_NAME, seqname=self.SEQ_NAME, **ins_params)
         setattr(self, self.PK_COL_NAME, pk_val)
     
+    @classmethod
+    def _bulk_ins_obj_instances_and_set_pk_atts(cls, pgdb, objs, ins_params_list=None, chunk_size=params.PG_BULK_INSERT_CHUNK_SIZE):
+        """
+        the many-rows version of _ins_obj_instance_and_set_pk_att, all in one transaction.  ins_params_list has a dict of 
+        values for each of objs (their __dict__s by default), and the dicts all need the same keys.  the PKs all come from 
+        SEQ_NAME up front in one query, so the rows can then go in as multi-row inserts of chunk_size rows each, without 
+        having to match up RETURNING output with the objects.
+        """
+        if ins_params_list is None:
+            ins_params_list = [obj.__dict__.copy() for obj in objs]
+        if len(ins_params_list) != len(objs):
+            raise ValueError('got %i objects but %i sets of insert params' % (len(objs), len(ins_params_list)))
+        if not objs:
+            return
+        col_names = sorted(ins_params_list[0].keys())
+        if cls.PK_COL_NAME in col_names:
+            col_names.remove(cls.PK_COL_NAME)
+        
+        with pgdb.transaction():
+            pk_vals = PgUtil.get_next_seq_vals(pgdb, cls.SEQ_NAME, len(objs))
+            rows = []
+            for ins_params, pk_val in zip(ins_params_list, pk_vals):
+                if set(ins_params.keys()) - set([cls.PK_COL_NAME]) != set(col_names):
+                    raise ValueError('all the rows in a bulk insert need the same columns.  expected %s, got %s' % (col_names, sorted(ins_params.keys())))
+                # built in the same order every time, since web.py checks that each row's keys() match the first row's
+                row = dict([(cls.PK_COL_NAME, pk_val)] + [(col_name, ins_params[col_name]) for col_name in col_names])
+                rows.append(row)
+            for i in range(0, len(rows), chunk_size):
+                pgdb.multiple_insert(cls.TABLE_NAME, rows[i:i+chunk_size], seqname=False)
+        
+        for obj, pk_val in zip(objs, pk_vals):
+            setattr(obj, cls.PK_COL_NAME, pk_val)
+    
     def _massage_raw_pg_output_vals(self):
         """
         subclasses should implement this method if _create_instance_from_query_row 
@@ -86,6 +846,412 @@ class PgPersistent(object):
         pass
 
 
+class NeoRequestError(Exception):
+    """a non-2xx response from neo via NeoHttpPool.  message and stacktrace are filled in from neo's error body, if it sent one."""
+    def __init__(self, status, message, exception=None, stacktrace=None):
+        super(NeoRequestError, self).__init__(message)
+        self.status = status
+        self.message = message
+        self.exception = exception
+        self.stacktrace = stacktrace if stacktrace is not None else []
+
+class NeoHttpPool(object):
+    """
+    a pool of keep-alive HTTP connections to one neo server, shared by all threads in the process (get one with 
+    get_pool).  at most max_size connections are open at once; a thread that needs one when they're all in use waits 
+    up to wait_timeout_secs for one to be returned.  connect_timeout_secs applies to opening a connection, 
+    read_timeout_secs to each request made on it.
+    
+    an idle connection the server has since closed only shows up as an error on the next request, so a request that
+    fails that way on a reused connection gets retried once on a fresh one.  that's only when neo can't have gotten the
+    request:  the send failed with a reset or broken pipe, or the connection dropped before any of the response came
+    back.  anything else (a timeout in particular) could mean the request ran, and writes mustn't run twice.
+    """
+    class PoolTimeoutError(Exception):
+        pass
+    
+    class _StaleConnectionError(Exception):
+        """a reused connection turned out to be dead before neo could've gotten the request, so it's safe to send again."""
+        pass
+    
+    _RESENDABLE_ERRNOS = frozenset([errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED])
+    
+    _pools = {}
+    _pools_lock = threading.Lock()
+    
+    def __init__(self, db_uri, max_size=params.NEO_HTTP_POOL_MAX_SIZE, connect_timeout_secs=params.NEO_HTTP_CONNECT_TIMEOUT_SECS, 
+                    read_timeout_secs=params.NEO_HTTP_READ_TIMEOUT_SECS, wait_timeout_secs=params.NEO_HTTP_POOL_WAIT_TIMEOUT_SECS):
+        parsed_uri = urlparse.urlparse(db_uri)
+        self.scheme = parsed_uri.scheme
+        self.host = parsed_uri.hostname
+        self.port = parsed_uri.port
+        self.max_size = max_size
+        self.connect_timeout_secs = connect_timeout_secs
+        self.read_timeout_secs = read_timeout_secs
+        self.wait_timeout_secs = wait_timeout_secs
+        
+        self._cond = threading.Condition()
+        self._idle_conns = []
+        self._num_in_use = 0
+        self._stats = {'num_requests': 0, 'num_conns_opened': 0, 'num_conns_discarded': 0, 'num_retries': 0, 
+                        'num_waits': 0, 'total_wait_secs': 0.0, 'max_wait_secs': 0.0}
+    
+    @classmethod
+    def get_pool(cls, db_uri):
+        parsed_uri = urlparse.urlparse(db_uri)
+        pool_key = (parsed_uri.scheme, parsed_uri.hostname, parsed_uri.port)
+        with cls._pools_lock:
+            if pool_key not in cls._pools:
+                cls._pools[pool_key] = cls(db_uri)
+            return cls._pools[pool_key]
+    
+    @classmethod
+    def get_all_stats(cls):
+        with cls._pools_lock:
+            pools = cls._pools.items()
+        return dict(('%s://%s:%s' % pool_key, pool.get_stats()) for pool_key, pool in pools)
+    
+    def _open_conn(self):
+        conn_class = httplib.HTTPSConnection if self.scheme == 'https' else httplib.HTTPConnection
+        conn = conn_class(self.host, self.port, timeout=self.connect_timeout_secs)
+        conn.connect()
+        conn.sock.settimeout(self.read_timeout_secs)
+        return conn
+    
+    def _acquire(self):
+        """returns (conn, is_reused)."""
+        with self._cond:
+            wait_start_time = None
+            while not self._idle_conns and self._num_in_use >= self.max_size:
+                if wait_start_time is None:
+                    wait_start_time = time.time()
+                    self._stats['num_waits'] += 1
+                remaining_secs = self.wait_timeout_secs - (time.time() - wait_start_time)
+                if remaining_secs <= 0:
+                    self._stats['total_wait_secs'] += time.time() - wait_start_time
+                    raise self.PoolTimeoutError('no neo connection free after %s secs' % self.wait_timeout_secs)
+                self._cond.wait(remaining_secs)
+            if wait_start_time is not None:
+                wait_secs = time.time() - wait_start_time
+                self._stats['total_wait_secs'] += wait_secs
+                self._stats['max_wait_secs'] = max(self._stats['max_wait_secs'], wait_secs)
+            
+            self._num_in_use += 1
+            if self._idle_conns:
+                return self._idle_conns.pop(), True
+        
+        try:
+            conn = self._open_conn()
+        except:
+            self._release(None)
+            raise
+        with self._cond:
+            self._stats['num_conns_opened'] += 1
+        return conn, False
+    
+    def _release(self, conn):
+        """returns conn to the pool, or just frees its slot if conn is None (i.e. it was closed)."""
+        with self._cond:
+            self._num_in_use -= 1
+            if conn is not None:
+                self._idle_conns.append(conn)
+            else:
+                self._stats['num_conns_discarded'] += 1
+            self._cond.notify()
+    
+    def _acquire_fresh(self):
+        conn, is_reused = self._acquire()
+        if not is_reused:
+            return conn
+        conn.close()
+        try:
+            conn = self._open_conn()
+        except:
+            self._release(None)
+            raise
+        with self._cond:
+            self._stats['num_conns_discarded'] += 1
+            self._stats['num_conns_opened'] += 1
+        return conn
+    
+    @classmethod
+    def _is_safe_to_resend(cls, ex):
+        """whether ex, from sending a request or waiting for its status line, means the server never got the request."""
+        if isinstance(ex, socket.timeout):
+            return False
+        if isinstance(ex, httplib.BadStatusLine):
+            # the connection closed without a byte of response (older pythons report that as a line of "''")
+            return ex.line in ("''", '""') or ex.line.startswith('No status line received')
+        if isinstance(ex, socket.error):
+            return ex.errno in cls._RESENDABLE_ERRNOS
+        return False
+    
+    def _send(self, conn, method, path, encoded_body, headers, is_reused, should_read_body=True):
+        """
+        returns (resp, resp body), or (resp, None) if not should_read_body.  on failure, the conn is closed and its slot
+        freed, and if it was a reused conn that died before the request got to neo, _StaleConnectionError is raised.
+        """
+        try:
+            conn.request(method, path, encoded_body, headers)
+            resp = conn.getresponse()
+        except (httplib.HTTPException, socket.error) as ex:
+            conn.close()
+            self._release(None)
+            if is_reused and self._is_safe_to_resend(ex):
+                raise self._StaleConnectionError(ex)
+            raise
+        if not should_read_body:
+            return resp, None
+        try:
+            return resp, resp.read()
+        except (httplib.HTTPException, socket.error):
+            conn.close()
+            self._release(None)
+            raise
+    
+    def _send_with_retry(self, method, path, encoded_body, headers, should_read_body=True):
+        """returns (conn, resp, resp body) from _send, resending once on a fresh conn if the first one was stale."""
+        conn, is_reused = self._acquire()
+        try:
+            resp, resp_body = self._send(conn, method, path, encoded_body, headers, is_reused, should_read_body)
+        except self._StaleConnectionError:
+            # most likely the server closed the idle connection, so try once more on a new one
+            with self._cond:
+                self._stats['num_retries'] += 1
+            conn = self._acquire_fresh()
+            resp, resp_body = self._send(conn, method, path, encoded_body, headers, False, should_read_body)
+        return conn, resp, resp_body
+    
+    def request(self, method, uri, body=None):
+        """sends body (json encoded, if not None) to uri, and returns the json decoded response body (None if empty)."""
+        path = urlparse.urlparse(uri).path or '/'
+        encoded_body = json.dumps(body) if body is not None else None
+        headers = {'Accept': 'application/json', 'Content-Type': 'application/json'}
+        
+        conn, resp, resp_body = self._send_with_retry(method, path, encoded_body, headers)
+        self._release_after_response(conn, resp)
+        return self._decode_response_body(resp, resp_body)
+    
+    def _release_after_response(self, conn, resp):
+        if (resp.getheader('connection') or '').lower() == 'close':
+            conn.close()
+            self._release(None)
+        else:
+            self._release(conn)
+        with self._cond:
+            self._stats['num_requests'] += 1
+    
+    @staticmethod
+    def _decode_response_body(resp, resp_body):
+        try:
+            decoded_body = json.loads(resp_body) if resp_body else None
+        except ValueError:
+            if resp.status < 400:
+                raise
+            decoded_body = None
+        if resp.status >= 400:
+            error_info = decoded_body if isinstance(decoded_body, dict) else {}
+            raise NeoRequestError(resp.status, error_info.get('message', resp.reason), error_info.get('exception'), error_info.get('stacktrace'))
+        return decoded_body
+    
+    def request_stream(self, method, uri, body=None, read_size=params.NEO_HTTP_STREAM_READ_SIZE):
+        """
+        like request, but a generator of the raw response body, in strings of up to read_size bytes, read off the socket 
+        as the caller asks for them.  the connection stays checked out of the pool until the body's been read to the end.  
+        if the caller stops early (i.e. closes the generator), the connection gets closed, since it's mid-response.
+        """
+        path = urlparse.urlparse(uri).path or '/'
+        encoded_body = json.dumps(body) if body is not None else None
+        headers = {'Accept': 'application/json', 'Content-Type': 'application/json'}
+        
+        conn, resp, resp_body = self._send_with_retry(method, path, encoded_body, headers, should_read_body=False)
+        
+        if resp.status >= 400:
+            # error bodies are small, and need to be read whole to get the error info out of them
+            try:
+                resp_body = resp.read()
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                self._release(None)
+                raise
+            self._release_after_response(conn, resp)
+            self._decode_response_body(resp, resp_body)
+        
+        is_fully_read = False
+        try:
+            while True:
+                chunk = resp.read(read_size)
+                if not chunk:
+                    break
+                yield chunk
+            is_fully_read = True
+        finally:
+            if is_fully_read:
+                self._release_after_response(conn, resp)
+            else:
+                conn.close()
+                self._release(None)
+    
+    def close_idle_conns(self):
+        with self._cond:
+            idle_conns = self._idle_conns
+            self._idle_conns = []
+        for conn in idle_conns:
+            conn.close()
+    
+    def get_stats(self):
+        with self._cond:
+            stats = self._stats.copy()
+            stats.update({'num_in_use': self._num_in_use, 'num_idle': len(self._idle_conns), 'max_size': self.max_size})
+            return stats
+
+class NeoRestElement(dict):
+    """a node or relationship from a raw neo REST response, with the bit of the py2neo interface the rest of tripel uses."""
+    def get_properties(self):
+        return self.get('data', {})
+    
+    @classmethod
+    def wrap_if_element(cls, val):
+        return cls(val) if isinstance(val, dict) and 'self' in val and 'data' in val else val
+
+
+class NeoIndexRegistry(object):
+    """
+    process-wide cache of neo (legacy) index handles, so that looking something up in an index doesn't cost a 
+    get_or_create_index round trip first.  each index gets resolved (and created if need be) the first time it's asked 
+    for, and the handle is reused after that.  the config an index was first asked for with is remembered, so if 
+    the index turns out to have disappeared from the server (a lookup 404s), it can be re-resolved the same way.
+    """
+    NODE_INDEX = 'node'
+    RELATIONSHIP_INDEX = 'relationship'
+    
+    _lock = threading.Lock()
+    _handles = {}
+    _configs = {}
+    _stats = {'num_hits': 0, 'num_misses': 0, 'num_re_resolves': 0}
+    
+    @classmethod
+    def _get_py2neo_class(cls, element_type):
+        return neo4j.Node if element_type == cls.NODE_INDEX else neo4j.Relationship
+    
+    @classmethod
+    def get_index(cls, neodb, element_type, index_name, config=None):
+        handle_key = (NeoUtil.get_db_uri(neodb), element_type, index_name)
+        with cls._lock:
+            if config is not None:
+                cls._configs[(element_type, index_name)] = config
+            if handle_key in cls._handles:
+                cls._stats['num_hits'] += 1
+                return cls._handles[handle_key]
+            cls._stats['num_misses'] += 1
+            config = cls._configs.get((element_type, index_name))
+        
+        # resolve outside the lock, since it's a round trip.  if two threads race to resolve, they get the same index.
+        index = neodb.get_or_create_index(cls._get_py2neo_class(element_type), index_name, config=config)
+        with cls._lock:
+            cls._handles[handle_key] = index
+        return index
+    
+    @classmethod
+    def forget_index(cls, neodb, element_type, index_name):
+        with cls._lock:
+            cls._handles.pop((NeoUtil.get_db_uri(neodb), element_type, index_name), None)
+    
+    @classmethod
+    def get_entities(cls, neodb, element_type, index_name, key, value):
+        """exact match lookup of key=value in the named index.  returns a list of the matching nodes/relationships."""
+        try:
+            return cls._get_entities(neodb, element_type, index_name, key, value)
+        except (NeoRequestError, rest.ResourceNotFound) as ex:
+            if isinstance(ex, NeoRequestError) and ex.status != 404:
+                raise
+            logger.warn('%s index %s not found on %s, re-resolving' % (element_type, index_name, NeoUtil.get_db_uri(neodb)))
+            cls.forget_index(neodb, element_type, index_name)
+            with cls._lock:
+                cls._stats['num_re_resolves'] += 1
+            return cls._get_entities(neodb, element_type, index_name, key, value)
+    
+    @classmethod
+    def _get_entities(cls, neodb, element_type, index_name, key, value):
+        index = cls.get_index(neodb, element_type, index_name)
+        if not NeoUtil.is_http_pool_enabled():
+            return index.get(key, value)
+        
+        lookup_uri = '%s/%s/%s' % (NeoUtil.get_resource_uri(index).rstrip('/'), urllib.quote(key, ''), urllib.quote(str(value), ''))
+        return map(NeoRestElement.wrap_if_element, NeoUtil.get_http_pool(neodb).request('GET', lookup_uri))
+    
+    @classmethod
+    def get_stats(cls):
+        with cls._lock:
+            stats = cls._stats.copy()
+            stats['num_handles'] = len(cls._handles)
+            return stats
+
+
+class GremlinLibRegistry(object):
+    """
+    keeps the gremlin library code (e.g. GremlinUtils) loaded once per process, keyed by a hash of its content, and 
+    keeps track of which neo4j servers have had that library installed into their gremlin interpreter.  this lets 
+    NeoUtil send just the generated statement block for each write, instead of prefixing every script with the 
+    full library source (which the server then has to recompile every time).
+    
+    a server that gets restarted forgets the library.  that shows up as a MissingPropertyException when a script 
+    references GremlinUtils, at which point the library gets re-installed and the script retried.  if a server 
+    still can't find the library after a fresh install (i.e., it doesn't keep class definitions between scripts), 
+    it gets flagged as non-caching, and scripts sent to it fall back to having the library code in-lined.
+    """
+    _lock = threading.Lock()
+    _loaded_libs = {}
+    _installed_lib_hashes = {}
+    _non_caching_servers = set()
+    
+    @classmethod
+    def get_lib(cls, script_file_names=params.GREMLIN_LIB_FILES):
+        """returns a (lib_hash, lib_scripts) tuple.  the files are only read from disk the first time they're asked for."""
+        lib_key = tuple(script_file_names)
+        with cls._lock:
+            if lib_key not in cls._loaded_libs:
+                lib_scripts = map(util.get_file_contents, script_file_names)
+                lib_hash = hashlib.sha1('\n'.join(lib_scripts)).hexdigest()
+                cls._loaded_libs[lib_key] = (lib_hash, lib_scripts)
+            return cls._loaded_libs[lib_key]
+    
+    @classmethod
+    def is_installed(cls, neodb, script_file_names=params.GREMLIN_LIB_FILES):
+        lib_hash, lib_scripts = cls.get_lib(script_file_names)
+        with cls._lock:
+            return lib_hash in cls._installed_lib_hashes.get(NeoUtil.get_db_uri(neodb), set())
+    
+    @classmethod
+    def install(cls, neodb, script_file_names=params.GREMLIN_LIB_FILES):
+        lib_hash, lib_scripts = cls.get_lib(script_file_names)
+        NeoUtil.init_gremlin_env(neodb, lib_scripts)
+        with cls._lock:
+            cls._installed_lib_hashes.setdefault(NeoUtil.get_db_uri(neodb), set()).add(lib_hash)
+        logger.info('installed gremlin lib %s on %s' % (lib_hash, NeoUtil.get_db_uri(neodb)))
+    
+    @classmethod
+    def ensure_installed(cls, neodb, script_file_names=params.GREMLIN_LIB_FILES):
+        if not cls.is_installed(neodb, script_file_names):
+            cls.install(neodb, script_file_names)
+    
+    @classmethod
+    def forget_installs(cls, neodb):
+        """call when the server has evidently lost the library (e.g. after a restart)."""
+        with cls._lock:
+            cls._installed_lib_hashes.pop(NeoUtil.get_db_uri(neodb), None)
+    
+    @classmethod
+    def mark_non_caching(cls, neodb):
+        with cls._lock:
+            cls._non_caching_servers.add(NeoUtil.get_db_uri(neodb))
+    
+    @classmethod
+    def is_non_caching(cls, neodb):
+        with cls._lock:
+            return NeoUtil.get_db_uri(neodb) in cls._non_caching_servers
+
+
 class NeoUtil(object):
     '''
     TODO: this needs to be re-worked in light of neo4j 2.0 and its support of proper transactions via REST.
@@ -99,6 +1265,21 @@ class NeoUtil(object):
           *should probably rip out anything that's unused after the conversion (which will likely be anything gremlin 
           related).  (too bad, that was fun to write, but native's better and clutter's bad)
     '''
+    STMT_BACKEND_GREMLIN = 'gremlin'
+    STMT_BACKEND_REST_BATCH = 'rest_batch'
+    
+    class StmtResultRef(object):
+        """
+        stands in for the result of an earlier stmt_def in the same batch, wherever a stmt_def would otherwise take 
+        node lookup info (e.g. the endpoints of createAndIndexEdge).  this way a node created earlier in the batch 
+        can be linked to directly, instead of being looked up again by its unique id.
+        """
+        def __init__(self, stmt_def):
+            self.stmt_def = stmt_def
+    
+    # what a failed gremlin script can come back as, depending on whether NeoHttpPool is in use
+    BAD_REQUEST_ERRORS = (rest.BadRequest, NeoRequestError)
+    
     class TripelBatch(neo4j.WriteBatch):
         def __enter__(self):
             return self
@@ -113,10 +1294,79 @@ class NeoUtil(object):
         return neo4j.GraphDatabaseService(db_uri)
     
     @staticmethod
-    def _execute_parameterized_gremlin_script(neodb, script, params):
+    def get_resource_uri(resource):
+        return str(getattr(resource, '__uri__', None) or resource._uri)
+    
+    @classmethod
+    def get_db_uri(cls, neodb):
+        db_uri = cls.get_resource_uri(neodb)
+        return db_uri if db_uri.endswith('/') else db_uri + '/'
+    
+    @staticmethod
+    def is_http_pool_enabled():
+        return params.NEO_HTTP_POOL_ENABLED
+    
+    @classmethod
+    def get_http_pool(cls, neodb):
+        return NeoHttpPool.get_pool(cls.get_db_uri(neodb))
+    
+    @classmethod
+    def run_rest_batch(cls, neodb, jobs):
+        """sends jobs to the REST batch endpoint (one transaction for the lot), and returns the list of job results."""
+        db_uri = cls.get_db_uri(neodb)
+        if cls.is_http_pool_enabled():
+            return cls.get_http_pool(neodb).request('POST', db_uri + 'batch', jobs)
+        else:
+            req = rest.Request(neodb, "POST", db_uri + 'batch', jobs)
+            logger.debug('req.body = %s' % req.body)
+            return neodb._send(req).body
+    
+    @classmethod
+    def execute_cypher(cls, neodb, query, query_params):
+        """returns the list of result rows.  nodes and relationships in the rows will have get_properties, as with py2neo."""
+        if not cls.is_http_pool_enabled():
+            return cypher.execute(neodb, query, query_params)[0]
+        
+        resp_body = cls.get_http_pool(neodb).request('POST', cls.get_db_uri(neodb) + 'cypher', {'query': query, 'params': query_params})
+        return [map(NeoRestElement.wrap_if_element, row) for row in resp_body['data']]
+    
+    @classmethod
+    def iter_cypher_rows(cls, neodb, query, query_params):
+        """
+        like execute_cypher, but a generator of rows.  through NeoHttpPool, the rows get parsed as the response comes in, so 
+        the whole result is never in memory at once (and the pooled connection is tied up until the last row's been read).  
+        py2neo reads the whole response before returning anything, so without the pool this just loops over execute_cypher.
+        """
+        if not cls.is_http_pool_enabled():
+            for row in cls.execute_cypher(neodb, query, query_params):
+                yield row
+            return
+        
+        resp_chunks = cls.get_http_pool(neodb).request_stream('POST', cls.get_db_uri(neodb) + 'cypher', {'query': query, 'params': query_params})
+        try:
+            for row in util.iter_json_array_items(resp_chunks, 'data'):
+                yield map(NeoRestElement.wrap_if_element, row)
+        finally:
+            resp_chunks.close()
+    
+    @classmethod
+    def get_indexed_nodes(cls, neodb, index_name, key, value):
+        return NeoIndexRegistry.get_entities(neodb, NeoIndexRegistry.NODE_INDEX, index_name, key, value)
+    
+    @classmethod
+    def get_single_indexed_node(cls, neodb, index_name, key, value):
+        indexed_nodes = cls.get_indexed_nodes(neodb, index_name, key, value)
+        return indexed_nodes[0] if indexed_nodes else None
+    
+    @classmethod
+    def _execute_parameterized_gremlin_script(cls, neodb, script, params):
         '''
         ripped off and repurposed http://pythonhosted.org/py2neo/_modules/py2neo/gremlin.html#execute
         '''
+        if cls.is_http_pool_enabled():
+            uri = cls.get_db_uri(neodb) + 'ext/GremlinPlugin/graphdb/execute_script'
+            return cls.get_http_pool(neodb).request('POST', uri, {'script': script, 'params': params})
+        
         try:
             uri = neodb._extension_uri('GremlinPlugin', 'execute_script')
         except NotImplementedError:
@@ -128,14 +1378,18 @@ class NeoUtil(object):
     
     @classmethod
     def get_gremlin_lib_scripts(cls, script_file_names=params.GREMLIN_LIB_FILES):
-        #TODO: should really avoid loading from disk every time
-        return map(util.get_file_contents, script_file_names)
+        lib_hash, lib_scripts = GremlinLibRegistry.get_lib(script_file_names)
+        return lib_scripts
     
     @classmethod
     def init_gremlin_env(cls, neodb, gremlin_scripts=None):
         gremlin_scripts = gremlin_scripts if gremlin_scripts is not None else cls.get_gremlin_lib_scripts()
         return map(lambda x: cls._execute_parameterized_gremlin_script(neodb, x, None), gremlin_scripts)
     
+    @staticmethod
+    def _is_missing_lib_error(br_ex):
+        return br_ex.message.find("javax.script.ScriptException: groovy.lang.MissingPropertyException:") == 0
+    
     @classmethod
     def _execute_gremlin_script_with_lazy_init(cls, neodb, script, params):
         '''
@@ -143,8 +1397,8 @@ class NeoUtil(object):
         '''
         try:
             return cls._execute_parameterized_gremlin_script(neodb, script, params)
-        except rest.BadRequest as br_ex:
-            if br_ex.message.find("javax.script.ScriptException: groovy.lang.MissingPropertyException:") == 0:
+        except cls.BAD_REQUEST_ERRORS as br_ex:
+            if cls._is_missing_lib_error(br_ex):
                 cls.init_gremlin_env(neodb)
                 return cls._execute_parameterized_gremlin_script(neodb, script, params)
             else:
@@ -153,7 +1407,41 @@ class NeoUtil(object):
                 raise br_ex
     
     @classmethod
-    def run_gremlin_statements(cls, neodb, stmt_defs, should_run_in_transaction=True, should_lazy_init=False, should_pre_init=True):
+    def _prefix_gremlin_lib_scripts(cls, stmt_block):
+        gremlin_lib_stmt_block = '\n'.join(cls.get_gremlin_lib_scripts())
+        return '%s\n\n%s' % (gremlin_lib_stmt_block, stmt_block)
+    
+    @classmethod
+    def _execute_gremlin_script_with_registered_lib(cls, neodb, script, params):
+        '''
+        like _execute_gremlin_script_with_lazy_init, except that GremlinLibRegistry keeps track of whether the 
+        library needs installing, so the common case is a single request carrying only the statement block.
+        '''
+        if GremlinLibRegistry.is_non_caching(neodb):
+            return cls._execute_parameterized_gremlin_script(neodb, cls._prefix_gremlin_lib_scripts(script), params)
+        
+        GremlinLibRegistry.ensure_installed(neodb)
+        try:
+            return cls._execute_parameterized_gremlin_script(neodb, script, params)
+        except cls.BAD_REQUEST_ERRORS as br_ex:
+            if not cls._is_missing_lib_error(br_ex):
+                raise br_ex
+        
+        # the server lost the library (most likely it was restarted since we installed it), so re-install and retry.
+        GremlinLibRegistry.forget_installs(neodb)
+        GremlinLibRegistry.install(neodb)
+        try:
+            return cls._execute_parameterized_gremlin_script(neodb, script, params)
+        except cls.BAD_REQUEST_ERRORS as br_ex:
+            if not cls._is_missing_lib_error(br_ex):
+                raise br_ex
+        
+        logger.warn('%s does not retain gremlin lib definitions, falling back to in-lining them' % cls.get_db_uri(neodb))
+        GremlinLibRegistry.mark_non_caching(neodb)
+        return cls._execute_parameterized_gremlin_script(neodb, cls._prefix_gremlin_lib_scripts(script), params)
+    
+    @classmethod
+    def run_gremlin_statements(cls, neodb, stmt_defs, should_run_in_transaction=True, should_lazy_init=False, should_pre_init=None, stmt_backend=None, should_coalesce=None):
         """
         take a database connection and a list of dictionaries describing the gremlin statements to be run,
         build the gremlin code, then run it (in a transaction by default).
@@ -170,6 +1458,8 @@ class NeoUtil(object):
         * py_result: not used by this method, but the functions that usually provide stmt_defs entries should 
           provide this for the reference of their callers.  the python object (if any) that corresponds to the 
           entry created in the DB (e.g. the domain object that corresponds to the node this statement created).
+        * on_success: optional.  a function (no args) to call once the statements have run successfully, e.g. to 
+          update a cache with what the statement created.  it isn't called if the statements fail.
         
         based on stmt_defs, this method constructs a block of gremlin code from the defined statements in the 
         order provided.  it also constructs a master dictionary of all parameter values, taking care to prevent
@@ -190,7 +1480,8 @@ class NeoUtil(object):
         
         (note that each entry of the dict in the 'param_values' field may itself be a dict.  the values are 
         whatever's expected by the gremlin method being invoked.  python dictionaries should automatically be
-        interpreted as maps by groovy/gremlin.)
+        interpreted as maps by groovy/gremlin.  a value can also be a StmtResultRef to an earlier entry in stmt_defs,
+        in which case that entry's result variable gets passed in place of a parameter.)
 
         said stmt_defs would then generate the following block of gremlin (assuming it gets run as a transaction,
         and omitting the library code loaded at the top):
@@ -222,6 +1513,70 @@ class NeoUtil(object):
           executed, in case the interpreter isn't caching scripts as expected.  bit of a hack.  will cause should_lazy_init
           to be ignored if it's true (if in-lining that stuff doesn't allow it to be recognized, it's unlikely we can rely 
           on the caching).
+        * should_pre_init=None (the default) means: use GremlinLibRegistry if params.GREMLIN_USE_LIB_REGISTRY is 
+          set, otherwise pre-init.  the registry installs the library on each server once, and only re-installs
+          it if the server seems to have lost it (e.g. after a restart), so the usual request only carries the
+          statement block.
+        
+        and the backend stuff:
+        * stmt_backend picks what actually executes stmt_defs, defaulting to params.NEO_STMT_BACKEND.  STMT_BACKEND_GREMLIN
+          is everything described above.  STMT_BACKEND_REST_BATCH hands stmt_defs off to NeoRestBatchBackend, which 
+          ignores the gremlin specific args (it's always transactional, and there's no library to init).
+        
+        and coalescing:
+        * should_coalesce=None (the default) means use params.NEO_WRITE_COALESCING.  if coalescing, the stmt_defs are 
+          handed to NeoWriteCoalescer, which may run them in the same transaction as other threads' stmt_defs (see
+          that class for details).  only applies to calls that leave the other args at their defaults.
+        """
+        should_coalesce = should_coalesce if should_coalesce is not None else params.NEO_WRITE_COALESCING
+        if should_coalesce and should_run_in_transaction and not should_lazy_init and should_pre_init is None and stmt_backend is None:
+            # the coalescer runs the stmt_defs through here with should_coalesce=False, so on_success gets handled then
+            return NeoWriteCoalescer.get_coalescer(neodb).run_statements(neodb, stmt_defs)
+        
+        results = cls._run_statements_on_backend(neodb, stmt_defs, should_run_in_transaction, should_lazy_init, should_pre_init, stmt_backend)
+        for stmt_def in stmt_defs:
+            if stmt_def.get('on_success') is not None:
+                stmt_def['on_success']()
+        return results
+    
+    @classmethod
+    def _run_statements_on_backend(cls, neodb, stmt_defs, should_run_in_transaction, should_lazy_init, should_pre_init, stmt_backend):
+        stmt_backend = stmt_backend if stmt_backend is not None else params.NEO_STMT_BACKEND
+        if stmt_backend == cls.STMT_BACKEND_REST_BATCH:
+            return NeoRestBatchBackend.run_statements(neodb, stmt_defs)
+        assert stmt_backend == cls.STMT_BACKEND_GREMLIN, 'unknown stmt_backend: %s' % stmt_backend
+        
+        if should_pre_init is None:
+            should_use_lib_registry = params.GREMLIN_USE_LIB_REGISTRY
+            should_pre_init = not should_use_lib_registry
+        else:
+            should_use_lib_registry = False
+        
+        stmt_block, master_params = cls.render_gremlin_statements(stmt_defs, should_run_in_transaction)
+        
+        if should_pre_init:
+            stmt_block = cls._prefix_gremlin_lib_scripts(stmt_block)
+            
+            # pre-initializing by putting the library code at the top of the gremlin statement
+            # block obviates the need for lazy initialization.  if the gremlin interpreter doesn't 
+            # recognize the utility class when it's inline, things are hosed.
+            should_lazy_init = False
+        
+        if should_use_lib_registry:
+            execution_fn = cls._execute_gremlin_script_with_registered_lib
+        elif should_lazy_init:
+            execution_fn = cls._execute_gremlin_script_with_lazy_init
+        else:
+            execution_fn = cls._execute_parameterized_gremlin_script
+        
+        
+        return execution_fn(neodb, stmt_block, master_params)
+    
+    @classmethod
+    def render_gremlin_statements(cls, stmt_defs, should_run_in_transaction=True):
+        """
+        builds the gremlin statement block and the master parameter dictionary for stmt_defs, as described in 
+        run_gremlin_statements.  returns a (stmt_block, master_params) tuple.  doesn't include any library code.
         """
         master_params = {}
         rendered_stmt_list = []
@@ -238,7 +1593,9 @@ class NeoUtil(object):
             stmt_master_param_list = []
             for j in range(len(stmt_param_list)):
                 param_name = stmt_param_list[j]
-                if param_name in stmt_param_values:
+                if isinstance(stmt_param_values.get(param_name), cls.StmtResultRef):
+                    stmt_master_param_list.append('result_%i' % cls._get_referenced_stmt_index(stmt_defs, i, stmt_param_values[param_name]))
+                elif param_name in stmt_param_values:
                     master_param_name = '%s_%i' % (param_name, i)
                     master_params[master_param_name] = stmt_param_values[param_name]
                     stmt_master_param_list.append(master_param_name)
@@ -260,23 +1617,14 @@ class NeoUtil(object):
         if should_run_in_transaction:
             stmt_block = "result = GremlinUtils.execInTransaction(g, { -> \n%s\n})" % stmt_block
         
-        if should_pre_init:
-            gremlin_lib_scripts = cls.get_gremlin_lib_scripts()
-            gremlin_lib_stmt_block = '\n'.join(gremlin_lib_scripts)
-            stmt_block = '%s\n\n%s' % (gremlin_lib_stmt_block, stmt_block)
-            
-            # pre-initializing by putting the library code at the top of the gremlin statement
-            # block obviates the need for lazy initialization.  if the gremlin interpreter doesn't 
-            # recognize the utility class when it's inline, things are hosed.
-            should_lazy_init = False
-        
-        if should_lazy_init:
-            execution_fn = cls._execute_gremlin_script_with_lazy_init
-        else:
-            execution_fn = cls._execute_parameterized_gremlin_script
-        
-        
-        return execution_fn(neodb, stmt_block, master_params)
+        return stmt_block, master_params
+    
+    @classmethod
+    def _get_referenced_stmt_index(cls, stmt_defs, referring_stmt_index, stmt_result_ref):
+        for i in range(referring_stmt_index):
+            if stmt_defs[i] is stmt_result_ref.stmt_def:
+                return i
+        raise ValueError('stmt_def %i refers to a result that is not from an earlier stmt_def in the batch' % referring_stmt_index)
     
     @staticmethod
     def get_create_and_index_edge_stmt_def(out_node_lookup_info, in_node_lookup_info, edge_type, edge_props, fields_to_index, py_result):
@@ -298,6 +1646,275 @@ class NeoUtil(object):
                 'py_result': py_result}
 
 
+class NeoRestBatchBackend(object):
+    '''
+    executes the same stmt_defs that NeoUtil.run_gremlin_statements takes, but compiles them into a single request 
+    to neo4j's REST batch endpoint instead of a gremlin script.  the batch endpoint runs all of its jobs in one 
+    transaction, so this gets us one round trip and all-or-nothing semantics without the gremlin plugin.
+    
+    the reason this isn't cypher through the transactional endpoint:  everything in tripel gets looked up through 
+    legacy (manual) indexes, and cypher can read those but not add to them.  the batch endpoint can do both.
+    
+    the two stmt_def types in use are compiled as follows:
+    * GremlinUtils.createAndIndexNode:  a POST /node job, plus a POST /index/node/<idx> job per indexed field, which 
+      refers to the new node with a {job_id} placeholder.
+    * GremlinUtils.createAndIndexEdge:  a POST <out node>/relationships job, plus index jobs like the above.  an 
+      endpoint created earlier in the same batch (whether given as a StmtResultRef or as lookup info that matches 
+      one of its indexed fields) gets referenced by placeholder.  any other endpoint gets resolved 
+      to a node id up front, with a single cypher lookup for all of them (so a batch that only links new nodes to 
+      each other costs one request, and anything else costs two).
+    '''
+    class StatementCompileError(Exception):
+        pass
+    
+    NODE_METHOD_NAME = 'GremlinUtils.createAndIndexNode'
+    EDGE_METHOD_NAME = 'GremlinUtils.createAndIndexEdge'
+    
+    @staticmethod
+    def _get_lookup_key(idx_name, key, value):
+        return (idx_name, key, str(value))
+    
+    @classmethod
+    def _get_node_lookup_keys(cls, stmt_def):
+        node_props = stmt_def['param_values']['node_props']
+        fields_to_index = stmt_def['param_values']['fields_to_index']
+        return [cls._get_lookup_key(idx_name, field_name, node_props[field_name]) 
+                for idx_name, field_names in fields_to_index.items() for field_name in field_names]
+    
+    @classmethod
+    def _get_edge_lookup_keys(cls, stmt_def):
+        """returns the lookup key for each endpoint of the edge, or the StmtResultRef for endpoints given that way."""
+        return [lookup_info if isinstance(lookup_info, NeoUtil.StmtResultRef) else 
+                    cls._get_lookup_key(lookup_info['lookupIndexName'], lookup_info['lookupKey'], lookup_info['lookupValue'])
+                for lookup_info in (stmt_def['param_values']['out_node_lookup_info'], stmt_def['param_values']['in_node_lookup_info'])]
+    
+    @classmethod
+    def get_external_lookup_keys(cls, stmt_defs):
+        '''returns the (ordered, de-duped) list of edge endpoint lookups that don't refer to a node created in stmt_defs.'''
+        local_lookup_keys = set()
+        external_lookup_keys = []
+        for stmt_def in stmt_defs:
+            if stmt_def['method_name'] == cls.NODE_METHOD_NAME:
+                local_lookup_keys.update(cls._get_node_lookup_keys(stmt_def))
+            elif stmt_def['method_name'] == cls.EDGE_METHOD_NAME:
+                for lookup_key in cls._get_edge_lookup_keys(stmt_def):
+                    if isinstance(lookup_key, NeoUtil.StmtResultRef):
+                        continue
+                    if lookup_key not in local_lookup_keys and lookup_key not in external_lookup_keys:
+                        external_lookup_keys.append(lookup_key)
+            else:
+                raise cls.StatementCompileError('no batch compilation for method_name=%s' % stmt_def['method_name'])
+        return external_lookup_keys
+    
+    @classmethod
+    def resolve_external_lookups(cls, neodb, external_lookup_keys):
+        '''returns a dict of lookup key -> neo node id, using one cypher query for the lot.'''
+        if not external_lookup_keys:
+            return {}
+        
+        start_clauses = []
+        return_clauses = []
+        query_params = {}
+        for i in range(len(external_lookup_keys)):
+            idx_name, key, value = external_lookup_keys[i]
+            start_clauses.append('n%i=node:%s(%s={v%i})' % (i, idx_name, key, i))
+            return_clauses.append('id(n%i)' % i)
+            query_params['v%i' % i] = value
+        lookup_cql = 'START %s RETURN %s;' % (', '.join(start_clauses), ', '.join(return_clauses))
+        
+        query_results = NeoUtil.execute_cypher(neodb, lookup_cql, query_params)
+        if len(query_results) != 1:
+            # zero rows means at least one lookup found nothing, more than one means at least one lookup wasn't unique
+            raise cls.StatementCompileError('expected exactly one node for each of %s, got %i rows' % (external_lookup_keys, len(query_results)))
+        return dict(zip(external_lookup_keys, query_results[0]))
+    
+    @staticmethod
+    def _get_index_jobs(first_job_id, element_type, element_job_id, element_props, fields_to_index):
+        index_jobs = []
+        for idx_name, field_names in fields_to_index.items():
+            for field_name in field_names:
+                index_jobs.append({'method': 'POST', 
+                                    'to': '/index/%s/%s' % (element_type, urllib.quote(idx_name, '')),
+                                    'body': {'uri': '{%i}' % element_job_id, 'key': field_name, 'value': element_props[field_name]},
+                                    'id': first_job_id + len(index_jobs)})
+        return index_jobs
+    
+    @classmethod
+    def compile_stmt_defs(cls, db_uri, stmt_defs, external_node_ids):
+        '''
+        returns (jobs, result_job_ids), where jobs is the request body for the batch endpoint and result_job_ids has the id 
+        of the job that creates each stmt_def's node or edge (in stmt_defs order).  external_node_ids should have an entry 
+        for everything get_external_lookup_keys(stmt_defs) returns.
+        '''
+        jobs = []
+        result_job_ids = []
+        local_node_job_ids = {}
+        stmt_node_job_ids = {}
+        
+        def get_node_ref(lookup_key):
+            if isinstance(lookup_key, NeoUtil.StmtResultRef):
+                if id(lookup_key.stmt_def) not in stmt_node_job_ids:
+                    raise cls.StatementCompileError('StmtResultRef to a stmt_def that is not an earlier node creation in the batch')
+                node_job_id = stmt_node_job_ids[id(lookup_key.stmt_def)]
+                return '{%i}' % node_job_id, '{%i}' % node_job_id
+            if lookup_key in local_node_job_ids:
+                node_job_id = local_node_job_ids[lookup_key]
+                return '{%i}' % node_job_id, '{%i}' % node_job_id
+            return '/node/%i' % external_node_ids[lookup_key], '%snode/%i' % (db_uri, external_node_ids[lookup_key])
+        
+        for stmt_def in stmt_defs:
+            param_values = stmt_def['param_values']
+            if stmt_def['method_name'] == cls.NODE_METHOD_NAME:
+                node_job_id = len(jobs)
+                jobs.append({'method': 'POST', 'to': '/node', 'body': param_values['node_props'], 'id': node_job_id})
+                jobs.extend(cls._get_index_jobs(len(jobs), 'node', node_job_id, param_values['node_props'], param_values['fields_to_index']))
+                for lookup_key in cls._get_node_lookup_keys(stmt_def):
+                    local_node_job_ids[lookup_key] = node_job_id
+                stmt_node_job_ids[id(stmt_def)] = node_job_id
+                result_job_ids.append(node_job_id)
+            elif stmt_def['method_name'] == cls.EDGE_METHOD_NAME:
+                out_lookup_key, in_lookup_key = cls._get_edge_lookup_keys(stmt_def)
+                out_node_path, out_node_uri = get_node_ref(out_lookup_key)
+                in_node_path, in_node_uri = get_node_ref(in_lookup_key)
+                edge_job_id = len(jobs)
+                jobs.append({'method': 'POST', 
+                            'to': '%s/relationships' % out_node_path, 
+                            'body': {'to': in_node_uri, 'type': param_values['edge_type'], 'data': param_values['edge_props']}, 
+                            'id': edge_job_id})
+                jobs.extend(cls._get_index_jobs(len(jobs), 'relationship', edge_job_id, param_values['edge_props'], param_values['fields_to_index']))
+                result_job_ids.append(edge_job_id)
+            else:
+                raise cls.StatementCompileError('no batch compilation for method_name=%s' % stmt_def['method_name'])
+        
+        return jobs, result_job_ids
+    
+    @classmethod
+    def run_statements(cls, neodb, stmt_defs):
+        '''returns a list with the URI of the node or edge created by each stmt_def.'''
+        db_uri = NeoUtil.get_db_uri(neodb)
+        external_node_ids = cls.resolve_external_lookups(neodb, cls.get_external_lookup_keys(stmt_defs))
+        jobs, result_job_ids = cls.compile_stmt_defs(db_uri, stmt_defs, external_node_ids)
+        job_results = dict((job_result['id'], job_result) for job_result in NeoUtil.run_rest_batch(neodb, jobs))
+        return [job_results[job_id].get('location') for job_id in result_job_ids]
+
+
+class NeoWriteCoalescer(object):
+    '''
+    group commit for neo writes.  concurrent callers of run_statements get their stmt_defs merged and run as a single
+    transaction, and each caller gets back the slice of the results corresponding to its own stmt_defs.
+    
+    the first caller to show up when nothing's pending becomes the leader for that batch:  it waits up to max_wait_ms
+    (or until the pending statement count reaches max_stmts, whichever's first), takes everything that's pending, runs 
+    it, and hands out the results.  callers that show up while a batch is being collected just wait for the leader.  
+    callers that show up while a batch is running start the next one.
+    
+    if neo reports that the merged script failed, the transaction was rolled back as a whole, so the leader re-runs each
+    caller's stmt_defs in a transaction of their own.  that way a bad write only fails for the caller that submitted it.
+    any other failure (a timeout, a dropped connection) leaves it unknown whether the merged transaction committed, so
+    every caller in the batch gets that error, and nothing is re-run.
+'''
+    class _PendingWrite(object):
+        def __init__(self, stmt_defs):
+            self.stmt_defs = stmt_defs
+            self.results = None
+            self.exc_info = None
+            self.done_event = threading.Event()
+    
+    _coalescers = {}
+    _coalescers_lock = threading.Lock()
+    
+    def __init__(self, max_wait_ms=params.NEO_WRITE_COALESCE_MAX_WAIT_MS, max_stmts=params.NEO_WRITE_COALESCE_MAX_STMTS):
+        self.max_wait_ms = max_wait_ms
+        self.max_stmts = max_stmts
+        self._lock = threading.Lock()
+        self._pending_writes = []
+        self._num_pending_stmts = 0
+        self._batch_full_event = threading.Event()
+        self._num_batches = 0
+        self._num_writes = 0
+        self._num_failed_batches = 0
+    
+    @classmethod
+    def get_coalescer(cls, neodb):
+        db_uri = NeoUtil.get_db_uri(neodb)
+        with cls._coalescers_lock:
+            if db_uri not in cls._coalescers:
+                cls._coalescers[db_uri] = cls()
+            return cls._coalescers[db_uri]
+    
+    @staticmethod
+    def _run_uncoalesced(neodb, stmt_defs):
+        return NeoUtil.run_gremlin_statements(neodb, stmt_defs, should_coalesce=False)
+    
+    def run_statements(self, neodb, stmt_defs):
+        pending_write = self._PendingWrite(stmt_defs)
+        with self._lock:
+            is_leader = (len(self._pending_writes) == 0)
+            if is_leader:
+                self._batch_full_event.clear()
+            self._pending_writes.append(pending_write)
+            self._num_pending_stmts += len(stmt_defs)
+            if self._num_pending_stmts >= self.max_stmts:
+                self._batch_full_event.set()
+        
+        if is_leader:
+            self._batch_full_event.wait(self.max_wait_ms / 1000.0)
+            with self._lock:
+                batch = self._pending_writes
+                self._pending_writes = []
+                self._num_pending_stmts = 0
+            self._run_batch(neodb, batch)
+        else:
+            pending_write.done_event.wait()
+        
+        if pending_write.exc_info is not None:
+            raise pending_write.exc_info[0], pending_write.exc_info[1], pending_write.exc_info[2]
+        return pending_write.results
+    
+    def _run_batch(self, neodb, batch):
+        try:
+            merged_stmt_defs = []
+            for pending_write in batch:
+                merged_stmt_defs.extend(pending_write.stmt_defs)
+            
+            try:
+                merged_results = self._run_uncoalesced(neodb, merged_stmt_defs)
+                offset = 0
+                for pending_write in batch:
+                    pending_write.results = merged_results[offset:offset+len(pending_write.stmt_defs)]
+                    offset += len(pending_write.stmt_defs)
+            except NeoUtil.BAD_REQUEST_ERRORS:
+                if len(batch) == 1:
+                    batch[0].exc_info = sys.exc_info()
+                else:
+                    logger.warn('coalesced neo write of %i callers failed, retrying individually' % len(batch))
+                    with self._lock:
+                        self._num_failed_batches += 1
+                    for pending_write in batch:
+                        try:
+                            pending_write.results = self._run_uncoalesced(neodb, pending_write.stmt_defs)
+                        except Exception:
+                            pending_write.exc_info = sys.exc_info()
+            except Exception:
+                exc_info = sys.exc_info()
+                for pending_write in batch:
+                    pending_write.exc_info = exc_info
+            
+            with self._lock:
+                self._num_batches += 1
+                self._num_writes += len(batch)
+        finally:
+            for pending_write in batch:
+                pending_write.done_event.set()
+    
+    def get_metrics(self):
+        with self._lock:
+            return {'num_batches': self._num_batches,
+                    'num_writes': self._num_writes,
+                    'num_failed_batches': self._num_failed_batches,
+                    'mean_writes_per_batch': float(self._num_writes) / self._num_batches if self._num_batches else None}
+
+
 #TODO: would be good to have integrity check cypher queries that can be run so that transactions can
 # be aborted if things aren't right (this was previously phrased in gremlin terms, but the general idea's 
 # applicable to transactions in general).
@@ -311,6 +1928,10 @@ class TripelGraphElement(object):
     ### TODO: this class and its children need more comments
     FULLTEXT_IDX_CONFIG = {'provider': 'lucene', 'type': 'fulltext', 'to_lower_case': 'true'}
     
+    # None if the element was loaded with all of its properties.  otherwise, the set of fields that were fetched (whether 
+    # or not they had a value), and anything else gets fetched by get_field the first time it's asked for.
+    _loaded_fields = None
+    
     class MissingRequiredFieldError(Exception):
         pass
     
@@ -320,17 +1941,38 @@ class TripelGraphElement(object):
     
     def _has_all_required_fields(self):
         for req_field in self._get_required_fields():
+            if not self.is_field_loaded(req_field):
+                continue
             if req_field not in self._properties.keys() or self._properties[req_field] is None:
                 return False
         return True
     
     @classmethod
-    def _init_from_properties(cls, properties):
+    def _init_from_properties(cls, properties, loaded_fields=None):
+        """loaded_fields is for partially loaded elements:  the fields that were fetched.  only those get checked for required fields."""
         elt = cls()
         elt._properties = properties.copy()
+        if loaded_fields is not None:
+            elt._loaded_fields = set(loaded_fields)
         if not elt._has_all_required_fields():
             raise cls.MissingRequiredFieldError()
         return elt
+    
+    def is_field_loaded(self, field_name):
+        return self._loaded_fields is None or field_name in self._loaded_fields
+    
+    def _fetch_fields(self, neodb, field_names):
+        """returns a dict of field name -> value (None if the element doesn't have it) for each of field_names."""
+        raise NotImplementedError('subclass must implement this')
+    
+    def get_field(self, neodb, field_name):
+        """the value of field_name (or None if it isn't set), fetching it from neo first if it wasn't loaded."""
+        if not self.is_field_loaded(field_name):
+            for fetched_field_name, val in self._fetch_fields(neodb, [field_name]).items():
+                if val is not None:
+                    self._properties[fetched_field_name] = val
+                self._loaded_fields.add(fetched_field_name)
+        return self._properties.get(field_name)
 
 class TripelEdge(TripelGraphElement):
     UNIQUE_EDGE_ID_PG_SEQ_NAME = '%s.unique_neo_edge_id' % SCHEMA_NAME
@@ -348,11 +1990,11 @@ class TripelEdge(TripelGraphElement):
     
     @classmethod
     def _get_next_unique_edge_id(cls, pgdb):
-        return PgUtil.get_next_seq_val(pgdb, cls.UNIQUE_EDGE_ID_PG_SEQ_NAME)
+        return UniqueIdAllocator.get_allocator(cls.UNIQUE_EDGE_ID_PG_SEQ_NAME).get_next_id(pgdb)
     
     @classmethod
     def get_unique_edge_id_index(cls, neodb):
-        return neodb.get_or_create_index(neo4j.Relationship, cls.UNIQUE_EDGE_ID_INDEX_NAME)
+        return NeoIndexRegistry.get_index(neodb, NeoIndexRegistry.RELATIONSHIP_INDEX, cls.UNIQUE_EDGE_ID_INDEX_NAME)
     
     @classmethod
     def _init_for_create(cls, pgdb, properties):
@@ -379,14 +2021,20 @@ class TripelEdge(TripelGraphElement):
     
     #TODO: for sort of cheap integrity checking, take an optional type for the nodes to be found.  if type is provided 
     # but not matched, throw an exception
+    @staticmethod
+    def _get_node_lookup_info(lookup_index_name, lookup_key, lookup_value):
+        """
+        lookup_value can also be a NeoUtil.StmtResultRef to a node created earlier in the same batch, in which case 
+        it's used as is, and the node doesn't need to be looked up at all.
+        """
+        if isinstance(lookup_value, NeoUtil.StmtResultRef):
+            return lookup_value
+        return {'lookupIndexName': lookup_index_name, 'lookupKey': lookup_key, 'lookupValue': lookup_value}
+    
     @classmethod
     def link_nodes_by_unique_id(cls, db_tuple, out_node_unq_id, in_node_unq_id, properties, should_run_gremlin_immediately=True):
-        out_node_lookup_info = {'lookupIndexName': TripelNode.UNIQUE_NODE_ID_INDEX_NAME, 
-                                'lookupKey': TripelNode.UNIQUE_NODE_ID_FIELD_NAME, 
-                                'lookupValue': out_node_unq_id}
-        in_node_lookup_info = {'lookupIndexName': TripelNode.UNIQUE_NODE_ID_INDEX_NAME, 
-                                'lookupKey': TripelNode.UNIQUE_NODE_ID_FIELD_NAME, 
-                                'lookupValue': in_node_unq_id}
+        out_node_lookup_info = cls._get_node_lookup_info(TripelNode.UNIQUE_NODE_ID_INDEX_NAME, TripelNode.UNIQUE_NODE_ID_FIELD_NAME, out_node_unq_id)
+        in_node_lookup_info = cls._get_node_lookup_info(TripelNode.UNIQUE_NODE_ID_INDEX_NAME, TripelNode.UNIQUE_NODE_ID_FIELD_NAME, in_node_unq_id)
         return cls._create_new_edge(db_tuple, out_node_lookup_info, in_node_lookup_info, properties, {}, should_run_gremlin_immediately)
 
 class CategoryRootEdge(TripelEdge):
@@ -394,12 +2042,8 @@ class CategoryRootEdge(TripelEdge):
     
     @classmethod
     def link_cat_root_to_nodespace(cls, db_tuple, root_cat_node_unq_id, nodespace_id, properties, should_run_gremlin_immediately=True):
-        out_node_lookup_info = {'lookupIndexName': RootCategoryNode.UNIQUE_NODE_ID_INDEX_NAME, 
-                                'lookupKey': RootCategoryNode.UNIQUE_NODE_ID_FIELD_NAME, 
-                                'lookupValue': root_cat_node_unq_id}
-        in_node_lookup_info = {'lookupIndexName': NodespaceNode.NODESPACE_INDEX_NAME, 
-                                'lookupKey': NodespaceNode.NODESPACE_ID_FIELD_NAME, 
-                                'lookupValue': nodespace_id}
+        out_node_lookup_info = cls._get_node_lookup_info(RootCategoryNode.UNIQUE_NODE_ID_INDEX_NAME, RootCategoryNode.UNIQUE_NODE_ID_FIELD_NAME, root_cat_node_unq_id)
+        in_node_lookup_info = cls._get_node_lookup_info(NodespaceNode.NODESPACE_INDEX_NAME, NodespaceNode.NODESPACE_ID_FIELD_NAME, nodespace_id)
         return cls._create_new_edge(db_tuple, out_node_lookup_info, in_node_lookup_info, properties, {}, should_run_gremlin_immediately)
 
 class CreatedByEdge(TripelEdge):
@@ -411,27 +2055,29 @@ class CreatedByEdge(TripelEdge):
     @classmethod
     def _get_fields_to_index(cls):
         idx_fields = super(cls, cls)._get_fields_to_index().copy()
-        idx_fields.update({cls.CREATED_BY_INDEX_NAME: [cls.USER_ID_FIELD_NAME]})
+        # the creation date is there for range queries over recently created content (see saved_search_evaluator)
+        idx_fields.update({cls.CREATED_BY_INDEX_NAME: [cls.USER_ID_FIELD_NAME, cls.CREATION_DATE_FIELD_NAME]})
         return idx_fields
     
     @classmethod
     def _get_required_fields(cls):
         return super(cls, cls)._get_required_fields() + [cls.USER_ID_FIELD_NAME, cls.CREATION_DATE_FIELD_NAME]
     
+    @staticmethod
+    def get_creation_date_str(creation_date):
+        # creation dates are stored as strings, which sort by date as long as they're all utc
+        return str(creation_date)
+    
     @classmethod
     def get_created_by_index(cls, neodb):
-        return neodb.get_or_create_index(neo4j.Relationship, cls.CREATED_BY_INDEX_NAME)
+        return NeoIndexRegistry.get_index(neodb, NeoIndexRegistry.RELATIONSHIP_INDEX, cls.CREATED_BY_INDEX_NAME)
     
     @classmethod
     def link_node_to_creator(cls, db_tuple, out_node_unq_id, creator_user_id, should_run_gremlin_immediately=True):
-        out_node_lookup_info = {'lookupIndexName': TripelNode.UNIQUE_NODE_ID_INDEX_NAME, 
-                                'lookupKey': TripelNode.UNIQUE_NODE_ID_FIELD_NAME, 
-                                'lookupValue': out_node_unq_id}
-        in_node_lookup_info = {'lookupIndexName': UserNode.USER_INDEX_NAME, 
-                                'lookupKey': UserNode.USER_ID_FIELD_NAME, 
-                                'lookupValue': creator_user_id}
+        out_node_lookup_info = cls._get_node_lookup_info(TripelNode.UNIQUE_NODE_ID_INDEX_NAME, TripelNode.UNIQUE_NODE_ID_FIELD_NAME, out_node_unq_id)
+        in_node_lookup_info = cls._get_node_lookup_info(UserNode.USER_INDEX_NAME, UserNode.USER_ID_FIELD_NAME, creator_user_id)
         edge_props = {}
-        edge_props[cls.CREATION_DATE_FIELD_NAME] = str(DateTimeUtil.datetime_now_utc_aware())
+        edge_props[cls.CREATION_DATE_FIELD_NAME] = cls.get_creation_date_str(DateTimeUtil.datetime_now_utc_aware())
         edge_props[cls.USER_ID_FIELD_NAME] = creator_user_id
         return cls._create_new_edge(db_tuple, out_node_lookup_info, in_node_lookup_info, edge_props, {}, should_run_gremlin_immediately)
 
@@ -447,6 +2093,18 @@ class CommentReplyEdge(TripelEdge):
 class CommentAttachEdge(TripelEdge):
     EDGE_TYPE = 'COMMENTS_ON'
 
+class NotifiesUserEdge(TripelEdge):
+    EDGE_TYPE = 'NOTIFIES'
+    
+    @classmethod
+    def link_notification_to_user(cls, db_tuple, notification_node_unq_id, user_id, should_run_gremlin_immediately=True):
+        out_node_lookup_info = cls._get_node_lookup_info(TripelNode.UNIQUE_NODE_ID_INDEX_NAME, TripelNode.UNIQUE_NODE_ID_FIELD_NAME, notification_node_unq_id)
+        in_node_lookup_info = cls._get_node_lookup_info(UserNode.USER_INDEX_NAME, UserNode.USER_ID_FIELD_NAME, user_id)
+        return cls._create_new_edge(db_tuple, out_node_lookup_info, in_node_lookup_info, {}, {}, should_run_gremlin_immediately)
+
+class NotificationTargetEdge(TripelEdge):
+    EDGE_TYPE = 'IS_ABOUT'
+
 """
 TODO: alerts, recs, messages, etc:  since cypher and gremlin can create links, here's a scheme for alerts:
 *each user has a set of saved searches.
@@ -460,19 +2118,30 @@ class TripelNode(TripelGraphElement):
     UNIQUE_NODE_ID_PG_SEQ_NAME = '%s.unique_neo_node_id' % SCHEMA_NAME
     UNIQUE_NODE_ID_INDEX_NAME = 'UNQ_NODE_ID_IDX'
     UNIQUE_NODE_ID_FIELD_NAME = '_TRPL_UNQ_NODE_ID'
+    # big fields that get_eager_field_names leaves out, for lookups that don't need them (lists, privilege checks)
+    LAZY_FIELDS = []
     
     @classmethod
     def _get_fields_to_index(cls):
         '''returns a dictionary where keys are index names and values are the fields to add under that index'''
         return {cls.UNIQUE_NODE_ID_INDEX_NAME: [cls.UNIQUE_NODE_ID_FIELD_NAME]}
     
+    @classmethod
+    def get_eager_field_names(cls):
+        """the required and indexed fields, minus LAZY_FIELDS.  a projection for when the big fields aren't needed up front."""
+        eager_field_names = []
+        for field_name in cls._get_required_fields() + [field_name for idx_field_names in cls._get_fields_to_index().values() for field_name in idx_field_names]:
+            if field_name not in cls.LAZY_FIELDS and field_name not in eager_field_names:
+                eager_field_names.append(field_name)
+        return eager_field_names
+    
     @classmethod
     def _get_required_fields(cls):
         return [cls.UNIQUE_NODE_ID_FIELD_NAME, cls.NODE_TYPE_FIELD_NAME]
     
     @classmethod
     def _get_next_unique_node_id(cls, pgdb):
-        return PgUtil.get_next_seq_val(pgdb, cls.UNIQUE_NODE_ID_PG_SEQ_NAME)
+        return UniqueIdAllocator.get_allocator(cls.UNIQUE_NODE_ID_PG_SEQ_NAME).get_next_id(pgdb)
     
     @classmethod
     def _init_for_create(cls, pgdb, properties):
@@ -482,12 +2151,24 @@ class TripelNode(TripelGraphElement):
         return cls._init_from_properties(properties)
     
     @classmethod
-    def _init_from_neo_node(cls, neo_node):
-        return cls._init_from_properties(neo_node.get_properties().copy())
+    def _init_from_neo_node(cls, neo_node, field_names=None):
+        """field_names limits which of neo_node's properties get kept (the rest can be fetched later by get_field)."""
+        if field_names is None:
+            return cls._init_from_properties(neo_node.get_properties().copy())
+        neo_props = neo_node.get_properties()
+        field_names = cls._add_id_field_names(field_names)
+        return cls._init_from_properties(dict((field_name, neo_props[field_name]) for field_name in field_names if field_name in neo_props), field_names)
+    
+    def _fetch_fields(self, neodb, field_names):
+        field_names = list(field_names)
+        lucene_query = '%s:%s' % (self.UNIQUE_NODE_ID_FIELD_NAME, self._properties[self.UNIQUE_NODE_ID_FIELD_NAME])
+        rows = NeoUtil.execute_cypher(neodb, self._get_multi_get_cql(field_names), {'lucene_query': lucene_query})
+        assert len(rows) == 1, 'no node with unique id %s' % self._properties[self.UNIQUE_NODE_ID_FIELD_NAME]
+        return dict(zip(field_names, rows[0]))
     
     @classmethod
     def get_unique_node_id_index(cls, neodb):
-        return neodb.get_or_create_index(neo4j.Node, cls.UNIQUE_NODE_ID_INDEX_NAME)
+        return NeoIndexRegistry.get_index(neodb, NeoIndexRegistry.NODE_INDEX, cls.UNIQUE_NODE_ID_INDEX_NAME)
     
     @classmethod
     def _get_create_node_stmt_def(cls, pgdb, properties, additional_params=None):
@@ -496,18 +2177,101 @@ class TripelNode(TripelGraphElement):
         return stmt_def
     
     @classmethod
-    def _create_new_node(cls, db_tuple, properties, additional_params, should_run_gremlin_immediately):
-        pgdb, neodb = db_tuple
-        stmt_def = cls._get_create_node_stmt_def(pgdb, properties, additional_params)
-        if should_run_gremlin_immediately:
-            NeoUtil.run_gremlin_statements(neodb, [stmt_def])
-            return stmt_def['py_result']
+    def _create_new_node(cls, db_tuple, properties, additional_params, should_run_gremlin_immediately):
+        pgdb, neodb = db_tuple
+        stmt_def = cls._get_create_node_stmt_def(pgdb, properties, additional_params)
+        if should_run_gremlin_immediately:
+            NeoUtil.run_gremlin_statements(neodb, [stmt_def])
+            return stmt_def['py_result']
+        else:
+            return [stmt_def]
+    
+    @classmethod
+    def get_existing_node_by_unique_id(cls, neodb, unique_node_id, field_names=None):
+        """
+        returns None if there's no node with that unique id.  field_names fetches only those properties (see 
+        get_existing_nodes_by_unique_ids, which also gives None for a node that isn't a cls).
+        """
+        if field_names is not None:
+            return cls.get_existing_nodes_by_unique_ids(neodb, [unique_node_id], field_names)[0]
+        neo_node = NeoUtil.get_single_indexed_node(neodb, cls.UNIQUE_NODE_ID_INDEX_NAME, cls.UNIQUE_NODE_ID_FIELD_NAME, str(unique_node_id))
+        return cls._init_from_neo_node(neo_node) if neo_node is not None else None
+    
+    @staticmethod
+    def get_node_class_for_type(node_type):
+        """the TripelNode subclass for a stored node type, or None if there isn't one."""
+        node_classes = [TripelNode]
+        while node_classes:
+            node_class = node_classes.pop()
+            if getattr(node_class, 'NODE_TYPE', None) == node_type:
+                return node_class
+            node_classes.extend(node_class.__subclasses__())
+        return None
+    
+    @classmethod
+    def _add_id_field_names(cls, field_names):
+        id_field_names = [cls.UNIQUE_NODE_ID_FIELD_NAME, cls.NODE_TYPE_FIELD_NAME]
+        return id_field_names + [field_name for field_name in field_names if field_name not in id_field_names]
+    
+    @classmethod
+    def _get_multi_get_cql(cls, field_names):
+        if field_names is None:
+            return_clause = 'node'
         else:
-            return [stmt_def]
+            return_clause = ', '.join(['node.%s?' % field_name for field_name in field_names])
+        return 'START node=node:%s({lucene_query}) RETURN %s;' % (cls.UNIQUE_NODE_ID_INDEX_NAME, return_clause)
     
     @classmethod
-    def get_existing_node_by_unique_id(cls, neodb, unique_node_id):
-        return cls._init_from_neo_node(cls.get_unique_node_id_index(neodb).get(cls.UNIQUE_NODE_ID_FIELD_NAME, str(unique_node_id))[0])
+    def get_existing_nodes_by_unique_ids(cls, neodb, unique_node_ids, field_names=None, chunk_size=params.NEO_MULTI_GET_CHUNK_SIZE):
+        """
+        the nodes for a list of unique ids, in the same order, with None for the ids that don't have a node (or whose node 
+        isn't a cls).  each node comes back as the subclass for its node type.  the ids go to neo as an OR query against 
+        the unique id index, chunk_size ids per query, with all the queries in a single REST batch.
+        
+        field_names limits which properties get fetched (e.g. to leave out writeup and comment bodies on list pages).  the 
+        unique id and node type always come along.  the nodes will be partially loaded:  they're only checked for the 
+        required fields among the listed ones, and get_field fetches anything else on first use.
+        """
+        if field_names is not None:
+            field_names = cls._add_id_field_names(field_names)
+        # unique ids are integers, so anything else can't match a node, and shouldn't go into the lucene query
+        id_strs = []
+        for unique_node_id in unique_node_ids:
+            try:
+                id_strs.append(str(int(unique_node_id)))
+            except (TypeError, ValueError):
+                id_strs.append(None)
+        query_ids = sorted(set([id_str for id_str in id_strs if id_str is not None]))
+        if not query_ids:
+            return [None] * len(id_strs)
+        
+        multi_get_cql = cls._get_multi_get_cql(field_names)
+        query_params_list = [{'lucene_query': '%s:(%s)' % (cls.UNIQUE_NODE_ID_FIELD_NAME, ' '.join(query_ids[i:i+chunk_size]))}
+                                for i in range(0, len(query_ids), chunk_size)]
+        if len(query_params_list) == 1:
+            rows = NeoUtil.execute_cypher(neodb, multi_get_cql, query_params_list[0])
+        else:
+            jobs = [{'method': 'POST', 'to': '/cypher', 'id': i, 'body': {'query': multi_get_cql, 'params': query_params_list[i]}}
+                    for i in range(len(query_params_list))]
+            rows = []
+            for job_result in NeoUtil.run_rest_batch(neodb, jobs):
+                rows.extend([map(NeoRestElement.wrap_if_element, row) for row in job_result['body']['data']])
+        
+        nodes_by_id = {}
+        for row in rows:
+            if field_names is None:
+                properties = row[0].get_properties()
+            else:
+                properties = dict((field_names[i], row[i]) for i in range(len(field_names)) if row[i] is not None)
+            node_class = cls.get_node_class_for_type(properties.get(cls.NODE_TYPE_FIELD_NAME))
+            if node_class is None or not issubclass(node_class, cls):
+                continue
+            if field_names is None:
+                node = node_class._init_from_properties(properties)
+            else:
+                node = node_class._init_from_properties(properties, field_names)
+            nodes_by_id[str(properties[cls.UNIQUE_NODE_ID_FIELD_NAME])] = node
+        return [nodes_by_id.get(id_str) for id_str in id_strs]
     
     #TODO: deletion
     #TODO: lookup
@@ -530,11 +2294,11 @@ class NodespaceNode(TripelNode):
     
     @classmethod
     def get_nodespace_index(cls, neodb):
-        return neodb.get_or_create_index(neo4j.Node, cls.NODESPACE_INDEX_NAME)
+        return NeoIndexRegistry.get_index(neodb, NeoIndexRegistry.NODE_INDEX, cls.NODESPACE_INDEX_NAME)
     
     @classmethod
     def get_existing_nodespace_node(cls, neodb, nodespace_id):
-        ns_neo_node = cls.get_nodespace_index(neodb).get(cls.NODESPACE_ID_FIELD_NAME, str(nodespace_id))[0]
+        ns_neo_node = NeoUtil.get_single_indexed_node(neodb, cls.NODESPACE_INDEX_NAME, cls.NODESPACE_ID_FIELD_NAME, str(nodespace_id))
         return cls._init_from_neo_node(ns_neo_node) if ns_neo_node is not None else None
     
     @classmethod
@@ -560,11 +2324,11 @@ class UserNode(TripelNode):
     
     @classmethod
     def get_user_index(cls, neodb):
-        return neodb.get_or_create_index(neo4j.Node, cls.USER_INDEX_NAME)
+        return NeoIndexRegistry.get_index(neodb, NeoIndexRegistry.NODE_INDEX, cls.USER_INDEX_NAME)
     
     @classmethod
     def get_existing_user_node(cls, neodb, user_id):
-        ns_neo_node = cls.get_user_index(neodb).get(cls.USER_ID_FIELD_NAME, str(user_id))[0]
+        ns_neo_node = NeoUtil.get_single_indexed_node(neodb, cls.USER_INDEX_NAME, cls.USER_ID_FIELD_NAME, str(user_id))
         return cls._init_from_neo_node(ns_neo_node) if ns_neo_node is not None else None
     
     @classmethod
@@ -573,7 +2337,69 @@ class UserNode(TripelNode):
         properties[cls.USER_ID_FIELD_NAME] = user_id
         return cls._create_new_node(db_tuple, properties, {}, should_run_gremlin_immediately)
 
-class RootCategoryNode(TripelNode):
+class NodespaceContentNode(TripelNode):
+    """
+    base for the nodes that live inside a nodespace (root categories, categories, writeups, comments).  each of them 
+    carries the id of its nodespace, so finding the nodespace is a property read instead of a walk back up the category 
+    tree.  the field gets its own index, since lookups in NODESPACE_IDX expect to find only the nodespace node itself.
+    
+    nodes created before the field existed won't have it until neo_maintenance backfills them, so anything that reads 
+    it falls back to the old traversal (_get_parent_nodespace_by_traversal) when it's missing.  the subclasses with 
+    full-text indexes put the field in those too, so that ContentSearch can filter by nodespace inside the lucene query.
+    """
+    NS_CONTENT_INDEX_NAME = 'NS_CONTENT_IDX'
+    NODESPACE_ID_FIELD_NAME = NodespaceNode.NODESPACE_ID_FIELD_NAME
+    
+    @classmethod
+    def _get_fields_to_index(cls):
+        # not super(cls, cls), since cls is a subclass of this one, and that'd just call back into this method
+        idx_fields = super(NodespaceContentNode, cls)._get_fields_to_index().copy()
+        idx_fields.update({cls.NS_CONTENT_INDEX_NAME: [cls.NODESPACE_ID_FIELD_NAME]})
+        return idx_fields
+    
+    @classmethod
+    def get_ns_content_index(cls, neodb):
+        return NeoIndexRegistry.get_index(neodb, NeoIndexRegistry.NODE_INDEX, cls.NS_CONTENT_INDEX_NAME)
+    
+    @classmethod
+    def get_nodespace_id_for_unique_id(cls, neodb, unique_node_id):
+        """
+        the nodespace id of the content node with unique_node_id (usually the parent of a node that's about to be created).  
+        raises ValueError if there's no such node, or it isn't nodespace content.
+        """
+        neo_node = NeoUtil.get_single_indexed_node(neodb, cls.UNIQUE_NODE_ID_INDEX_NAME, cls.UNIQUE_NODE_ID_FIELD_NAME, str(unique_node_id))
+        if neo_node is None:
+            raise ValueError('no node with unique id %s' % unique_node_id)
+        properties = neo_node.get_properties().copy()
+        node_class = cls.get_node_class_for_type(properties[cls.NODE_TYPE_FIELD_NAME])
+        if node_class is None or not issubclass(node_class, NodespaceContentNode):
+            raise ValueError('not a nodespace content node type: %s' % properties[cls.NODE_TYPE_FIELD_NAME])
+        return node_class._init_from_properties(properties).get_parent_nodespace_id(neodb)
+    
+    @classmethod
+    def _add_nodespace_id(cls, neodb, properties, parent_unique_node_id, nodespace_id):
+        """returns a copy of properties with the nodespace id filled in, looking it up from the parent if the caller didn't know it."""
+        if nodespace_id is None:
+            nodespace_id = cls.get_nodespace_id_for_unique_id(neodb, parent_unique_node_id)
+        properties = properties.copy()
+        properties[cls.NODESPACE_ID_FIELD_NAME] = nodespace_id
+        return properties
+    
+    def _get_parent_nodespace_by_traversal(self, neodb):
+        raise NotImplementedError
+    
+    def get_parent_nodespace_id(self, neodb):
+        nodespace_id = self.get_field(neodb, self.NODESPACE_ID_FIELD_NAME)
+        if nodespace_id is None:
+            nodespace_id = self._get_parent_nodespace_by_traversal(neodb)._properties[NodespaceNode.NODESPACE_ID_FIELD_NAME]
+        return nodespace_id
+    
+    def get_parent_nodespace(self, neodb):
+        if self.get_field(neodb, self.NODESPACE_ID_FIELD_NAME) is None:
+            return self._get_parent_nodespace_by_traversal(neodb)
+        return NodespaceNode.get_existing_nodespace_node(neodb, self._properties[self.NODESPACE_ID_FIELD_NAME])
+
+class RootCategoryNode(NodespaceContentNode):
     NODE_TYPE = 'ROOT_CATEGORY'
     
     @classmethod
@@ -585,9 +2411,11 @@ class RootCategoryNode(TripelNode):
     @classmethod
     def create_new_root_category_node(cls, db_tuple, nodespace_id, properties, should_run_gremlin_immediately=True):
         pgdb, neodb = db_tuple
-        create_node_stmts = cls._create_new_node(db_tuple, properties, {'nodespace_id': nodespace_id}, False)
-        root_cat_node_unq_id = create_node_stmts[0]['py_result']._properties[cls.UNIQUE_NODE_ID_FIELD_NAME]
-        link_to_ns_stmts = CategoryRootEdge.link_cat_root_to_nodespace(db_tuple, root_cat_node_unq_id, nodespace_id, properties, False)
+        node_properties = properties.copy()
+        node_properties[cls.NODESPACE_ID_FIELD_NAME] = nodespace_id
+        create_node_stmts = cls._create_new_node(db_tuple, node_properties, {'nodespace_id': nodespace_id}, False)
+        root_cat_node_ref = NeoUtil.StmtResultRef(create_node_stmts[0])
+        link_to_ns_stmts = CategoryRootEdge.link_cat_root_to_nodespace(db_tuple, root_cat_node_ref, nodespace_id, properties, False)
         stmt_defs = create_node_stmts + link_to_ns_stmts
         
         if should_run_gremlin_immediately:
@@ -595,8 +2423,18 @@ class RootCategoryNode(TripelNode):
             return create_node_stmts[0]['py_result']
         else:
             return stmt_defs
+    
+    def _get_parent_nodespace_by_traversal(self, neodb):
+        parent_info_cql = '''START root_cat=node:%(unq_node_id_idx_name)s(%(unq_node_id_field_name)s={root_cat_node_unq_id}) 
+                                MATCH root_cat-[:%(catroot_edge_type)s]->nodespace
+                                RETURN nodespace;''' % {'unq_node_id_idx_name': self.UNIQUE_NODE_ID_INDEX_NAME, 
+                                                'unq_node_id_field_name': self.UNIQUE_NODE_ID_FIELD_NAME,
+                                                'catroot_edge_type': CategoryRootEdge.EDGE_TYPE}
+        query_result = NeoUtil.execute_cypher(neodb, parent_info_cql, {'root_cat_node_unq_id': self._properties[self.UNIQUE_NODE_ID_FIELD_NAME]})
+        assert len(query_result) == 1 and len(query_result[0]) == 1
+        return NodespaceNode._init_from_properties(query_result[0][0].get_properties())
 
-class CategoryNode(TripelNode):
+class CategoryNode(NodespaceContentNode):
     NODE_TYPE = 'CATEGORY'
     CATEGORY_INDEX_NAME = 'CATEGORY_IDX'
     CAT_NAME_FIELD_NAME = '_TRPL_CAT_NAME'
@@ -605,7 +2443,7 @@ class CategoryNode(TripelNode):
     @classmethod
     def _get_fields_to_index(cls):
         idx_fields = super(cls, cls)._get_fields_to_index().copy()
-        idx_fields.update({cls.CATEGORY_INDEX_NAME: [cls.CAT_NAME_FIELD_NAME, cls.CAT_DESC_FIELD_NAME]})
+        idx_fields.update({cls.CATEGORY_INDEX_NAME: [cls.CAT_NAME_FIELD_NAME, cls.CAT_DESC_FIELD_NAME, cls.NODESPACE_ID_FIELD_NAME]})
         return idx_fields
     
     @classmethod
@@ -614,7 +2452,7 @@ class CategoryNode(TripelNode):
     
     @classmethod
     def get_category_index(cls, neodb):
-        return neodb.get_or_create_index(neo4j.Node, cls.CATEGORY_INDEX_NAME, config=cls.FULLTEXT_IDX_CONFIG)
+        return NeoIndexRegistry.get_index(neodb, NeoIndexRegistry.NODE_INDEX, cls.CATEGORY_INDEX_NAME, config=cls.FULLTEXT_IDX_CONFIG)
     
     @classmethod
     def _get_create_node_stmt_def(cls, pgdb, properties, additional_params=None):
@@ -623,17 +2461,23 @@ class CategoryNode(TripelNode):
         return stmt_def
     
     @classmethod
-    def create_new_category_node(cls, db_tuple, parent_cat_unique_node_id, creator_user_id, cat_name, cat_desc, properties, should_run_gremlin_immediately=True):
+    def create_new_category_node(cls, db_tuple, parent_cat_unique_node_id, creator_user_id, cat_name, cat_desc, properties, should_run_gremlin_immediately=True, nodespace_id=None):
         pgdb, neodb = db_tuple
-        properties = properties.copy()
+        properties = cls._add_nodespace_id(neodb, properties, parent_cat_unique_node_id, nodespace_id)
         properties[cls.CAT_NAME_FIELD_NAME] = cat_name
         properties[cls.CAT_DESC_FIELD_NAME] = cat_desc
         
         create_node_stmts = cls._create_new_node(db_tuple, properties, {}, False)
-        cat_node_unq_id = create_node_stmts[0]['py_result']._properties[cls.UNIQUE_NODE_ID_FIELD_NAME]
-        link_to_creator_stmts = CreatedByEdge.link_node_to_creator(db_tuple, cat_node_unq_id, creator_user_id, False)
-        link_to_parent_stmts = SubcategoryEdge.link_nodes_by_unique_id(db_tuple, cat_node_unq_id, parent_cat_unique_node_id, {}, False)
+        cat_node_ref = NeoUtil.StmtResultRef(create_node_stmts[0])
+        link_to_creator_stmts = CreatedByEdge.link_node_to_creator(db_tuple, cat_node_ref, creator_user_id, False)
+        link_to_parent_stmts = SubcategoryEdge.link_nodes_by_unique_id(db_tuple, cat_node_ref, parent_cat_unique_node_id, {}, False)
         stmt_defs = create_node_stmts + link_to_creator_stmts + link_to_parent_stmts
+        create_node_stmts[0]['on_success'] = lambda: ContentSearch.get_cache().note_nodespace_changed(properties[cls.NODESPACE_ID_FIELD_NAME])
+        
+        cat_node, subcat_edge = create_node_stmts[0]['py_result'], link_to_parent_stmts[0]['py_result']
+        link_to_parent_stmts[0]['on_success'] = lambda: CategoryTreeCache.get_cache().note_category_created(
+                                                            properties[cls.NODESPACE_ID_FIELD_NAME], cat_node._properties[cls.UNIQUE_NODE_ID_FIELD_NAME], 
+                                                            cat_name, parent_cat_unique_node_id, subcat_edge._properties[SubcategoryEdge.UNIQUE_EDGE_ID_FIELD_NAME])
         
         if should_run_gremlin_immediately:
             NeoUtil.run_gremlin_statements(neodb, stmt_defs)
@@ -641,27 +2485,47 @@ class CategoryNode(TripelNode):
         else:
             return stmt_defs
     
-    def get_parent_nodespace(self, neodb):
+    def _get_parent_nodespace_by_traversal(self, neodb):
         parent_info_cql = '''START cat=node:%(unq_node_id_idx_name)s(%(unq_node_id_field_name)s={cat_node_unq_id}) 
                                 MATCH cat-[:%(subcat_edge_type)s*]->root_cat-[:%(catroot_edge_type)s]->nodespace
                                 RETURN nodespace;''' % {'unq_node_id_idx_name': self.UNIQUE_NODE_ID_INDEX_NAME, 
                                                 'unq_node_id_field_name': self.UNIQUE_NODE_ID_FIELD_NAME,
                                                 'subcat_edge_type': SubcategoryEdge.EDGE_TYPE,
                                                 'catroot_edge_type': CategoryRootEdge.EDGE_TYPE}
-        query_result = cypher.execute(neodb, parent_info_cql, {'cat_node_unq_id': self._properties[self.UNIQUE_NODE_ID_FIELD_NAME]})[0]
+        query_result = NeoUtil.execute_cypher(neodb, parent_info_cql, {'cat_node_unq_id': self._properties[self.UNIQUE_NODE_ID_FIELD_NAME]})
         assert len(query_result) == 1 and len(query_result[0]) == 1
         return NodespaceNode._init_from_properties(query_result[0][0].get_properties())
 
-class CommentNode(TripelNode):
+class CommentNode(NodespaceContentNode):
+    """
+    comments form threads:  a thread root is attached to a category or writeup, and replies hang off of comments.  each 
+    comment stores its thread root's id (indexed in COMMENT_THREAD_IDX), its depth in the thread (0 for the root), and 
+    its thread path, which is the unique ids of the root, ..., its parent, itself, as fixed width hex joined by '.'.  
+    sorting a thread's comments by path gives tree order (each comment followed by its replies, siblings in unique id 
+    order), so a thread or a page of it is one index lookup and a sort, instead of a variable length traversal.  unique 
+    ids come out of per-process blocks (see UniqueIdAllocator), so with more than one process, id order only roughly 
+    follows creation order.
+    
+    comments created before these fields existed need neo_maintenance.py backfill_comment_threads before they'll show 
+    up in thread lookups.  replying to one of them works either way, since its path gets worked out by traversal.
+    """
     NODE_TYPE = 'COMMENT'
     COMMENT_INDEX_NAME = 'COMMENT_IDX'
     COMMENT_SUBJECT_FIELD_NAME = '_TRPL_COM_SUBJ'
     COMMENT_BODY_FIELD_NAME = '_TRPL_COM_BODY'
+    COMMENT_THREAD_INDEX_NAME = 'COMMENT_THREAD_IDX'
+    THREAD_ROOT_ID_FIELD_NAME = '_TRPL_COM_THRD_ROOT_ID'
+    THREAD_PATH_FIELD_NAME = '_TRPL_COM_THRD_PATH'
+    THREAD_DEPTH_FIELD_NAME = '_TRPL_COM_THRD_DEPTH'
+    THREAD_PATH_SEGMENT_FMT = '%016x'
+    THREAD_PATH_SEP = '.'
+    LAZY_FIELDS = [COMMENT_BODY_FIELD_NAME]
     
     @classmethod
     def _get_fields_to_index(cls):
         idx_fields = super(cls, cls)._get_fields_to_index().copy()
-        idx_fields.update({cls.COMMENT_INDEX_NAME: [cls.COMMENT_SUBJECT_FIELD_NAME, cls.COMMENT_BODY_FIELD_NAME]})
+        idx_fields.update({cls.COMMENT_INDEX_NAME: [cls.COMMENT_SUBJECT_FIELD_NAME, cls.COMMENT_BODY_FIELD_NAME, cls.NODESPACE_ID_FIELD_NAME],
+                            cls.COMMENT_THREAD_INDEX_NAME: [cls.THREAD_ROOT_ID_FIELD_NAME]})
         return idx_fields
     
     @classmethod
@@ -670,26 +2534,79 @@ class CommentNode(TripelNode):
     
     @classmethod
     def get_comment_index(cls, neodb):
-        return neodb.get_or_create_index(neo4j.Node, cls.COMMENT_INDEX_NAME, config=cls.FULLTEXT_IDX_CONFIG)
+        return NeoIndexRegistry.get_index(neodb, NeoIndexRegistry.NODE_INDEX, cls.COMMENT_INDEX_NAME, config=cls.FULLTEXT_IDX_CONFIG)
+    
+    @classmethod
+    def get_comment_thread_index(cls, neodb):
+        return NeoIndexRegistry.get_index(neodb, NeoIndexRegistry.NODE_INDEX, cls.COMMENT_THREAD_INDEX_NAME)
+    
+    @classmethod
+    def build_thread_path(cls, parent_thread_path, unique_node_id):
+        path_segment = cls.THREAD_PATH_SEGMENT_FMT % int(unique_node_id)
+        return path_segment if parent_thread_path is None else '%s%s%s' % (parent_thread_path, cls.THREAD_PATH_SEP, path_segment)
+    
+    @classmethod
+    def parse_thread_path(cls, thread_path):
+        """the unique ids in thread_path, thread root first."""
+        return [int(path_segment, 16) for path_segment in thread_path.split(cls.THREAD_PATH_SEP)]
+    
+    @classmethod
+    def _add_thread_fields(cls, properties, thread_path):
+        path_ids = cls.parse_thread_path(thread_path)
+        properties[cls.THREAD_PATH_FIELD_NAME] = thread_path
+        properties[cls.THREAD_ROOT_ID_FIELD_NAME] = path_ids[0]
+        properties[cls.THREAD_DEPTH_FIELD_NAME] = len(path_ids) - 1
+    
+    def _get_thread_path_by_traversal(self, neodb):
+        thread_path_cql = '''START cmnt=node:%(unq_node_id_idx_name)s(%(unq_node_id_field_name)s={cmnt_node_unq_id}) 
+                        MATCH p = cmnt-[:%(cmnt_reply_edge_type)s*0..]->ancestor
+                        RETURN ancestor.%(unq_node_id_field_name)s ORDER BY length(p) DESC;''' % \
+                        {'unq_node_id_idx_name': self.UNIQUE_NODE_ID_INDEX_NAME, 
+                        'unq_node_id_field_name': self.UNIQUE_NODE_ID_FIELD_NAME,
+                        'cmnt_reply_edge_type': CommentReplyEdge.EDGE_TYPE}
+        query_result = NeoUtil.execute_cypher(neodb, thread_path_cql, {'cmnt_node_unq_id': self._properties[self.UNIQUE_NODE_ID_FIELD_NAME]})
+        thread_path = None
+        for row in query_result:
+            thread_path = self.build_thread_path(thread_path, row[0])
+        return thread_path
+    
+    def get_thread_path(self, neodb):
+        thread_path = self.get_field(neodb, self.THREAD_PATH_FIELD_NAME)
+        if thread_path is None:
+            thread_path = self._get_thread_path_by_traversal(neodb)
+        return thread_path
     
     @classmethod
     def _get_create_node_stmt_def(cls, pgdb, properties, additional_params=None):
         tripel_node = cls._init_for_create(pgdb, properties)
+        parent_thread_path = (additional_params or {}).get('parent_thread_path')
+        thread_path = cls.build_thread_path(parent_thread_path, tripel_node._properties[cls.UNIQUE_NODE_ID_FIELD_NAME])
+        cls._add_thread_fields(tripel_node._properties, thread_path)
         stmt_def = NeoUtil.get_create_and_index_node_stmt_def(tripel_node._properties, tripel_node._get_fields_to_index(), tripel_node)
         return stmt_def
     
     @classmethod
-    def _create_new_comment_node(cls, db_tuple, parent_unique_node_id, edge_type, creator_user_id, comment_subj, comment_body, properties, should_run_gremlin_immediately):
+    def _create_new_comment_node(cls, db_tuple, parent_unique_node_id, edge_type, creator_user_id, comment_subj, comment_body, properties, should_run_gremlin_immediately, nodespace_id):
         pgdb, neodb = db_tuple
-        properties = properties.copy()
+        additional_params = {}
+        if edge_type is CommentReplyEdge:
+            # the parent comment is needed for the thread path anyway, so get the nodespace id from it too
+            parent_cmnt = cls.get_existing_node_by_unique_id(neodb, parent_unique_node_id, [cls.THREAD_PATH_FIELD_NAME, cls.NODESPACE_ID_FIELD_NAME])
+            if parent_cmnt is None:
+                raise ValueError('no comment with unique id %s to reply to' % parent_unique_node_id)
+            additional_params['parent_thread_path'] = parent_cmnt.get_thread_path(neodb)
+            if nodespace_id is None:
+                nodespace_id = parent_cmnt.get_parent_nodespace_id(neodb)
+        properties = cls._add_nodespace_id(neodb, properties, parent_unique_node_id, nodespace_id)
         properties[cls.COMMENT_SUBJECT_FIELD_NAME] = comment_subj
         properties[cls.COMMENT_BODY_FIELD_NAME] = comment_body
         
-        create_node_stmts = cls._create_new_node(db_tuple, properties, {}, False)
-        com_node_unq_id = create_node_stmts[0]['py_result']._properties[cls.UNIQUE_NODE_ID_FIELD_NAME]
-        link_to_creator_stmts = CreatedByEdge.link_node_to_creator(db_tuple, com_node_unq_id, creator_user_id, False)
-        link_to_parent_stmts = edge_type.link_nodes_by_unique_id(db_tuple, com_node_unq_id, parent_unique_node_id, {}, False)
+        create_node_stmts = cls._create_new_node(db_tuple, properties, additional_params, False)
+        com_node_ref = NeoUtil.StmtResultRef(create_node_stmts[0])
+        link_to_creator_stmts = CreatedByEdge.link_node_to_creator(db_tuple, com_node_ref, creator_user_id, False)
+        link_to_parent_stmts = edge_type.link_nodes_by_unique_id(db_tuple, com_node_ref, parent_unique_node_id, {}, False)
         stmt_defs = create_node_stmts + link_to_creator_stmts + link_to_parent_stmts
+        create_node_stmts[0]['on_success'] = lambda: ContentSearch.get_cache().note_nodespace_changed(properties[cls.NODESPACE_ID_FIELD_NAME])
         
         if should_run_gremlin_immediately:
             NeoUtil.run_gremlin_statements(neodb, stmt_defs)
@@ -698,38 +2615,78 @@ class CommentNode(TripelNode):
             return stmt_defs
     
     @classmethod
-    def start_new_comment_thread(cls, db_tuple, parent_cat_or_wrup_unique_node_id, creator_user_id, comment_subj, comment_body, properties, should_run_gremlin_immediately=True):
-        return cls._create_new_comment_node(db_tuple, parent_cat_or_wrup_unique_node_id, CommentAttachEdge, creator_user_id, comment_subj, comment_body, properties, should_run_gremlin_immediately)
+    def start_new_comment_thread(cls, db_tuple, parent_cat_or_wrup_unique_node_id, creator_user_id, comment_subj, comment_body, properties, should_run_gremlin_immediately=True, nodespace_id=None):
+        return cls._create_new_comment_node(db_tuple, parent_cat_or_wrup_unique_node_id, CommentAttachEdge, creator_user_id, comment_subj, comment_body, properties, should_run_gremlin_immediately, nodespace_id)
     
     @classmethod
-    def reply_to_comment(cls, db_tuple, parent_cmnt_unique_node_id, creator_user_id, comment_subj, comment_body, properties, should_run_gremlin_immediately=True):
-        return cls._create_new_comment_node(db_tuple, parent_cmnt_unique_node_id, CommentReplyEdge, creator_user_id, comment_subj, comment_body, properties, should_run_gremlin_immediately)
+    def reply_to_comment(cls, db_tuple, parent_cmnt_unique_node_id, creator_user_id, comment_subj, comment_body, properties, should_run_gremlin_immediately=True, nodespace_id=None):
+        return cls._create_new_comment_node(db_tuple, parent_cmnt_unique_node_id, CommentReplyEdge, creator_user_id, comment_subj, comment_body, properties, should_run_gremlin_immediately, nodespace_id)
     
-    def get_parent_nodespace(self, neodb):
-        parent_info_cql = '''START cmnt=node:%(unq_node_id_idx_name)s(%(unq_node_id_field_name)s={cmnt_node_unq_id}) 
+    @classmethod
+    def get_thread_comments(cls, neodb, thread_root_id, after_thread_path=None, limit=None):
+        """
+        the comments in thread_root_id's thread, in tree order, as CommentNodes.  for paging, pass the last comment's 
+        thread path as after_thread_path to get the ones after it.  one lookup in COMMENT_THREAD_IDX, no traversal.
+        """
+        thread_cql = '''START cmnt=node:%(thrd_idx_name)s(%(thrd_root_id_field_name)s={thread_root_id})
+                        WHERE cmnt.%(thrd_path_field_name)s > {after_thread_path}
+                        RETURN cmnt ORDER BY cmnt.%(thrd_path_field_name)s%(limit_clause)s;''' % \
+                        {'thrd_idx_name': cls.COMMENT_THREAD_INDEX_NAME,
+                        'thrd_root_id_field_name': cls.THREAD_ROOT_ID_FIELD_NAME,
+                        'thrd_path_field_name': cls.THREAD_PATH_FIELD_NAME,
+                        'limit_clause': ' LIMIT {limit}' if limit is not None else ''}
+        query_params = {'thread_root_id': str(thread_root_id), 'after_thread_path': after_thread_path or '', 'limit': limit}
+        return [cls._init_from_neo_node(row[0]) for row in NeoUtil.execute_cypher(neodb, thread_cql, query_params)]
+    
+    @classmethod
+    def get_thread_roots(cls, neodb, parent_cat_or_wrup_unique_node_id):
+        """the roots of the threads attached to a category or writeup, in unique id order."""
+        thread_roots_cql = '''START parent=node:%(unq_node_id_idx_name)s(%(unq_node_id_field_name)s={parent_unq_id})
+                            MATCH parent<-[:%(cmnt_attach_edge_type)s]-cmnt
+                            RETURN cmnt ORDER BY cmnt.%(unq_node_id_field_name)s;''' % \
+                            {'unq_node_id_idx_name': cls.UNIQUE_NODE_ID_INDEX_NAME,
+                            'unq_node_id_field_name': cls.UNIQUE_NODE_ID_FIELD_NAME,
+                            'cmnt_attach_edge_type': CommentAttachEdge.EDGE_TYPE}
+        query_result = NeoUtil.execute_cypher(neodb, thread_roots_cql, {'parent_unq_id': str(parent_cat_or_wrup_unique_node_id)})
+        return [cls._init_from_neo_node(row[0]) for row in query_result]
+    
+    def get_thread_root_id(self, neodb):
+        return self.parse_thread_path(self.get_thread_path(neodb))[0]
+    
+    def _get_parent_nodespace_by_traversal(self, neodb):
+        thread_root_id = self.get_field(neodb, self.THREAD_ROOT_ID_FIELD_NAME)
+        if thread_root_id is not None:
+            # no need to walk up the replies to find the thread root
+            thrd_root_clause = 'START cmnt_thrd_root=node:%(unq_node_id_idx_name)s(%(unq_node_id_field_name)s={cmnt_thrd_root_unq_id})'
+            query_params = {'cmnt_thrd_root_unq_id': str(thread_root_id)}
+        else:
+            thrd_root_clause = '''START cmnt=node:%(unq_node_id_idx_name)s(%(unq_node_id_field_name)s={cmnt_node_unq_id}) 
                         MATCH p = cmnt-[:%(cmnt_reply_edge_type)s*0..]->cmnt_thrd_root
-                        WITH cmnt_thrd_root ORDER BY length(p) DESC LIMIT 1
+                        WITH cmnt_thrd_root ORDER BY length(p) DESC LIMIT 1'''
+            query_params = {'cmnt_node_unq_id': self._properties[self.UNIQUE_NODE_ID_FIELD_NAME]}
+        parent_info_cql = (thrd_root_clause + '''
                         MATCH cmnt_thrd_root-[:%(cmnt_attach_edge_type)s]->cmntd_node-[:%(subcat_edge_type)s*]->root_cat-[:%(catroot_edge_type)s]->nodespace
-                        RETURN nodespace;''' % {'unq_node_id_idx_name': self.UNIQUE_NODE_ID_INDEX_NAME, 
+                        RETURN nodespace;''') % {'unq_node_id_idx_name': self.UNIQUE_NODE_ID_INDEX_NAME, 
                                                 'unq_node_id_field_name': self.UNIQUE_NODE_ID_FIELD_NAME,
                                                 'cmnt_reply_edge_type': CommentReplyEdge.EDGE_TYPE,
                                                 'cmnt_attach_edge_type': CommentAttachEdge.EDGE_TYPE,
                                                 'subcat_edge_type': SubcategoryEdge.EDGE_TYPE,
                                                 'catroot_edge_type': CategoryRootEdge.EDGE_TYPE}
-        query_result = cypher.execute(neodb, parent_info_cql, {'cmnt_node_unq_id': self._properties[self.UNIQUE_NODE_ID_FIELD_NAME]})[0]
+        query_result = NeoUtil.execute_cypher(neodb, parent_info_cql, query_params)
         assert len(query_result) == 1 and len(query_result[0]) == 1
         return NodespaceNode._init_from_properties(query_result[0][0].get_properties())
 
-class WriteupNode(TripelNode):
+class WriteupNode(NodespaceContentNode):
     NODE_TYPE = 'WRITEUP'
     WRITEUP_INDEX_NAME = 'WRITEUP_IDX'
     WRITEUP_TITLE_FIELD_NAME = '_TRPL_WRUP_TITLE'
     WRITEUP_BODY_FIELD_NAME = '_TRPL_WRUP_BODY'
+    LAZY_FIELDS = [WRITEUP_BODY_FIELD_NAME]
     
     @classmethod
     def _get_fields_to_index(cls):
         idx_fields = super(cls, cls)._get_fields_to_index().copy()
-        idx_fields.update({cls.WRITEUP_INDEX_NAME: [cls.WRITEUP_TITLE_FIELD_NAME, cls.WRITEUP_BODY_FIELD_NAME]})
+        idx_fields.update({cls.WRITEUP_INDEX_NAME: [cls.WRITEUP_TITLE_FIELD_NAME, cls.WRITEUP_BODY_FIELD_NAME, cls.NODESPACE_ID_FIELD_NAME]})
         return idx_fields
     
     @classmethod
@@ -738,7 +2695,7 @@ class WriteupNode(TripelNode):
     
     @classmethod
     def get_writeup_index(cls, neodb):
-        return neodb.get_or_create_index(neo4j.Node, cls.WRITEUP_INDEX_NAME, config=cls.FULLTEXT_IDX_CONFIG)
+        return NeoIndexRegistry.get_index(neodb, NeoIndexRegistry.NODE_INDEX, cls.WRITEUP_INDEX_NAME, config=cls.FULLTEXT_IDX_CONFIG)
     
     @classmethod
     def _get_create_node_stmt_def(cls, pgdb, properties, additional_params=None):
@@ -747,17 +2704,18 @@ class WriteupNode(TripelNode):
         return stmt_def
     
     @classmethod
-    def create_new_writeup_node(cls, db_tuple, parent_cat_unique_node_id, creator_user_id, writeup_title, writeup_body, properties, should_run_gremlin_immediately=True):
+    def create_new_writeup_node(cls, db_tuple, parent_cat_unique_node_id, creator_user_id, writeup_title, writeup_body, properties, should_run_gremlin_immediately=True, nodespace_id=None):
         pgdb, neodb = db_tuple
-        properties = properties.copy()
+        properties = cls._add_nodespace_id(neodb, properties, parent_cat_unique_node_id, nodespace_id)
         properties[cls.WRITEUP_TITLE_FIELD_NAME] = writeup_title
         properties[cls.WRITEUP_BODY_FIELD_NAME] = writeup_body
         
         create_node_stmts = cls._create_new_node(db_tuple, properties, {}, False)
-        wrup_node_unq_id = create_node_stmts[0]['py_result']._properties[cls.UNIQUE_NODE_ID_FIELD_NAME]
-        link_to_creator_stmts = CreatedByEdge.link_node_to_creator(db_tuple, wrup_node_unq_id, creator_user_id, False)
-        link_to_parent_stmts = CategorizationEdge.link_nodes_by_unique_id(db_tuple, wrup_node_unq_id, parent_cat_unique_node_id, {}, False)
+        wrup_node_ref = NeoUtil.StmtResultRef(create_node_stmts[0])
+        link_to_creator_stmts = CreatedByEdge.link_node_to_creator(db_tuple, wrup_node_ref, creator_user_id, False)
+        link_to_parent_stmts = CategorizationEdge.link_nodes_by_unique_id(db_tuple, wrup_node_ref, parent_cat_unique_node_id, {}, False)
         stmt_defs = create_node_stmts + link_to_creator_stmts + link_to_parent_stmts
+        create_node_stmts[0]['on_success'] = lambda: ContentSearch.get_cache().note_nodespace_changed(properties[cls.NODESPACE_ID_FIELD_NAME])
         
         if should_run_gremlin_immediately:
             NeoUtil.run_gremlin_statements(neodb, stmt_defs)
@@ -765,7 +2723,7 @@ class WriteupNode(TripelNode):
         else:
             return stmt_defs
     
-    def get_parent_nodespace(self, neodb):
+    def _get_parent_nodespace_by_traversal(self, neodb):
         parent_info_cql = '''START wrup=node:%(unq_node_id_idx_name)s(%(unq_node_id_field_name)s={wrup_node_unq_id}) 
                                 MATCH wrup-[:%(categorization_edge_type)s]->cat-[:%(subcat_edge_type)s*]->root_cat-[:%(catroot_edge_type)s]->nodespace
                                 RETURN nodespace;''' % {'unq_node_id_idx_name': self.UNIQUE_NODE_ID_INDEX_NAME, 
@@ -773,14 +2731,58 @@ class WriteupNode(TripelNode):
                                                 'categorization_edge_type': CategorizationEdge.EDGE_TYPE,
                                                 'subcat_edge_type': SubcategoryEdge.EDGE_TYPE,
                                                 'catroot_edge_type': CategoryRootEdge.EDGE_TYPE}
-        query_result = cypher.execute(neodb, parent_info_cql, {'wrup_node_unq_id': self._properties[self.UNIQUE_NODE_ID_FIELD_NAME]})[0]
+        query_result = NeoUtil.execute_cypher(neodb, parent_info_cql, {'wrup_node_unq_id': self._properties[self.UNIQUE_NODE_ID_FIELD_NAME]})
         assert len(query_result) == 1 and len(query_result[0]) == 1
         return NodespaceNode._init_from_properties(query_result[0][0].get_properties())
 
 class NotificationNode(TripelNode):
+    """
+    one node per notification:  it links to the user being notified (NotifiesUserEdge) and to the node they're being 
+    notified about (NotificationTargetEdge), and records the saved search that turned it up, if any.  the user id is 
+    indexed, so a user's notifications are one lookup.
+    """
     NODE_TYPE = 'NOTIFICATION'
-    #TODO: is linked to user, has links to nodes which user should be notified of?  requires custom edge w/ creation date.  would imply one notification hub node.
-    #TODO: OR, maybe notification has link to search that spawned notification and link to specific result node, and link to user to be notified.  would imply one node per notification.
+    NOTIFICATION_INDEX_NAME = 'NOTIFICATION_IDX'
+    USER_ID_FIELD_NAME = '_TRPL_USER_ID'
+    SAVED_SEARCH_ID_FIELD_NAME = '_TRPL_SAVED_SEARCH_ID'
+    TARGET_NODE_ID_FIELD_NAME = '_TRPL_NOTIF_TARGET_ID'
+    CREATION_DATE_FIELD_NAME = '_TRPL_CREATION_DATE'
+    
+    @classmethod
+    def _get_fields_to_index(cls):
+        idx_fields = super(NotificationNode, cls)._get_fields_to_index().copy()
+        idx_fields.update({cls.NOTIFICATION_INDEX_NAME: [cls.USER_ID_FIELD_NAME]})
+        return idx_fields
+    
+    @classmethod
+    def _get_required_fields(cls):
+        return super(NotificationNode, cls)._get_required_fields() + [cls.USER_ID_FIELD_NAME, cls.TARGET_NODE_ID_FIELD_NAME, cls.CREATION_DATE_FIELD_NAME]
+    
+    @classmethod
+    def get_notification_index(cls, neodb):
+        return NeoIndexRegistry.get_index(neodb, NeoIndexRegistry.NODE_INDEX, cls.NOTIFICATION_INDEX_NAME)
+    
+    @classmethod
+    def create_new_notification_node(cls, db_tuple, user_id, target_unique_node_id, saved_search_id, properties, should_run_gremlin_immediately=True):
+        pgdb, neodb = db_tuple
+        properties = properties.copy()
+        properties[cls.USER_ID_FIELD_NAME] = user_id
+        properties[cls.TARGET_NODE_ID_FIELD_NAME] = target_unique_node_id
+        properties[cls.CREATION_DATE_FIELD_NAME] = CreatedByEdge.get_creation_date_str(DateTimeUtil.datetime_now_utc_aware())
+        if saved_search_id is not None:
+            properties[cls.SAVED_SEARCH_ID_FIELD_NAME] = saved_search_id
+        
+        create_node_stmts = cls._create_new_node(db_tuple, properties, {}, False)
+        notif_node_ref = NeoUtil.StmtResultRef(create_node_stmts[0])
+        link_to_user_stmts = NotifiesUserEdge.link_notification_to_user(db_tuple, notif_node_ref, user_id, False)
+        link_to_target_stmts = NotificationTargetEdge.link_nodes_by_unique_id(db_tuple, notif_node_ref, target_unique_node_id, {}, False)
+        stmt_defs = create_node_stmts + link_to_user_stmts + link_to_target_stmts
+        
+        if should_run_gremlin_immediately:
+            NeoUtil.run_gremlin_statements(neodb, stmt_defs)
+            return create_node_stmts[0]['py_result']
+        else:
+            return stmt_defs
 
 class RecommendationNode(NotificationNode):
     NODE_TYPE = 'RECOMMENDATION'
@@ -791,41 +2793,512 @@ class AlertNode(NotificationNode):
     NODE_TYPE = 'USR_ALERT'
     #TODO: i think this just links to user or nodespace and is essentially a message or something
 
+class CategoryTreeCache(object):
+    '''
+    per process cache of each nodespace's category tree, so that category listings and ancestor/descendant questions 
+    don't need a variable length traversal in neo every time.  category trees change rarely and get read constantly.
+    
+    a tree gets loaded from neo (one row per category) the first time its nodespace is asked about, and after that it's 
+    kept current by CategoryNode.create_new_category_node, which adds each new category once its statements have run.  
+    the number of cached nodespaces is bounded, with the least recently used tree dropped when the cache is full.
+    
+    only categories created through this process get added in place.  if other processes write to the same neo 
+    instance, their categories show up here once the tree is more than ttl_secs old (at which point it gets reloaded 
+    on the next read), or sooner if it gets evicted or forgotten (forget_nodespace/forget_all).
+    '''
+    class _CategoryTree(object):
+        """one nodespace's categories as adjacency lists, keyed by unique node id.  the root category has no name or parent."""
+        def __init__(self, root_cat_id):
+            self.root_cat_id = root_cat_id
+            self.loaded_time = time.time()
+            self.parent_ids = {root_cat_id: None}
+            self.child_ids = {root_cat_id: []}
+            self.cat_names = {root_cat_id: None}
+            self.parent_edge_ids = {}
+        
+        @classmethod
+        def from_rows(cls, rows):
+            """rows are (root cat id, cat id, cat name, parent edge id, parent cat id), in any order, as from _load_tree."""
+            tree = cls(rows[0][0])
+            for root_cat_id, cat_id, cat_name, parent_edge_id, parent_cat_id in rows:
+                if cat_id == root_cat_id:
+                    continue
+                tree.parent_ids[cat_id] = parent_cat_id
+                tree.cat_names[cat_id] = cat_name
+                tree.parent_edge_ids[cat_id] = parent_edge_id
+                tree.child_ids.setdefault(cat_id, [])
+                tree.child_ids.setdefault(parent_cat_id, []).append(cat_id)
+            return tree
+        
+        def add_category(self, cat_id, cat_name, parent_cat_id, parent_edge_id):
+            self.parent_ids[cat_id] = parent_cat_id
+            self.cat_names[cat_id] = cat_name
+            self.parent_edge_ids[cat_id] = parent_edge_id
+            self.child_ids[cat_id] = []
+            self.child_ids[parent_cat_id].append(cat_id)
+        
+        def get_ancestor_ids(self, cat_id):
+            """nearest first, ending with the root category."""
+            ancestor_ids = []
+            parent_id = self.parent_ids[cat_id]
+            while parent_id is not None:
+                ancestor_ids.append(parent_id)
+                parent_id = self.parent_ids[parent_id]
+            return ancestor_ids
+        
+        def get_descendant_ids(self, cat_id):
+            """breadth first, not including cat_id itself."""
+            descendant_ids = []
+            to_visit = collections.deque(self.child_ids[cat_id])
+            while to_visit:
+                descendant_id = to_visit.popleft()
+                descendant_ids.append(descendant_id)
+                to_visit.extend(self.child_ids[descendant_id])
+            return descendant_ids
+        
+        def get_category_info(self, cat_id):
+            return {'cat_name': self.cat_names[cat_id], 'parent_id': self.parent_ids[cat_id], 
+                    'parent_edge_id': self.parent_edge_ids.get(cat_id), 'child_ids': sorted(self.child_ids[cat_id])}
+        
+        def get_subtree_graph_dict(self, cat_id):
+            """
+            the subtree under cat_id in util.build_adhoc_graph_dict form.  the root category is left out (as are the 
+            edges pointing to it), since it's not something users create.
+            """
+            graph_dict = {'nodes': {}, 'edges': {}}
+            subtree_ids = ([cat_id] if cat_id != self.root_cat_id else []) + self.get_descendant_ids(cat_id)
+            for subtree_id in subtree_ids:
+                graph_dict['nodes'][subtree_id] = util.build_adhoc_node_dict(subtree_id, CategoryNode.NODE_TYPE, {CategoryNode.CAT_NAME_FIELD_NAME: self.cat_names[subtree_id]})
+            for subtree_id in subtree_ids:
+                parent_id, parent_edge_id = self.parent_ids[subtree_id], self.parent_edge_ids[subtree_id]
+                if parent_id in graph_dict['nodes']:
+                    graph_dict['edges'][parent_edge_id] = util.build_adhoc_edge_dict(parent_edge_id, SubcategoryEdge.EDGE_TYPE, subtree_id, parent_id, None)
+            return graph_dict
+    
+    _cache = None
+    _cache_lock = threading.Lock()
+    
+    def __init__(self, max_nodespaces=params.CATEGORY_TREE_CACHE_MAX_NODESPACES, ttl_secs=params.CATEGORY_TREE_CACHE_TTL_SECS):
+        self.max_nodespaces = max_nodespaces
+        self.ttl_secs = ttl_secs
+        self._trees = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # bumped whenever a category is created in a nodespace that isn't cached, so that a load that was already 
+        # in flight (and might've missed the new category) knows not to cache what it got
+        self._uncached_write_count = 0
+        self._stats = {'num_hits': 0, 'num_misses': 0, 'num_loads_discarded': 0, 'num_evictions': 0, 'num_expirations': 0}
+    
+    @classmethod
+    def get_cache(cls):
+        with cls._cache_lock:
+            if cls._cache is None:
+                cls._cache = cls()
+            return cls._cache
+    
+    @staticmethod
+    def _get_key(nodespace_id):
+        return str(nodespace_id)
+    
+    def _load_tree(self, neodb, nodespace_id):
+        """returns a _CategoryTree for the nodespace, or None if the nodespace has no root category in neo."""
+        cat_tree_cql = '''START ns=node:%(ns_idx_name)s(%(nodespace_id_field_name)s={nodespace_id}) 
+                        MATCH ns<-[:%(catroot_edge_type)s]-root_cat<-[:%(subcat_edge_type)s*0..]-cat-[parent_edge?:%(subcat_edge_type)s]->parent_cat
+                        RETURN DISTINCT root_cat.%(unq_node_id_field_name)s, cat.%(unq_node_id_field_name)s, cat.%(cat_name_field_name)s?, 
+                            parent_edge.%(unq_edge_id_field_name)s?, parent_cat.%(unq_node_id_field_name)s?;
+                        ''' % {'ns_idx_name': NodespaceNode.NODESPACE_INDEX_NAME,
+                                'nodespace_id_field_name': NodespaceNode.NODESPACE_ID_FIELD_NAME,
+                                'unq_node_id_field_name': TripelNode.UNIQUE_NODE_ID_FIELD_NAME,
+                                'subcat_edge_type': SubcategoryEdge.EDGE_TYPE,
+                                'catroot_edge_type': CategoryRootEdge.EDGE_TYPE,
+                                'unq_edge_id_field_name': SubcategoryEdge.UNIQUE_EDGE_ID_FIELD_NAME,
+                                'cat_name_field_name': CategoryNode.CAT_NAME_FIELD_NAME}
+        query_results = NeoUtil.execute_cypher(neodb, cat_tree_cql, {'nodespace_id': nodespace_id})
+        return self._CategoryTree.from_rows(query_results) if query_results else None
+    
+    def _get_tree(self, neodb, nodespace_id):
+        key = self._get_key(nodespace_id)
+        with self._lock:
+            if key in self._trees and time.time() - self._trees[key].loaded_time >= self.ttl_secs:
+                del self._trees[key]
+                self._stats['num_expirations'] += 1
+            if key in self._trees:
+                self._stats['num_hits'] += 1
+                tree = self._trees.pop(key)
+                self._trees[key] = tree
+                return tree
+            self._stats['num_misses'] += 1
+            write_count_before_load = self._uncached_write_count
+        
+        tree = self._load_tree(neodb, nodespace_id)
+        with self._lock:
+            if key in self._trees:
+                return self._trees[key]
+            if tree is None:
+                return None
+            if self._uncached_write_count != write_count_before_load:
+                self._stats['num_loads_discarded'] += 1
+                return tree
+            self._trees[key] = tree
+            while len(self._trees) > self.max_nodespaces:
+                self._trees.popitem(last=False)
+                self._stats['num_evictions'] += 1
+            return tree
+    
+    def _get_existing_tree(self, neodb, nodespace_id):
+        tree = self._get_tree(neodb, nodespace_id)
+        assert tree is not None, 'no category tree for nodespace %s' % nodespace_id
+        return tree
+    
+    def get_root_cat_id(self, neodb, nodespace_id):
+        return self._get_existing_tree(neodb, nodespace_id).root_cat_id
+    
+    def get_category_info(self, neodb, nodespace_id, cat_ids):
+        """
+        returns a dict of cat_id -> {'cat_name', 'parent_id', 'parent_edge_id', 'child_ids' (in unique id order)} for each 
+        of cat_ids.  raises KeyError if any of them isn't a category in the nodespace.
+        """
+        tree = self._get_existing_tree(neodb, nodespace_id)
+        with self._lock:
+            return dict((cat_id, tree.get_category_info(cat_id)) for cat_id in cat_ids)
+    
+    def get_ancestor_ids(self, neodb, nodespace_id, cat_id):
+        """unique node ids of cat_id's ancestors, nearest first, ending with the root category."""
+        tree = self._get_existing_tree(neodb, nodespace_id)
+        with self._lock:
+            return tree.get_ancestor_ids(cat_id)
+    
+    def get_descendant_ids(self, neodb, nodespace_id, cat_id):
+        """unique node ids of everything under cat_id, breadth first."""
+        tree = self._get_existing_tree(neodb, nodespace_id)
+        with self._lock:
+            return tree.get_descendant_ids(cat_id)
+    
+    def get_subtree_graph_dict(self, neodb, nodespace_id, cat_id=None):
+        """the categories under cat_id (default: the whole nodespace) as a util.build_adhoc_graph_dict style dict."""
+        tree = self._get_tree(neodb, nodespace_id)
+        if tree is None:
+            return {'nodes': {}, 'edges': {}}
+        with self._lock:
+            return tree.get_subtree_graph_dict(cat_id if cat_id is not None else tree.root_cat_id)
+    
+    def note_category_created(self, nodespace_id, cat_id, cat_name, parent_cat_id, parent_edge_id):
+        key = self._get_key(nodespace_id)
+        with self._lock:
+            if key not in self._trees:
+                self._uncached_write_count += 1
+                return
+            tree = self._trees[key]
+            if int(parent_cat_id) not in tree.child_ids:
+                # shouldn't happen, but if the tree has somehow gotten out of sync, reload it next time
+                del self._trees[key]
+                return
+            tree.add_category(cat_id, cat_name, int(parent_cat_id), parent_edge_id)
+    
+    def forget_nodespace(self, nodespace_id):
+        with self._lock:
+            self._trees.pop(self._get_key(nodespace_id), None)
+    
+    def forget_all(self):
+        with self._lock:
+            self._trees.clear()
+    
+    def get_stats(self):
+        with self._lock:
+            stats = self._stats.copy()
+            stats['num_nodespaces'] = len(self._trees)
+            return stats
+
+class ContentSearch(object):
+    '''
+    full-text search over a set of nodespaces' categories, writeups or comments, using the lucene indexes they're 
+    already added to.  each of those indexes also gets the content's nodespace id, so the nodespace filter is part of 
+    the lucene query, and lucene only ranks (and pages through) matches that the caller is allowed to see.  results carry 
+    a title and a short snippet around the first matching term, and only a bounded prefix of each body leaves neo.
+    
+    paging is by an opaque cursor string, which is the lucene offset of the next page.  pages are cached for a short 
+    time per (nodespaces, type, terms, cursor), and a nodespace's cached pages stop being used once content is created in it 
+    (note_nodespace_changed, which the content node creators call).  as with CategoryTreeCache, writes from other processes 
+    only show up here once the ttl runs out.
+    
+    content indexed before the nodespace id was added to the full-text indexes won't match anything until it's 
+    reindexed (neo_maintenance.py reindex_search).
+    '''
+    # node type -> (full-text index name, title field, body field)
+    SEARCHABLE_TYPES = {CategoryNode.NODE_TYPE: (CategoryNode.CATEGORY_INDEX_NAME, CategoryNode.CAT_NAME_FIELD_NAME, CategoryNode.CAT_DESC_FIELD_NAME),
+                        WriteupNode.NODE_TYPE: (WriteupNode.WRITEUP_INDEX_NAME, WriteupNode.WRITEUP_TITLE_FIELD_NAME, WriteupNode.WRITEUP_BODY_FIELD_NAME),
+                        CommentNode.NODE_TYPE: (CommentNode.COMMENT_INDEX_NAME, CommentNode.COMMENT_SUBJECT_FIELD_NAME, CommentNode.COMMENT_BODY_FIELD_NAME)}
+    
+    _cache = None
+    _cache_lock = threading.Lock()
+    
+    def __init__(self, max_entries=params.SEARCH_CACHE_MAX_ENTRIES, ttl_secs=params.SEARCH_CACHE_TTL_SECS):
+        self.max_entries = max_entries
+        self.ttl_secs = ttl_secs
+        # key -> (expiration time, nodespace generations when the search started, result)
+        self._results = collections.OrderedDict()
+        # nodespace id -> number of times content's been created in it.  cached results are only good while these match.
+        self._ns_generations = {}
+        self._lock = threading.Lock()
+        self._stats = {'num_hits': 0, 'num_misses': 0, 'num_evictions': 0}
+    
+    @classmethod
+    def get_cache(cls):
+        with cls._cache_lock:
+            if cls._cache is None:
+                cls._cache = cls()
+            return cls._cache
+    
+    @staticmethod
+    def get_text_terms(text):
+        """the set of lowercased words in text, split the same way as search queries."""
+        return set(re.findall(r'\w+', text.lower(), re.UNICODE)) if text else set()
+    
+    @staticmethod
+    def get_search_terms(query_text):
+        """the lowercased words in query_text (in order, without repeats), at most params.SEARCH_MAX_TERMS of them."""
+        search_terms = []
+        for term in re.findall(r'\w+', query_text.lower(), re.UNICODE):
+            if term not in search_terms:
+                search_terms.append(term)
+        return search_terms[:params.SEARCH_MAX_TERMS]
+    
+    @classmethod
+    def build_lucene_query(cls, nodespace_ids, node_type, search_terms):
+        """matches content in one of nodespace_ids with every one of search_terms in its title or body."""
+        idx_name, title_field_name, body_field_name = cls.SEARCHABLE_TYPES[node_type]
+        # search terms are all word characters, so there's nothing in them for lucene's query parser to trip on
+        clauses = ['+%s:(%s)' % (NodespaceContentNode.NODESPACE_ID_FIELD_NAME, ' '.join([str(ns_id) for ns_id in nodespace_ids]))]
+        clauses.extend(['+(%s:%s %s:%s)' % (title_field_name, term, body_field_name, term) for term in search_terms])
+        return ' '.join(clauses)
+    
+    @staticmethod
+    def _parse_cursor(cursor):
+        if cursor is None:
+            return 0
+        offset = int(cursor)
+        if offset < 0:
+            raise ValueError('invalid search cursor: %s' % cursor)
+        return offset
+    
+    def _run_search(self, neodb, nodespace_ids, node_type, search_terms, offset, page_size):
+        idx_name, title_field_name, body_field_name = self.SEARCHABLE_TYPES[node_type]
+        # no ORDER BY, so rows come back in the order the index query returns them:  lucene's relevance order
+        search_cql = '''START content=node:%(idx_name)s({lucene_query})
+                        RETURN content.%(unq_node_id_field_name)s, content.%(ns_id_field_name)s, content.%(title_field_name)s, 
+                            substring(content.%(body_field_name)s, 0, {body_prefix_len})
+                        SKIP {offset} LIMIT {limit};''' % {'idx_name': idx_name,
+                                                            'unq_node_id_field_name': TripelNode.UNIQUE_NODE_ID_FIELD_NAME,
+                                                            'ns_id_field_name': NodespaceContentNode.NODESPACE_ID_FIELD_NAME,
+                                                            'title_field_name': title_field_name,
+                                                            'body_field_name': body_field_name}
+        query_params = {'lucene_query': self.build_lucene_query(nodespace_ids, node_type, search_terms),
+                        'body_prefix_len': params.SEARCH_BODY_PREFIX_LEN, 'offset': offset, 'limit': page_size + 1}
+        query_results = NeoUtil.execute_cypher(neodb, search_cql, query_params)
+        
+        results = [{'node_id': unq_node_id, 'node_type': node_type, 'nodespace_id': nodespace_id, 'title': title,
+                    'snippet': util.get_text_snippet(body_prefix, search_terms, params.SEARCH_SNIPPET_LEN)}
+                    for unq_node_id, nodespace_id, title, body_prefix in query_results[:page_size]]
+        # the extra row is just to find out whether there's another page
+        next_cursor = str(offset + page_size) if len(query_results) > page_size else None
+        return {'results': results, 'next_cursor': next_cursor}
+    
+    def search(self, neodb, nodespace_ids, query_text, node_type=WriteupNode.NODE_TYPE, cursor=None, page_size=params.SEARCH_PAGE_SIZE):
+        """
+        returns {'results': [{'node_id', 'node_type', 'nodespace_id', 'title', 'snippet'}, ...], 'next_cursor': ...}, 
+        where next_cursor is None on the last page.  nodespace_ids should already be limited to the nodespaces the caller 
+        can view.  raises ValueError for a bad cursor.
+        """
+        offset = self._parse_cursor(cursor)
+        search_terms = self.get_search_terms(query_text)
+        if not search_terms or not nodespace_ids:
+            return {'results': [], 'next_cursor': None}
+        
+        ns_keys = tuple(sorted(set([str(ns_id) for ns_id in nodespace_ids])))
+        key = (ns_keys, node_type, tuple(search_terms), offset, page_size)
+        with self._lock:
+            ns_generations = tuple([self._ns_generations.get(ns_key, 0) for ns_key in ns_keys])
+            cache_entry = self._results.pop(key, None)
+            if cache_entry is not None and cache_entry[0] > time.time() and cache_entry[1] == ns_generations:
+                self._stats['num_hits'] += 1
+                self._results[key] = cache_entry
+                return cache_entry[2]
+            self._stats['num_misses'] += 1
+        
+        result = self._run_search(neodb, nodespace_ids, node_type, search_terms, offset, page_size)
+        with self._lock:
+            # if content got created while the search was running, the next search will redo it
+            self._results[key] = (time.time() + self.ttl_secs, ns_generations, result)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+                self._stats['num_evictions'] += 1
+        return result
+    
+    def note_nodespace_changed(self, nodespace_id):
+        ns_key = str(nodespace_id)
+        with self._lock:
+            self._ns_generations[ns_key] = self._ns_generations.get(ns_key, 0) + 1
+    
+    def forget_all(self):
+        with self._lock:
+            self._results.clear()
+    
+    def get_stats(self):
+        with self._lock:
+            stats = self._stats.copy()
+            stats['num_entries'] = len(self._results)
+            return stats
+
 class AdhocNeoQueries(object):
     @staticmethod
     def get_nodespace_categories(neodb, nodespace_id):
+        return CategoryTreeCache.get_cache().get_subtree_graph_dict(neodb, nodespace_id)
+    
+    @staticmethod
+    def iter_nodespace_categories(neodb, nodespace_id):
+        """get_nodespace_categories as (element type, adhoc dict) tuples, as from util.iter_adhoc_graph_elements."""
+        return util.iter_graph_dict_elements(AdhocNeoQueries.get_nodespace_categories(neodb, nodespace_id))
+    
+    @staticmethod
+    def iter_nodespace_categories_and_writeups(neodb, nodespace_id):
+        """
+        the nodespace's categories (from CategoryTreeCache) and then its writeups, as (element type, adhoc dict) tuples.  
+        the writeups are streamed from neo with one row per writeup, so the work here grows with the size of the graph, 
+        unlike _get_nodespace_categories_and_writeups_cartesian, whose row count is a product of per-category writeups 
+        and subcategories.
+        """
+        cat_graph_dict = CategoryTreeCache.get_cache().get_subtree_graph_dict(neodb, nodespace_id)
+        for element in util.iter_graph_dict_elements(cat_graph_dict):
+            yield element
+        
         def get_node_and_edge_dicts(query_row):
-            cat_id, cat_name = query_row[0], query_row[1]
-            subcat_edge_id = query_row[2]
-            subcat_id, subcat_name = query_row[3], query_row[4]
+            cat_id, wrup_edge_id, wrup_id, wrup_title = query_row
+            if cat_id not in cat_graph_dict['nodes']:
+                # created by another process since the category tree was cached
+                return [], []
+            wrup_node = util.build_adhoc_node_dict(wrup_id, WriteupNode.NODE_TYPE, {WriteupNode.WRITEUP_TITLE_FIELD_NAME: wrup_title})
+            wrup_edge = util.build_adhoc_edge_dict(wrup_edge_id, CategorizationEdge.EDGE_TYPE, wrup_id, cat_id, None)
+            return [wrup_node], [wrup_edge]
+        
+        # *1.. to leave out writeups filed directly under the root category, which isn't in cat_graph_dict
+        wrup_list_cql = '''START ns=node:%(ns_idx_name)s(%(nodespace_id_field_name)s={nodespace_id}) 
+                            MATCH ns<-[:%(catroot_edge_type)s]-root_cat<-[:%(subcat_edge_type)s*1..]-cat<-[wrup_edge:%(categorzn_edge_type)s]-wrup
+                            RETURN cat.%(unq_node_id_field_name)s, wrup_edge.%(unq_edge_id_field_name)s, 
+                                wrup.%(unq_node_id_field_name)s, wrup.%(wrup_title_field_name)s;
+                            ''' % {'ns_idx_name': NodespaceNode.NODESPACE_INDEX_NAME,
+                                    'nodespace_id_field_name': NodespaceNode.NODESPACE_ID_FIELD_NAME,
+                                    'unq_node_id_field_name': TripelNode.UNIQUE_NODE_ID_FIELD_NAME,
+                                    'subcat_edge_type': SubcategoryEdge.EDGE_TYPE,
+                                    'catroot_edge_type': CategoryRootEdge.EDGE_TYPE,
+                                    'categorzn_edge_type': CategorizationEdge.EDGE_TYPE,
+                                    'unq_edge_id_field_name': CategorizationEdge.UNIQUE_EDGE_ID_FIELD_NAME,
+                                    'wrup_title_field_name': WriteupNode.WRITEUP_TITLE_FIELD_NAME}
+        wrup_rows = NeoUtil.iter_cypher_rows(neodb, wrup_list_cql, {'nodespace_id': nodespace_id})
+        for element in util.iter_adhoc_graph_elements(wrup_rows, get_node_and_edge_dicts):
+            yield element
+    
+    @staticmethod
+    def get_nodespace_categories_and_writeups(neodb, nodespace_id):
+        return util.build_graph_dict_from_elements(AdhocNeoQueries.iter_nodespace_categories_and_writeups(neodb, nodespace_id))
+    
+    @staticmethod
+    def _get_writeup_pages(neodb, page_specs):
+        """
+        page_specs is a list of (cat_id, skip, limit).  returns a dict of cat_id -> that page of the category's writeups 
+        (in unique id order), as [categorization edge id, writeup id, writeup title] rows.  one round trip for all of them.
+        """
+        if not page_specs:
+            return {}
+        wrup_page_cql = '''START cat=node:%(unq_node_id_idx_name)s(%(unq_node_id_field_name)s={cat_id}) 
+                            MATCH cat<-[wrup_edge:%(categorzn_edge_type)s]-wrup
+                            RETURN wrup_edge.%(unq_edge_id_field_name)s, wrup.%(unq_node_id_field_name)s, wrup.%(wrup_title_field_name)s
+                            ORDER BY wrup.%(unq_node_id_field_name)s SKIP {skip} LIMIT {limit};
+                            ''' % {'unq_node_id_idx_name': TripelNode.UNIQUE_NODE_ID_INDEX_NAME,
+                                    'unq_node_id_field_name': TripelNode.UNIQUE_NODE_ID_FIELD_NAME,
+                                    'categorzn_edge_type': CategorizationEdge.EDGE_TYPE,
+                                    'unq_edge_id_field_name': CategorizationEdge.UNIQUE_EDGE_ID_FIELD_NAME,
+                                    'wrup_title_field_name': WriteupNode.WRITEUP_TITLE_FIELD_NAME}
+        jobs = [{'method': 'POST', 'to': '/cypher', 'id': i,
+                'body': {'query': wrup_page_cql, 'params': {'cat_id': str(page_specs[i][0]), 'skip': page_specs[i][1], 'limit': page_specs[i][2]}}}
+                for i in range(len(page_specs))]
+        job_results = dict((job_result['id'], job_result) for job_result in NeoUtil.run_rest_batch(neodb, jobs))
+        return dict((page_specs[i][0], job_results[i]['body']['data']) for i in range(len(page_specs)))
+    
+    @staticmethod
+    def get_category_subgraph(neodb, nodespace_id, root_cat_id=None, max_depth=1, children_page_size=20, children_offset=0):
+        """
+        level of detail view of a nodespace:  the graph under root_cat_id (default: the nodespace's root category), down 
+        to max_depth levels, with at most children_page_size children per category (subcategories, then writeups, each 
+        in unique id order, which stays put from page to page but is only roughly creation order, since ids come out of 
+        per-process blocks).  children_offset skips that many of root_cat_id's children, for paging through them.
+        
+        returns a graph dict (as from util.build_adhoc_graph_dict) with an extra 'has_more_children' entry:  a dict of 
+        category id -> the children_offset that gets the rest of its children, for each category in the result whose 
+        children weren't all included (including the ones at max_depth that have any children).  the idea is that 
+        a client shows the top of a big nodespace, and asks for more as the user expands categories, so that the 
+        payload and the neo work scale with what's on screen instead of with the nodespace.
+        
+        categories come from CategoryTreeCache.  writeups come from neo, in one batch request per level.  as elsewhere, the 
+        root category itself (and writeups filed directly under it) are left out.  raises KeyError if root_cat_id isn't a 
+        category in the nodespace.
+        """
+        cat_cache = CategoryTreeCache.get_cache()
+        ns_root_cat_id = cat_cache.get_root_cat_id(neodb, nodespace_id)
+        root_cat_id = int(root_cat_id) if root_cat_id is not None else ns_root_cat_id
+        graph_dict = {'nodes': {}, 'edges': {}, 'has_more_children': {}}
+        
+        def add_category(cat_id, cat_info):
+            if cat_id == ns_root_cat_id:
+                return
+            graph_dict['nodes'][cat_id] = util.build_adhoc_node_dict(cat_id, CategoryNode.NODE_TYPE, {CategoryNode.CAT_NAME_FIELD_NAME: cat_info['cat_name']})
+            if cat_info['parent_id'] in graph_dict['nodes']:
+                graph_dict['edges'][cat_info['parent_edge_id']] = util.build_adhoc_edge_dict(cat_info['parent_edge_id'], SubcategoryEdge.EDGE_TYPE, 
+                                                                                                cat_id, cat_info['parent_id'], None)
+        
+        # each level is a list of (cat_id, offset into its children)
+        level = [(root_cat_id, children_offset)]
+        for depth in range(max_depth + 1):
+            cat_infos = cat_cache.get_category_info(neodb, nodespace_id, [cat_id for cat_id, offset in level])
+            for cat_id, offset in level:
+                add_category(cat_id, cat_infos[cat_id])
             
-            cat_node = util.build_adhoc_node_dict(cat_id, CategoryNode.NODE_TYPE, {CategoryNode.CAT_NAME_FIELD_NAME: cat_name})
-            subcat_node = util.build_adhoc_node_dict(subcat_id, CategoryNode.NODE_TYPE, {CategoryNode.CAT_NAME_FIELD_NAME: subcat_name})
-            subcat_edge = util.build_adhoc_edge_dict(subcat_edge_id, SubcategoryEdge.EDGE_TYPE, subcat_id, cat_id, None)
+            if depth == max_depth:
+                # the children here won't be shown, but the client needs to know which categories have any
+                wrup_pages = AdhocNeoQueries._get_writeup_pages(neodb, [(cat_id, 0, 1) for cat_id, offset in level 
+                                                                        if not cat_infos[cat_id]['child_ids'] and cat_id != ns_root_cat_id])
+                for cat_id, offset in level:
+                    if cat_infos[cat_id]['child_ids'] or wrup_pages.get(cat_id):
+                        graph_dict['has_more_children'][cat_id] = offset
+                break
             
-            nodes = filter(lambda node: node['node_id'] is not None, [cat_node, subcat_node])
-            edges = filter(lambda edge: edge['edge_id'] is not None, [subcat_edge])
-            return (nodes, edges)
+            next_level = []
+            wrup_page_specs = []
+            for cat_id, offset in level:
+                child_ids = cat_infos[cat_id]['child_ids']
+                subcat_ids = child_ids[offset:offset+children_page_size]
+                next_level.extend([(subcat_id, 0) for subcat_id in subcat_ids])
+                if len(child_ids) > offset + children_page_size:
+                    graph_dict['has_more_children'][cat_id] = offset + children_page_size
+                elif cat_id != ns_root_cat_id:
+                    # fill the rest of the page with writeups, asking for one extra to find out if there are more
+                    num_wrups = children_page_size - len(subcat_ids)
+                    wrup_page_specs.append((cat_id, max(0, offset - len(child_ids)), num_wrups + 1))
+            
+            level_offsets = dict(level)
+            wrup_pages = AdhocNeoQueries._get_writeup_pages(neodb, wrup_page_specs)
+            for cat_id, skip, limit in wrup_page_specs:
+                wrup_rows = wrup_pages[cat_id]
+                if len(wrup_rows) == limit:
+                    graph_dict['has_more_children'][cat_id] = level_offsets[cat_id] + children_page_size
+                for wrup_edge_id, wrup_id, wrup_title in wrup_rows[:limit-1]:
+                    graph_dict['nodes'][wrup_id] = util.build_adhoc_node_dict(wrup_id, WriteupNode.NODE_TYPE, {WriteupNode.WRITEUP_TITLE_FIELD_NAME: wrup_title})
+                    graph_dict['edges'][wrup_edge_id] = util.build_adhoc_edge_dict(wrup_edge_id, CategorizationEdge.EDGE_TYPE, wrup_id, cat_id, None)
+            level = next_level
         
-        cat_list_cql = '''START ns=node:%(ns_idx_name)s(%(nodespace_id_field_name)s={nodespace_id}) 
-                                MATCH ns<-[:%(catroot_edge_type)s]-root_cat<-[:%(subcat_edge_type)s*]-user_cat
-                                WITH user_cat
-                                MATCH subcat_p=user_cat<-[subcat_edge:%(subcat_edge_type)s]-user_subcat
-                                RETURN user_cat.%(unq_node_id_field_name)s as cat_node_id, user_cat.%(cat_name_field_name)s as cat_name,
-                                    subcat_edge.%(unq_edge_id_field_name)s as subcat_edge_id, 
-                                    user_subcat.%(unq_node_id_field_name)s as subcat_node_id, user_subcat.%(cat_name_field_name)s as subcat_name;
-                                    ''' % {'ns_idx_name': NodespaceNode.NODESPACE_INDEX_NAME,
-                                            'nodespace_id_field_name': NodespaceNode.NODESPACE_ID_FIELD_NAME,
-                                            'unq_node_id_field_name': TripelNode.UNIQUE_NODE_ID_FIELD_NAME,
-                                            'subcat_edge_type': SubcategoryEdge.EDGE_TYPE,
-                                            'catroot_edge_type': CategoryRootEdge.EDGE_TYPE,
-                                            'unq_edge_id_field_name': SubcategoryEdge.UNIQUE_EDGE_ID_FIELD_NAME,
-                                            'cat_name_field_name': CategoryNode.CAT_NAME_FIELD_NAME}
-        query_results = cypher.execute(neodb, cat_list_cql, {'nodespace_id': nodespace_id})[0]
-        return util.build_adhoc_graph_dict(query_results, get_node_and_edge_dicts)
+        return graph_dict
     
     @staticmethod
-    def get_nodespace_categories_and_writeups(neodb, nodespace_id):
+    def _get_nodespace_categories_and_writeups_cartesian(neodb, nodespace_id):
+        """the old single query version of get_nodespace_categories_and_writeups.  only kept for comparison in tripel_benchmarks."""
         def get_node_and_edge_dicts(query_row):
             cat_id, cat_name = query_row[0], query_row[1]
             subcat_edge_id = query_row[2]
@@ -869,12 +3342,11 @@ class AdhocNeoQueries(object):
                                             'unq_edge_id_field_name': SubcategoryEdge.UNIQUE_EDGE_ID_FIELD_NAME,
                                             'cat_name_field_name': CategoryNode.CAT_NAME_FIELD_NAME,
                                             'wrup_title_field_name': WriteupNode.WRITEUP_TITLE_FIELD_NAME}
-        query_results = cypher.execute(neodb, cat_and_wrup_list_cql, {'nodespace_id': nodespace_id})[0]
+        query_results = NeoUtil.execute_cypher(neodb, cat_and_wrup_list_cql, {'nodespace_id': nodespace_id})
         return util.build_adhoc_graph_dict(query_results, get_node_and_edge_dicts)
 
-def init_neodb(db_tuple):
-    pgdb, neodb = db_tuple
-    
+def init_neo_indexes(neodb):
+    """makes sure all the indexes exist, and gets their handles into NeoIndexRegistry."""
     TripelEdge.get_unique_edge_id_index(neodb)
     CreatedByEdge.get_created_by_index(neodb)
     TripelNode.get_unique_node_id_index(neodb)
@@ -882,7 +3354,16 @@ def init_neodb(db_tuple):
     NodespaceNode.get_nodespace_index(neodb)
     CategoryNode.get_category_index(neodb)
     CommentNode.get_comment_index(neodb)
+    CommentNode.get_comment_thread_index(neodb)
     WriteupNode.get_writeup_index(neodb)
+    NodespaceContentNode.get_ns_content_index(neodb)
+    NotificationNode.get_notification_index(neodb)
+
+def init_neodb(db_tuple):
+    """one call per user and nodespace, which is fine for a small install.  see neo_bulk_loader for big ones."""
+    pgdb, neodb = db_tuple
+    
+    init_neo_indexes(neodb)
 
     #create a neo user node for each existing pg user
     users = User.get_all_users(pgdb)
@@ -901,6 +3382,7 @@ class PasswordChangeAuditEntry(PgPersistent):
     PK_COL_NAME = 'passwd_chg_id'
     SEQ_NAME = '%s.password_change_audit_log_passwd_chg_id_seq' % SCHEMA_NAME
     FIELD_NAMES = ['passwd_chg_id', 'updated_user', 'updating_user', 'passwd_chg_date']
+    DEFAULT_ORDER = 'passwd_chg_date desc'
     
     @classmethod
     def add_new_audit_log_entry(cls, pgdb, updated_user_id, updating_user_id, password_change_date):
@@ -910,18 +3392,19 @@ class PasswordChangeAuditEntry(PgPersistent):
         return audit_entry if audit_entry.passwd_chg_id is not None else None
     
     @classmethod
-    def get_audit_log_entries_for_user(cls, pgdb, user_id):
+    def get_audit_log_entries_for_user(cls, pgdb, user_id, after=None, limit=None):
         where_clause_vars = {'updated_user': user_id}
-        return cls._get_obj_list(pgdb, where_clause_vars, "passwd_chg_date desc")
+        return cls._get_obj_list(pgdb, where_clause_vars, after=after, limit=limit)
 
 class MetaspacePrivilegeAuditEntry(PgPersistent):
     TABLE_NAME = '%s.metaspace_privilege_audit_log' % SCHEMA_NAME
     PK_COL_NAME = 'ms_priv_chg_id'
     SEQ_NAME = '%s.metaspace_privilege_audit_log_ms_priv_chg_id_seq' % SCHEMA_NAME
     FIELD_NAMES = ['ms_priv_chg_id', 'updated_user', 'updating_user', 'is_enabled', 'new_privileges', 'ms_priv_chg_date']
+    DEFAULT_ORDER = 'ms_priv_chg_date desc'
     
     def _massage_raw_pg_output_vals(self):
-        self.new_privileges = MetaspacePrivilegeSet.create_from_pg_string_literal(self.new_privileges)
+        self.new_privileges = MetaspacePrivilegeSet.create_from_pg_array(self.new_privileges)
     
     @classmethod
     def add_new_audit_log_entry(cls, pgdb, updated_user_id, updating_user_id, is_enabled, new_privileges, privilege_change_date):
@@ -932,9 +3415,9 @@ class MetaspacePrivilegeAuditEntry(PgPersistent):
         return audit_entry if audit_entry.ms_priv_chg_id is not None else None
     
     @classmethod
-    def get_audit_log_entries_for_user(cls, pgdb, user_id):
+    def get_audit_log_entries_for_user(cls, pgdb, user_id, after=None, limit=None):
         where_clause_vars = {'updated_user': user_id}
-        return cls._get_obj_list(pgdb, where_clause_vars, "ms_priv_chg_date desc")
+        return cls._get_obj_list(pgdb, where_clause_vars, after=after, limit=limit)
 
 class AuthEvent(PgPersistent):
     SESSION_CREATED, SESSION_KILLED, SESSION_CLEANED = 'session_created', 'session_killed', 'session_cleaned'
@@ -944,6 +3427,7 @@ class AuthEvent(PgPersistent):
     PK_COL_NAME = 'auth_event_id'
     SEQ_NAME = '%s.auth_event_log_auth_event_id_seq' % SCHEMA_NAME
     FIELD_NAMES = ['auth_event_id', 'user_id', 'auth_event', 'auth_event_date']
+    DEFAULT_ORDER = 'auth_event_date desc'
 
     @classmethod
     def add_new_auth_event(cls, pgdb, user_id, auth_event, auth_event_date):
@@ -953,9 +3437,17 @@ class AuthEvent(PgPersistent):
         return audit_entry if audit_entry.auth_event_id is not None else None
     
     @classmethod
-    def get_audit_log_entries_for_user(cls, pgdb, user_id):
+    def add_new_auth_events(cls, pgdb, user_ids, auth_event, auth_event_date):
+        """the same event for each of user_ids, in one bulk insert."""
+        audit_entries = [cls() for user_id in user_ids]
+        ins_params_list = [{'user_id': user_id, 'auth_event': auth_event, 'auth_event_date': auth_event_date} for user_id in user_ids]
+        cls._bulk_ins_obj_instances_and_set_pk_atts(pgdb, audit_entries, ins_params_list)
+        return audit_entries
+    
+    @classmethod
+    def get_audit_log_entries_for_user(cls, pgdb, user_id, after=None, limit=None):
         where_clause_vars = {'user_id': user_id}
-        return cls._get_obj_list(pgdb, where_clause_vars, "auth_event_date desc")
+        return cls._get_obj_list(pgdb, where_clause_vars, after=after, limit=limit)
 
 
 class User(PgPersistent):
@@ -964,8 +3456,16 @@ class User(PgPersistent):
     SEQ_NAME = '%s.users_user_id_seq' % SCHEMA_NAME
     FIELD_NAMES = ['user_id', 'email_addr', 'username', 'encrypted_password', 'user_statement', 'is_enabled', 'metaspace_privileges', 'creator', 'creation_date', 'modifier', 'modification_date']
     
+    GET_USER_BY_ID_STMT = PgStatementRegistry.register('trpl_get_user_by_id', 'select * from %s where user_id = $user_id;' % TABLE_NAME)
+    RECENT_PASSWORD_FAILS_STMT = PgStatementRegistry.register('trpl_recent_password_fails', '''select count(ael.auth_event_id) recent_fail_count 
+                        from %(auth_event_tbl)s ael 
+                        where ael.user_id = $user_id
+                        and ael.auth_event = 'password_check_fail' 
+                        and ael.auth_event_date >= $cur_time::timestamp with time zone - $check_window::integer * interval '1 minute';
+                        ''' % {'auth_event_tbl': AuthEvent.TABLE_NAME})
+    
     def _massage_raw_pg_output_vals(self):
-        self.metaspace_privileges = MetaspacePrivilegeSet.create_from_pg_string_literal(self.metaspace_privileges) 
+        self.metaspace_privileges = MetaspacePrivilegeSet.create_from_pg_array(self.metaspace_privileges) 
     
     @classmethod
     def create_new_user(cls, db_tuple, email_addr, username, cleartext_password, user_statement, is_enabled, metaspace_privileges, creator):
@@ -1000,8 +3500,7 @@ class User(PgPersistent):
     
     @classmethod
     def get_existing_user_by_id(cls, pgdb, user_id):
-        where_clause_vars = {'user_id': user_id}
-        return cls._get_existing_user(pgdb, where_clause_vars)
+        return cls._get_single_obj_instance_prepared(pgdb, cls.GET_USER_BY_ID_STMT, {'user_id': user_id})
     
     @classmethod
     def get_existing_user_by_username(cls, pgdb, username):
@@ -1012,14 +3511,9 @@ class User(PgPersistent):
         return cryptacular.bcrypt.BCRYPTPasswordManager().check(self.encrypted_password, cleartext_password)
     
     def can_check_password(self, pgdb):
-        query_sql = '''select count(ael.auth_event_id) recent_fail_count 
-                        from %(auth_event_tbl)s ael 
-                        where ael.user_id = $user_id
-                        and ael.auth_event = 'password_check_fail' 
-                        and ael.auth_event_date >= (timestamp with time zone $cur_time) - (interval '$check_window minutes')
-                        ''' % {'auth_event_tbl': AuthEvent.TABLE_NAME}
         where_clause_vars = {'user_id': self.user_id, 'cur_time': DateTimeUtil.datetime_now_utc_aware(), 'check_window': params.PASSWORD_CHECK_WINDOW_IN_MIN}
-        query_results = pgdb.query(query_sql, vars=where_clause_vars)
+        # from the primary, so that a burst of guesses can't outrun replication
+        query_results = PgStatementRegistry.query(PgUtil.get_primary_db(pgdb), self.RECENT_PASSWORD_FAILS_STMT, where_clause_vars)
         return query_results[0]['recent_fail_count'] < params.PASSWORD_CHECK_MAX_FAILURES
     
     class TooManyBadPasswordsException(Exception):
@@ -1077,11 +3571,26 @@ class User(PgPersistent):
             PasswordChangeAuditEntry.add_new_audit_log_entry(pgdb, self.user_id, modifier, self.modification_date)
     
     @classmethod
-    def get_all_users(cls, pgdb):
-        return cls._get_obj_list(pgdb, {})
+    def get_all_users(cls, pgdb, after=None, limit=None):
+        return cls._get_obj_list(pgdb, {}, after=after, limit=limit)
+    
+    # the order for the user lists below that aren't plain _get_obj_list queries (for PgUtil.get_next_page_cursor)
+    USER_LIST_ORDER_COLS = [('u.user_id', False)]
+    
+    @classmethod
+    def _get_user_list_page_clauses(cls, nodespace_id, after, limit):
+        """(extra where clause, query vars, order by and limit clauses) for a page of one of the user list queries."""
+        keyset_where_clause, query_vars, order_clause = PgUtil.get_keyset_clauses(cls.USER_LIST_ORDER_COLS, after)
+        query_vars['nodespace_id'] = nodespace_id
+        page_clause = 'order by %s' % order_clause
+        if limit is not None:
+            page_clause += ' limit $limit'
+            query_vars['limit'] = limit
+        return ('and %s' % keyset_where_clause if keyset_where_clause is not None else ''), query_vars, page_clause
     
     @classmethod
-    def get_user_and_access_info_by_nodespace_id(cls, pgdb, nodespace_id):
+    def get_user_and_access_info_by_nodespace_id(cls, pgdb, nodespace_id, after=None, limit=None):
+        keyset_where_clause, query_vars, page_clause = cls._get_user_list_page_clauses(nodespace_id, after, limit)
         query_sql = '''select u.user_id,
                         u.email_addr,
                         u.username,
@@ -1093,13 +3602,16 @@ class User(PgPersistent):
                     from %(user_tbl)s u, 
                         %(nsam_tbl)s nsam 
                     where u.user_id = nsam.user_id 
-                    and nsam.nodespace_id = $nodespace_id;''' % {'user_tbl': cls.TABLE_NAME, 'nsam_tbl': NodespaceAccessEntry.TABLE_NAME}
-        where_clause_vars = {'nodespace_id': nodespace_id}
-        query_results = list(pgdb.query(query_sql, vars=where_clause_vars))
+                    and nsam.nodespace_id = $nodespace_id
+                    %(keyset_where_clause)s
+                    %(page_clause)s;''' % {'user_tbl': cls.TABLE_NAME, 'nsam_tbl': NodespaceAccessEntry.TABLE_NAME, 
+                                            'keyset_where_clause': keyset_where_clause, 'page_clause': page_clause}
+        query_results = list(pgdb.query(query_sql, vars=query_vars))
         return query_results
     
     @classmethod
-    def get_users_absent_from_nodespace(cls, pgdb, nodespace_id):
+    def get_users_absent_from_nodespace(cls, pgdb, nodespace_id, after=None, limit=None):
+        keyset_where_clause, query_vars, page_clause = cls._get_user_list_page_clauses(nodespace_id, after, limit)
         query_sql = '''select u.user_id,
                         u.email_addr,
                         u.username,
@@ -1108,9 +3620,11 @@ class User(PgPersistent):
                     from %(user_tbl)s u
                     where u.user_id not in (select nsam.user_id 
                                             from %(nsam_tbl)s nsam 
-                                            where nsam.nodespace_id = $nodespace_id);''' % {'user_tbl': cls.TABLE_NAME, 'nsam_tbl': NodespaceAccessEntry.TABLE_NAME}
-        where_clause_vars = {'nodespace_id': nodespace_id}
-        query_results = list(pgdb.query(query_sql, vars=where_clause_vars))
+                                            where nsam.nodespace_id = $nodespace_id)
+                    %(keyset_where_clause)s
+                    %(page_clause)s;''' % {'user_tbl': cls.TABLE_NAME, 'nsam_tbl': NodespaceAccessEntry.TABLE_NAME, 
+                                            'keyset_where_clause': keyset_where_clause, 'page_clause': page_clause}
+        query_results = list(pgdb.query(query_sql, vars=query_vars))
         return query_results
     
     #TODO: need a way to list invitations from a given user.
@@ -1119,47 +3633,105 @@ class User(PgPersistent):
 
 class PrivilegeSet(object):
     """
-    don't use this directly, use one of the subclasses that defines RECOGNIZED_PRIVILEGES.
+    don't use this directly, use one of the subclasses that defines _ORDERED_PRIV_LIST, RECOGNIZED_PRIVILEGES, _PRIV_BITS (a 
+    bit for each privilege, by its position in _ORDERED_PRIV_LIST), and its own _INTERNED and _INTERNED_BY_PG_LITERAL dicts.
+    
+    apologies for the name, this doesn't actually subclass the python set class.  the privileges are kept as a bitmask 
+    over _ORDERED_PRIV_LIST, so privilege checks are a bitwise op.
     
-    apologies for the name, this doesn't actually subclass the 
-    python set class, though it does use a set to store its data.
+    the sets parsed from the db are interned:  there's one shared instance per distinct set of privileges, and parsing a 
+    literal that's been seen before is just a dict lookup.  so interned instances can't be changed (add_privilege and 
+    remove_privilege raise TypeError on them).  create_from_list_of_strings and the constructor still give a new instance 
+    of your very own.
     """
-    def __init__(self):
-        self._privileges = set()
+    __slots__ = ('_mask', '_is_interned')
+    
+    def __init__(self, mask=0):
+        self._mask = mask
+        self._is_interned = False
     
     @classmethod
-    def create_from_list_of_strings(cls, priv_list):
-        privilege_set = cls()
-        privilege_set._privileges = set(filter(cls.is_valid_privilege, priv_list))
+    def _get_mask(cls, privileges):
+        """the bitmask for privileges, which can be a PrivilegeSet of this type or a collection of privilege strings.  unrecognized privileges are ignored."""
+        if isinstance(privileges, cls):
+            return privileges._mask
+        mask = 0
+        for privilege in privileges:
+            mask |= cls._PRIV_BITS.get(privilege, 0)
+        return mask
+    
+    @classmethod
+    def get_interned(cls, mask):
+        privilege_set = cls._INTERNED.get(mask)
+        if privilege_set is None:
+            privilege_set = cls(mask)
+            privilege_set._is_interned = True
+            privilege_set = cls._INTERNED.setdefault(mask, privilege_set)
         return privilege_set
+    
+    @classmethod
+    def create_from_list_of_strings(cls, priv_list):
+        return cls(cls._get_mask(priv_list))
+
+    @classmethod
+    def create_interned_from_list_of_strings(cls, priv_list):
+        return cls.get_interned(cls._get_mask(priv_list))
 
     @classmethod
     def create_from_pg_string_literal(cls, priv_list_string):
-        priv_list = priv_list_string.strip(' {}').replace(' ', '').split(',')
-        return cls.create_from_list_of_strings(priv_list)
+        """returns an interned instance."""
+        privilege_set = cls._INTERNED_BY_PG_LITERAL.get(priv_list_string)
+        if privilege_set is None:
+            priv_list = priv_list_string.strip(' {}').replace(' ', '').split(',')
+            privilege_set = cls.create_interned_from_list_of_strings(priv_list)
+            cls._INTERNED_BY_PG_LITERAL[priv_list_string] = privilege_set
+        return privilege_set
+    
+    @classmethod
+    def create_from_pg_array(cls, pg_array):
+        """
+        for a privilege enum array column as it comes back from the db:  psycopg2 hands back arrays of enums as '{a,b}' 
+        literals unless a typecaster for the enum array has been registered, in which case they're lists.  returns an 
+        interned instance either way.
+        """
+        if isinstance(pg_array, basestring):
+            return cls.create_from_pg_string_literal(pg_array)
+        return cls.create_interned_from_list_of_strings(pg_array)
 
     @classmethod
     def is_valid_privilege(cls, privilege):
         return privilege in cls.RECOGNIZED_PRIVILEGES
     
     def get_pg_string_literal(self):
-        return '{%s}' % ','.join(self._privileges)
+        return '{%s}' % ','.join(self)
+
+    def _check_is_mutable(self):
+        if self._is_interned:
+            raise TypeError('interned privilege sets are shared and can\'t be changed, use create_from_list_of_strings to get a copy')
 
     def add_privilege(self, privilege):
-        if self.is_valid_privilege(privilege):
-            self._privileges.add(privilege)
+        self._check_is_mutable()
+        self._mask |= self._PRIV_BITS.get(privilege, 0)
 
     def remove_privilege(self, privilege):
-        self._privileges.discard(privilege)
+        self._check_is_mutable()
+        self._mask &= ~self._PRIV_BITS.get(privilege, 0)
     
     def has_privilege(self, privilege):
-        return privilege in self._privileges
+        return self._mask & self._PRIV_BITS.get(privilege, 0) != 0
         
     def has_one_or_more_privileges(self, privileges):
-        return len(privileges.intersection(self._privileges)) > 0
+        """privileges can be a PrivilegeSet of the same type (the fast way, if it's a constant) or a collection of privilege strings."""
+        if type(privileges) is type(self):
+            return self._mask & privileges._mask != 0
+        return self._mask & self._get_mask(privileges) != 0
 
     def has_all_privileges(self, privileges):
-        return self._privileges.issuperset(privileges)
+        """same deal with privileges as has_one_or_more_privileges.  unrecognized privileges don't count as held."""
+        if not isinstance(privileges, PrivilegeSet) and not all(map(self.is_valid_privilege, privileges)):
+            return False
+        required_mask = self._get_mask(privileges)
+        return (self._mask & required_mask) == required_mask
     
     def get_grantable_privileges(self):
         raise NotImplementedError('subclass must implement this')
@@ -1185,7 +3757,7 @@ class PrivilegeSet(object):
         return self.get_pg_string_literal()
     
     def __iter__(self):
-        return iter(self._privileges)
+        return iter([privilege for privilege in self._ORDERED_PRIV_LIST if self._mask & self._PRIV_BITS[privilege]])
 
     def _eq_check_helper(self, other, check_fn):
         if other is None:
@@ -1196,17 +3768,20 @@ class PrivilegeSet(object):
             raise TypeError('can only compare PrivilegeSet objects of the same type. type(self)=%s, type(other)=%s' % (type(self), type(other)))
     
     def __eq__(self, other):
-        def check_fn(left, right): return left._privileges == right._privileges
+        def check_fn(left, right): return left._mask == right._mask
         return self._eq_check_helper(other, check_fn)
     
     def __ne__(self, other):
-        def check_fn(left, right): return left._privileges != right._privileges
+        def check_fn(left, right): return left._mask != right._mask
         return self._eq_check_helper(other, check_fn)
 
 class MetaspacePrivilegeSet(PrivilegeSet):
     CREATE_USER, CREATE_SPACE, SUPER = 'create_user', 'create_space', 'super'
     _ORDERED_PRIV_LIST = [CREATE_USER, CREATE_SPACE, SUPER]
     RECOGNIZED_PRIVILEGES = frozenset(_ORDERED_PRIV_LIST)
+    _PRIV_BITS = dict((priv, 1 << i) for i, priv in enumerate(_ORDERED_PRIV_LIST))
+    _INTERNED, _INTERNED_BY_PG_LITERAL = {}, {}
+    __slots__ = ()
     
     def get_grantable_privileges(self):
         if self.has_privilege(self.SUPER):
@@ -1218,6 +3793,9 @@ class NodespacePrivilegeSet(PrivilegeSet):
     CONTRIBUTOR, EDITOR, MODERATOR, ADMIN = 'contributor', 'editor', 'moderator', 'admin'
     _ORDERED_PRIV_LIST = [CONTRIBUTOR, EDITOR, MODERATOR, ADMIN]
     RECOGNIZED_PRIVILEGES = frozenset(_ORDERED_PRIV_LIST)
+    _PRIV_BITS = dict((priv, 1 << i) for i, priv in enumerate(_ORDERED_PRIV_LIST))
+    _INTERNED, _INTERNED_BY_PG_LITERAL = {}, {}
+    __slots__ = ()
     
     def get_grantable_privileges(self):
         if self.has_privilege(self.ADMIN):
@@ -1273,6 +3851,7 @@ class MetaspacePrivilegeChecker(PrivilegeChecker):
     GRANT_NODESPACE_ACCESS_SANS_INV_ACTION = 'grant_nodespace_access_sans_inv_act'
     RECOGNIZED_ACTIONS = frozenset([VIEW_METASPACE_COMMANDS_ACTION, CREATE_USER_ACTION, CREATE_SPACE_ACTION, LIST_ALL_SPACES_ACTION, 
                                     ALTER_USER_INFO_ACTION, ALTER_USER_ACCESS_ACTION, LIST_ALL_USERS_ACTION, GRANT_NODESPACE_ACCESS_SANS_INV_ACTION])
+    ALL_METASPACE_PRIVS = MetaspacePrivilegeSet.create_interned_from_list_of_strings(MetaspacePrivilegeSet.RECOGNIZED_PRIVILEGES)
     
     @classmethod
     def get_action_check_fn(cls, action):
@@ -1293,7 +3872,7 @@ class MetaspacePrivilegeChecker(PrivilegeChecker):
     
     @classmethod
     def can_view_metaspace_commands(cls, db_tuple, target, actor):
-        return len(actor.metaspace_privileges._privileges) > 0
+        return actor.metaspace_privileges.has_one_or_more_privileges(cls.ALL_METASPACE_PRIVS)
     
     @classmethod
     def can_create_user(cls, db_tuple, target, actor):
@@ -1320,6 +3899,8 @@ class NodespacePrivilegeChecker(PrivilegeChecker):
     RECOGNIZED_ACTIONS = frozenset([CREATE_COMMENT_ACTION, APPROVE_COMMENT_ACTION, EDIT_COMMENT_ACTION, DELETE_COMMENT_ACTION,
                                     CREATE_WRITEUP_ACTION, APPROVE_WRITEUP_ACTION, EDIT_WRITEUP_ACTION, DELETE_WRITEUP_ACTION,
                                     ALTER_NODESPACE_ACTION, ALTER_NODESPACE_ACCESS_ACTION, VIEW_NODESPACE_ACTION])
+    # enough to add comments and writeups
+    CONTENT_CREATION_PRIVS = NodespacePrivilegeSet.create_interned_from_list_of_strings([NodespacePrivilegeSet.CONTRIBUTOR, NodespacePrivilegeSet.ADMIN])
     
     @classmethod
     def get_action_check_fn(cls, action):
@@ -1360,23 +3941,19 @@ class NodespacePrivilegeChecker(PrivilegeChecker):
     def can_create_comment_thread_on(cls, db_tuple, target, actor):
         pgdb, neodb = db_tuple
         assert isinstance(target, (CategoryNode, WriteupNode))
-        parent_nodespace = target.get_parent_nodespace(neodb)
-        parent_nodespace_id = parent_nodespace._properties[NodespaceNode.NODESPACE_ID_FIELD_NAME]
+        parent_nodespace_id = target.get_parent_nodespace_id(neodb)
         ns_access = NodespaceAccessEntry.get_existing_access_entry(pgdb, parent_nodespace_id, actor.user_id)
         ns_privs = ns_access.nodespace_privileges if ns_access is not None else None
-        sufficient_privs = frozenset([NodespacePrivilegeSet.CONTRIBUTOR, NodespacePrivilegeSet.ADMIN])
-        return ns_privs.has_one_or_more_privileges(sufficient_privs) if ns_privs is not None else False
+        return ns_privs.has_one_or_more_privileges(cls.CONTENT_CREATION_PRIVS) if ns_privs is not None else False
     
     @classmethod
     def can_reply_to_comment(cls, db_tuple, target, actor):
         pgdb, neodb = db_tuple
         assert isinstance(target, CommentNode)
-        parent_nodespace = target.get_parent_nodespace(neodb)
-        parent_nodespace_id = parent_nodespace._properties[NodespaceNode.NODESPACE_ID_FIELD_NAME]
+        parent_nodespace_id = target.get_parent_nodespace_id(neodb)
         ns_access = NodespaceAccessEntry.get_existing_access_entry(pgdb, parent_nodespace_id, actor.user_id)
         ns_privs = ns_access.nodespace_privileges if ns_access is not None else None
-        sufficient_privs = frozenset([NodespacePrivilegeSet.CONTRIBUTOR, NodespacePrivilegeSet.ADMIN])
-        return ns_privs.has_one_or_more_privileges(sufficient_privs) if ns_privs is not None else False
+        return ns_privs.has_one_or_more_privileges(cls.CONTENT_CREATION_PRIVS) if ns_privs is not None else False
     
     @classmethod
     def can_edit_comment(cls, db_tuple, target, actor):
@@ -1388,12 +3965,10 @@ class NodespacePrivilegeChecker(PrivilegeChecker):
     #TODO: too much repetition across create comment, reply to comment, and create writeup methods.  refactor.
         pgdb, neodb = db_tuple
         assert isinstance(target, CategoryNode)
-        parent_nodespace = target.get_parent_nodespace(neodb)
-        parent_nodespace_id = parent_nodespace._properties[NodespaceNode.NODESPACE_ID_FIELD_NAME]
+        parent_nodespace_id = target.get_parent_nodespace_id(neodb)
         ns_access = NodespaceAccessEntry.get_existing_access_entry(pgdb, parent_nodespace_id, actor.user_id)
         ns_privs = ns_access.nodespace_privileges if ns_access is not None else None
-        sufficient_privs = frozenset([NodespacePrivilegeSet.CONTRIBUTOR, NodespacePrivilegeSet.ADMIN])
-        return ns_privs.has_one_or_more_privileges(sufficient_privs) if ns_privs is not None else False
+        return ns_privs.has_one_or_more_privileges(cls.CONTENT_CREATION_PRIVS) if ns_privs is not None else False
     
     @classmethod
     def can_edit_writeup(cls, db_tuple, target, actor):
@@ -1452,7 +4027,7 @@ class MetaspaceInvitation(Invitation, PgPersistent):
         return invitation if invitation.metaspace_invitation_id is not None else None
     
     def _massage_raw_pg_output_vals(self):
-        self.initial_metaspace_privileges = MetaspacePrivilegeSet.create_from_pg_string_literal(self.initial_metaspace_privileges)
+        self.initial_metaspace_privileges = MetaspacePrivilegeSet.create_from_pg_array(self.initial_metaspace_privileges)
     
     @classmethod
     def get_existing_invitation(cls, pgdb, metaspace_invitation_code):
@@ -1483,11 +4058,15 @@ class NodespaceAccessEntry(PgPersistent):
     FIELD_NAMES = ['nodespace_access_id', 'user_id', 'nodespace_id', 'is_enabled', 'nodespace_privileges', 
                     'invitation_id', 'creator', 'creation_date', 'modifier', 'modification_date']
     
+    GET_ACCESS_ENTRY_STMT = PgStatementRegistry.register('trpl_get_ns_access_entry', 
+                                                        'select * from %s where nodespace_id = $nodespace_id and user_id = $user_id;' % TABLE_NAME)
+    
     def _massage_raw_pg_output_vals(self):
-        self.nodespace_privileges = NodespacePrivilegeSet.create_from_pg_string_literal(self.nodespace_privileges)
+        self.nodespace_privileges = NodespacePrivilegeSet.create_from_pg_array(self.nodespace_privileges)
     
     @classmethod
-    def create_new_access_entry(cls, pgdb, nodespace_id, nodespace_privileges, granted_to_user_id, granted_by_user_id, invitation_id):
+    def _new_access_entry_obj_instance(cls, nodespace_id, nodespace_privileges, granted_to_user_id, granted_by_user_id, invitation_id):
+        """returns (access entry, insert params)."""
         access_entry = cls()
         access_entry.user_id = granted_to_user_id
         access_entry.nodespace_id = nodespace_id
@@ -1497,14 +4076,28 @@ class NodespaceAccessEntry(PgPersistent):
         access_entry.creator = granted_by_user_id
         access_entry.creation_date = DateTimeUtil.datetime_now_utc_aware()
         ins_params = access_entry.__dict__.copy()
-        ins_params['nodespace_privileges'] = nodespace_privileges.get_pg_string_literal()
+        ins_params['nodespace_privileges'] = access_entry.nodespace_privileges.get_pg_string_literal()
+        return access_entry, ins_params
+    
+    @classmethod
+    def create_new_access_entry(cls, pgdb, nodespace_id, nodespace_privileges, granted_to_user_id, granted_by_user_id, invitation_id):
+        access_entry, ins_params = cls._new_access_entry_obj_instance(nodespace_id, nodespace_privileges, granted_to_user_id, granted_by_user_id, invitation_id)
         access_entry._ins_obj_instance_and_set_pk_att(pgdb, ins_params)
         return access_entry if access_entry.nodespace_access_id is not None else None
     
+    @classmethod
+    def create_new_access_entries(cls, pgdb, nodespace_id, nodespace_privileges, granted_to_user_ids, granted_by_user_id, invitation_id):
+        """create_new_access_entry for each of granted_to_user_ids, in one bulk insert.  returns the new access entries."""
+        new_entries = [cls._new_access_entry_obj_instance(nodespace_id, nodespace_privileges, user_id, granted_by_user_id, invitation_id) 
+                        for user_id in granted_to_user_ids]
+        access_entries = [access_entry for access_entry, ins_params in new_entries]
+        cls._bulk_ins_obj_instances_and_set_pk_atts(pgdb, access_entries, [ins_params for access_entry, ins_params in new_entries])
+        return access_entries
+    
     @classmethod
     def get_existing_access_entry(cls, pgdb, nodespace_id, user_id):
         where_clause_vars = {'nodespace_id': nodespace_id, 'user_id': user_id}
-        return cls._get_single_obj_instance(pgdb, where_clause_vars)
+        return cls._get_single_obj_instance_prepared(pgdb, cls.GET_ACCESS_ENTRY_STMT, where_clause_vars)
     
     def set_and_save_access_entry(self, pgdb, new_nodespace_privileges, is_enabled, modifier):
         self.nodespace_privileges = new_nodespace_privileges
@@ -1593,12 +4186,16 @@ class Nodespace(PgPersistent):
         return cls._query_results_to_obj_list(query_results)
     
     @classmethod
-    def get_all_nodespaces(cls, pgdb):
-        return cls._get_obj_list(pgdb, {})
+    def get_all_nodespaces(cls, pgdb, after=None, limit=None):
+        return cls._get_obj_list(pgdb, {}, after=after, limit=limit)
     
     @classmethod
     def grant_user_access_to_nodespace(cls, pgdb, nodespace_id, nodespace_privileges, granted_to_user_id, granted_by_user_id, invitation_id):
         return NodespaceAccessEntry.create_new_access_entry(pgdb, nodespace_id, nodespace_privileges, granted_to_user_id, granted_by_user_id, invitation_id)
+    
+    @classmethod
+    def grant_users_access_to_nodespace(cls, pgdb, nodespace_id, nodespace_privileges, granted_to_user_ids, granted_by_user_id, invitation_id):
+        return NodespaceAccessEntry.create_new_access_entries(pgdb, nodespace_id, nodespace_privileges, granted_to_user_ids, granted_by_user_id, invitation_id)
 
     def get_nodespace_access_for_user(self, pgdb, user_id):
         return NodespaceAccessEntry.get_existing_access_entry(pgdb, self.nodespace_id, user_id)
@@ -1623,10 +4220,11 @@ class NodespaceInvitation(Invitation, PgPersistent):
                     'invitation_msg', 'creator', 'creation_date', 'decision_date', 'was_accepted', 'user_id']
     
     def _massage_raw_pg_output_vals(self):
-        self.initial_nodespace_privileges = NodespacePrivilegeSet.create_from_pg_string_literal(self.initial_nodespace_privileges)
+        self.initial_nodespace_privileges = NodespacePrivilegeSet.create_from_pg_array(self.initial_nodespace_privileges)
     
     @classmethod
-    def create_new_invitation(cls, pgdb, nodespace_invitation_code, invitee_email_addr, nodespace_id, initial_nodespace_privileges, invitation_msg, creator):
+    def _new_nodespace_invitation_obj_instance(cls, nodespace_invitation_code, invitee_email_addr, nodespace_id, initial_nodespace_privileges, invitation_msg, creator):
+        """returns (invitation, insert params)."""
         invitation = cls._new_invitation_obj_instance(invitee_email_addr, invitation_msg, creator)
         nodespace_invitation_code = nodespace_invitation_code if nodespace_invitation_code is not None else cls.generate_random_invitation_code()
         cls.validate_invitation_code_format(nodespace_invitation_code)
@@ -1636,8 +4234,23 @@ class NodespaceInvitation(Invitation, PgPersistent):
         invitation.user_id = None
         ins_params = invitation.__dict__.copy()
         ins_params['initial_nodespace_privileges'] = invitation.initial_nodespace_privileges.get_pg_string_literal()
+        return invitation, ins_params
+    
+    @classmethod
+    def create_new_invitation(cls, pgdb, nodespace_invitation_code, invitee_email_addr, nodespace_id, initial_nodespace_privileges, invitation_msg, creator):
+        invitation, ins_params = cls._new_nodespace_invitation_obj_instance(nodespace_invitation_code, invitee_email_addr, nodespace_id, 
+                                                                            initial_nodespace_privileges, invitation_msg, creator)
         invitation._ins_obj_instance_and_set_pk_att(pgdb, ins_params)
         return invitation if invitation.nodespace_invitation_id is not None else None
+    
+    @classmethod
+    def create_new_invitations(cls, pgdb, invitee_email_addrs, nodespace_id, initial_nodespace_privileges, invitation_msg, creator):
+        """an invitation (with a random code) for each of invitee_email_addrs, in one bulk insert.  returns the new invitations."""
+        new_invitations = [cls._new_nodespace_invitation_obj_instance(None, invitee_email_addr, nodespace_id, initial_nodespace_privileges, invitation_msg, creator) 
+                            for invitee_email_addr in invitee_email_addrs]
+        invitations = [invitation for invitation, ins_params in new_invitations]
+        cls._bulk_ins_obj_instances_and_set_pk_atts(pgdb, invitations, [ins_params for invitation, ins_params in new_invitations])
+        return invitations
 
     @classmethod
     def get_existing_invitation(cls, pgdb, nodespace_invitation_code):
@@ -1672,6 +4285,8 @@ class MetaspaceSession(PgPersistent):
     PK_COL_NAME = 'metaspace_session_id'
     FIELD_NAMES = ['metaspace_session_id', 'user_id', 'creation_date', 'last_visit']
     
+    GET_SESSION_STMT = PgStatementRegistry.register('trpl_get_ms_session', 'select * from %s where metaspace_session_id = $metaspace_session_id;' % TABLE_NAME)
+    
     # specified in seconds
     MAX_SESSION_IDLE_TIME = 3600 #session expiry after 1 hr inactivity
     MAX_SESSION_AGE = 43200 #session expiry after 12 hrs, regardless of activity
@@ -1695,7 +4310,7 @@ class MetaspaceSession(PgPersistent):
     @classmethod
     def get_existing_session(cls, pgdb, metaspace_session_id):
         where_clause_vars = {'metaspace_session_id': metaspace_session_id}
-        return cls._get_single_obj_instance(pgdb, where_clause_vars)
+        return cls._get_single_obj_instance_prepared(pgdb, cls.GET_SESSION_STMT, where_clause_vars)
     
     def is_session_valid(self):
         cur_time = DateTimeUtil.datetime_now_utc_aware()
@@ -1704,7 +4319,8 @@ class MetaspaceSession(PgPersistent):
     def touch_session(self, pgdb):
         self.last_visit = DateTimeUtil.datetime_now_utc_aware()
         upd_params = {'last_visit': self.last_visit}
-        pgdb.update(self.TABLE_NAME, where='metaspace_session_id = $metaspace_session_id', 
+        # this happens on every request, and nothing reads last_visit back right away, so it doesn't pin the client to the primary
+        PgUtil.get_primary_db(pgdb).update(self.TABLE_NAME, where='metaspace_session_id = $metaspace_session_id', 
                     vars={'metaspace_session_id': self.metaspace_session_id}, **upd_params)
     
     def kill_session(self, pgdb):
@@ -1735,7 +4351,60 @@ class MetaspaceSession(PgPersistent):
         cur_time = DateTimeUtil.datetime_now_utc_aware()
         del_vars = {'cur_time': cur_time, 'cleanup_age': cls.MAX_SESSION_AGE*2}
         where_clause = "(((timestamp with time zone '$cur_time') - creation_date) > (interval '$cleanup_age seconds'))"
-        #TODO: need to be logging this in auth events, though it's not actually used at the moment anyway
-        pgdb.delete(cls.TABLE_NAME, where=where_clause, vars=del_vars)
+        with pgdb.transaction():
+            query_results = pgdb.query('delete from %s where %s returning user_id;' % (cls.TABLE_NAME, where_clause), vars=del_vars)
+            AuthEvent.add_new_auth_events(pgdb, [row['user_id'] for row in query_results], AuthEvent.SESSION_CLEANED, cur_time)
 
+class SavedSearch(PgPersistent):
+    """
+    a user's standing search:  search_query is matched against new categories, writeups and comments the same way as 
+    ContentSearch matches it (every word has to show up), and the user gets a NotificationNode for each match.  
+    nodespace_id limits it to one nodespace, or it's None for every nodespace the user can view.
+    """
+    TABLE_NAME = '%s.saved_searches' % SCHEMA_NAME
+    PK_COL_NAME = 'saved_search_id'
+    SEQ_NAME = '%s.saved_searches_saved_search_id_seq' % SCHEMA_NAME
+    FIELD_NAMES = ['saved_search_id', 'user_id', 'nodespace_id', 'search_query', 'is_enabled', 'creation_date']
+    
+    @classmethod
+    def create_new_saved_search(cls, pgdb, user_id, nodespace_id, search_query):
+        saved_search = cls()
+        ins_params = {'user_id': user_id, 'nodespace_id': nodespace_id, 'search_query': search_query, 'is_enabled': True,
+                        'creation_date': DateTimeUtil.datetime_now_utc_aware()}
+        saved_search._ins_obj_instance_and_set_pk_att(pgdb, ins_params)
+        return saved_search if saved_search.saved_search_id is not None else None
+    
+    @classmethod
+    def get_saved_searches_for_user(cls, pgdb, user_id):
+        return cls._get_obj_list(pgdb, {'user_id': user_id}, 'saved_search_id')
+    
+    def set_is_enabled(self, pgdb, is_enabled):
+        self.is_enabled = is_enabled
+        pgdb.update(self.TABLE_NAME, where='saved_search_id = $saved_search_id', vars={'saved_search_id': self.saved_search_id}, is_enabled=is_enabled)
 
+class SavedSearchCheckpoint(PgPersistent):
+    """
+    how far a saved search evaluator has gotten through new content:  the creation date and unique edge id of the last 
+    CreatedByEdge it handled.  dates can repeat, so the edge id breaks ties.
+    """
+    TABLE_NAME = '%s.saved_search_checkpoints' % SCHEMA_NAME
+    PK_COL_NAME = 'checkpoint_name'
+    FIELD_NAMES = ['checkpoint_name', 'last_creation_date', 'last_edge_id', 'modification_date']
+    
+    @classmethod
+    def get_checkpoint(cls, pgdb, checkpoint_name):
+        return cls._get_single_obj_instance(pgdb, {'checkpoint_name': checkpoint_name})
+    
+    @classmethod
+    def save_checkpoint(cls, pgdb, checkpoint_name, last_creation_date, last_edge_id):
+        checkpoint = cls()
+        checkpoint.checkpoint_name = checkpoint_name
+        checkpoint.last_creation_date = last_creation_date
+        checkpoint.last_edge_id = last_edge_id
+        checkpoint.modification_date = DateTimeUtil.datetime_now_utc_aware()
+        upd_params = {'last_creation_date': last_creation_date, 'last_edge_id': last_edge_id, 'modification_date': checkpoint.modification_date}
+        with pgdb.transaction():
+            num_updated = pgdb.update(cls.TABLE_NAME, where='checkpoint_name = $checkpoint_name', vars={'checkpoint_name': checkpoint_name}, **upd_params)
+            if num_updated == 0:
+                pgdb.insert(cls.TABLE_NAME, seqname=False, **checkpoint.as_dict())
+        return checkpoint
@@ -7,6 +7,7 @@ TODO: pages that return json should all:
 import re
 import urllib
 import json
+import logging
 
 import web
 
@@ -15,11 +16,13 @@ import config.parameters as params
 import config.messages as messages
 import util
 
+logger = logging.getLogger(__name__)
 
 
 RENDER = web.template.render(params.TEMPLATE_DIR)
 
-PGDB = tc.PgUtil.get_db_conn_ssl(params.PG_DBNAME, params.PG_USERNAME, util.get_file_contents(params.PG_PASS_FILENAME))
+PGDB = tc.PgUtil.get_db_conn_ssl(params.PG_DBNAME, params.PG_USERNAME, util.get_file_contents(params.PG_PASS_FILENAME), 
+                                    replica_settings_list=params.PG_REPLICAS)
 NEODB = tc.NeoUtil.get_db_conn()
 DB_TUPLE = (PGDB, NEODB)
 
@@ -244,7 +247,7 @@ class BasePage(object):
 class ListTablePage(object):
     @classmethod
     def _get_col_keys(cls, table_data):
-        return table_data[0].__dict__.keys()
+        return table_data[0].as_dict().keys()
     
     @classmethod
     def _get_table_headers(cls, table_data):
@@ -252,7 +255,7 @@ class ListTablePage(object):
     
     @classmethod
     def _get_display_row(cls, table_data_row):
-        return util.get_websafe_dict_copy(table_data_row.__dict__)
+        return util.get_websafe_dict_copy(table_data_row.as_dict())
     
     @classmethod
     def _table_data_to_basic_table_template_input(cls, table_data):
@@ -265,6 +268,31 @@ class ListTablePage(object):
     def basic_table_content(cls, table_data):
         return RENDER.basic_table_template(*cls._table_data_to_basic_table_template_input(table_data))
 
+class PagedListPage(object):
+    """for list pages whose json mode pages by keyset:  the client passes 'after' and 'limit', and gets back the cursor for the next page in a header."""
+    NEXT_CURSOR_HEADER = 'X-Trpl-Next-Cursor'
+    
+    @classmethod
+    def _get_page_input(cls):
+        """
+        (after, limit) from the request.  limit defaults to LIST_PAGE_SIZE, and gets capped at LIST_MAX_PAGE_SIZE.  after 
+        only gets checked for being a cursor at all here, since what it should hold depends on the list:  the list query 
+        raises ValueError for one that doesn't fit, which callers should turn into a bad request.
+        """
+        after = util.empty_str_to_none(web.input().get('after'))
+        try:
+            limit = int(web.input(limit=params.LIST_PAGE_SIZE).get('limit'))
+            if after is not None:
+                tc.PgUtil.decode_page_cursor(after)
+        except ValueError:
+            raise web.badrequest()
+        return after, max(1, min(limit, params.LIST_MAX_PAGE_SIZE))
+    
+    @classmethod
+    def _set_next_cursor_header(cls, next_cursor):
+        if next_cursor is not None:
+            web.header(cls.NEXT_CURSOR_HEADER, next_cursor)
+
 class login_form(BasePage):
     REQUIRES_VALID_SESSION = False
     
@@ -422,7 +450,7 @@ class nodespace_edit_form(BasePage, NodespaceForm):
         cls.is_allowed_to_use(nodespace, user)
         
         nodespace_id_hidden_html = web.form.Hidden(name='nodespace_id', value=nodespace.nodespace_id).render()
-        nodespace_edit_form_html = '%s\n%s' % (nodespace_id_hidden_html, cls.get_nodespace_form('edit_ns_submit_btn')(nodespace.__dict__).render())
+        nodespace_edit_form_html = '%s\n%s' % (nodespace_id_hidden_html, cls.get_nodespace_form('edit_ns_submit_btn')(nodespace.as_dict()).render())
         return cls.wrap_content(RENDER.basic_form_template(nodespace_edit_form_html, 'nodespace_edit_form', nodespace_edit.build_page_url()), user=user, extra_display_info={'nodespace': nodespace})
 
 class nodespace_edit(BasePage):
@@ -1078,7 +1106,7 @@ class user_change_pass(BasePage):
         change_pass_result, editing_user, edited_user = cls._render_page_helper(ms_session)
         return get_json_string(change_pass_result)
 
-class NodespaceList(BasePage, ListTablePage):
+class NodespaceList(BasePage, ListTablePage, PagedListPage):
     @classmethod
     def _get_col_keys(cls, table_data):
         return ['nodespace_name_link', 'nodespace_description']
@@ -1095,21 +1123,23 @@ class NodespaceList(BasePage, ListTablePage):
         return get_json_string(ret_val)
     
     @classmethod
-    def _render_page_helper(cls, ms_session):
+    def _render_page_helper(cls, ms_session, after=None, limit=None):
         user = tc.User.get_existing_user_by_id(PGDB, ms_session.user_id)
         cls.is_allowed_to_use(None, user)
-        nodespaces = cls.get_nodespaces(PGDB, user)
-        return user, nodespaces
+        nodespaces, next_cursor = cls.get_nodespaces(PGDB, user, after, limit)
+        return user, nodespaces, next_cursor
     
     @classmethod
     def render_page_full_html(cls, ms_session):
-        user, nodespaces = cls._render_page_helper(ms_session)
+        user, nodespaces, next_cursor = cls._render_page_helper(ms_session)
         page_content = cls.basic_table_content(nodespaces) if len(nodespaces) > 0 else ''
         return cls.wrap_content(page_content, user=user)
     
     @classmethod
     def render_page_json(cls, ms_session):
-        user, nodespaces = cls._render_page_helper(ms_session)
+        after, limit = cls._get_page_input()
+        user, nodespaces, next_cursor = cls._render_page_helper(ms_session, after, limit)
+        cls._set_next_cursor_header(next_cursor)
         nodespaces_dict_list = [{'nodespace_name': ns.nodespace_name, 
                                             'nodespace_description': ns.nodespace_description,
                                             'nodespace_id': ns.nodespace_id} for ns in nodespaces]
@@ -1121,8 +1151,9 @@ class nodespace_list_accessible(NodespaceList):
         return True
     
     @classmethod
-    def get_nodespaces(cls, PGDB, user):
-        return tc.Nodespace.get_accessible_nodespaces_by_user_id(PGDB, user.user_id)
+    def get_nodespaces(cls, PGDB, user, after, limit):
+        # a user's accessible nodespaces are few enough to always come back whole
+        return tc.Nodespace.get_accessible_nodespaces_by_user_id(PGDB, user.user_id), None
 
 class nodespace_list_all(NodespaceList):
     @classmethod
@@ -1130,10 +1161,14 @@ class nodespace_list_all(NodespaceList):
         return MS_PRVLG_CHKR.is_allowed_to_do(DB_TUPLE, MS_PRVLG_CHKR.LIST_ALL_SPACES_ACTION, None, actor, should_raise_insufficient_priv_ex)
     
     @classmethod
-    def get_nodespaces(cls, PGDB, user):
-        return tc.Nodespace.get_all_nodespaces(PGDB)
+    def get_nodespaces(cls, PGDB, user, after, limit):
+        try:
+            nodespaces = tc.Nodespace.get_all_nodespaces(PGDB, after, limit)
+        except ValueError:
+            raise web.badrequest()
+        return nodespaces, tc.Nodespace.get_next_page_cursor(nodespaces, limit)
 
-class user_list_nodespace(BasePage, ListTablePage):
+class user_list_nodespace(BasePage, ListTablePage, PagedListPage):
     @classmethod
     def _get_content_summary(cls, user, extra_display_info):
         if user is None:
@@ -1160,13 +1195,16 @@ class user_list_nodespace(BasePage, ListTablePage):
         return NS_PRVLG_CHKR.is_allowed_to_do(DB_TUPLE, NS_PRVLG_CHKR.ALTER_NODESPACE_ACCESS_ACTION, target, actor, should_raise_insufficient_priv_ex)
     
     @classmethod
-    def _render_page_helper(cls, ms_session):
+    def _render_page_helper(cls, ms_session, after=None, limit=None):
         nodespace_id = web.input().get('nodespace_id')
         user = tc.User.get_existing_user_by_id(PGDB, ms_session.user_id)
         nodespace = tc.Nodespace.get_existing_nodespace_by_id(PGDB, nodespace_id) if nodespace_id is not None else None
         cls.is_allowed_to_use(nodespace, user)
         
-        user_list = tc.User.get_user_and_access_info_by_nodespace_id(PGDB, nodespace_id)
+        try:
+            user_list = tc.User.get_user_and_access_info_by_nodespace_id(PGDB, nodespace_id, after, limit)
+        except ValueError:
+            raise web.badrequest()
         return (user, nodespace, user_list)
     
     @classmethod
@@ -1182,10 +1220,12 @@ class user_list_nodespace(BasePage, ListTablePage):
     
     @classmethod
     def render_page_json(cls, ms_session):
-        user, nodespace, user_list = cls._render_page_helper(ms_session)
+        after, limit = cls._get_page_input()
+        user, nodespace, user_list = cls._render_page_helper(ms_session, after, limit)
+        cls._set_next_cursor_header(tc.PgUtil.get_next_page_cursor(user_list, tc.User.USER_LIST_ORDER_COLS, limit))
         return get_json_string(user_list)
 
-class user_list_nodespace_absent(BasePage):
+class user_list_nodespace_absent(BasePage, PagedListPage):
     @classmethod
     def is_allowed_to_use(cls, target, actor, should_raise_insufficient_priv_ex=True):
         return MS_PRVLG_CHKR.is_allowed_to_do(DB_TUPLE, MS_PRVLG_CHKR.LIST_ALL_USERS_ACTION, target, actor, should_raise_insufficient_priv_ex)
@@ -1193,21 +1233,26 @@ class user_list_nodespace_absent(BasePage):
     @classmethod
     def render_page_json(cls, ms_session):
         nodespace_id = web.input().get('nodespace_id')
+        after, limit = cls._get_page_input()
         user = tc.User.get_existing_user_by_id(PGDB, ms_session.user_id)
         cls.is_allowed_to_use(None, user)
         
-        user_list = tc.User.get_users_absent_from_nodespace(PGDB, nodespace_id)
+        try:
+            user_list = tc.User.get_users_absent_from_nodespace(PGDB, nodespace_id, after, limit)
+        except ValueError:
+            raise web.badrequest()
+        cls._set_next_cursor_header(tc.PgUtil.get_next_page_cursor(user_list, tc.User.USER_LIST_ORDER_COLS, limit))
         return get_json_string([{'user_id': user.user_id, 'username': user.username, 'email_addr': user.email_addr,  
                                 'user_statement': user.user_statement, 'is_enabled': user.is_enabled} for user in user_list])
 
-class user_list_all(BasePage, ListTablePage):
+class user_list_all(BasePage, ListTablePage, PagedListPage):
     @classmethod
     def _get_col_keys(cls, table_data):
         return ['username', 'email_addr', 'user_statement', 'metaspace_privileges', 'is_enabled', 'creator', 'creation_date', 'modifier', 'modification_date']
     
     @classmethod
     def _get_display_row(cls, table_data_row):
-        ret_val = table_data_row.__dict__.copy()
+        ret_val = table_data_row.as_dict()
         for key in ['email_addr', 'user_statement']:
             ret_val[key] = web.websafe(ret_val[key])
         ret_val['username'] = util.a_elt(web.websafe(ret_val['username']), user_view.build_page_url(query_params={'viewed_user_id': ret_val['user_id']}))
@@ -1218,9 +1263,12 @@ class user_list_all(BasePage, ListTablePage):
         return MS_PRVLG_CHKR.is_allowed_to_do(DB_TUPLE, MS_PRVLG_CHKR.LIST_ALL_USERS_ACTION, None, actor, should_raise_insufficient_priv_ex)
     
     @classmethod
-    def _get_user_list(cls, viewing_user):
+    def _get_user_list(cls, viewing_user, after=None, limit=None):
         cls.is_allowed_to_use(None, viewing_user)
-        return tc.User.get_all_users(PGDB)
+        try:
+            return tc.User.get_all_users(PGDB, after, limit)
+        except ValueError:
+            raise web.badrequest()
     
     @classmethod
     def render_page_is_allowed_to_use(cls, ms_session):
@@ -1236,8 +1284,10 @@ class user_list_all(BasePage, ListTablePage):
     
     @classmethod
     def render_page_json(cls, ms_session):
+        after, limit = cls._get_page_input()
         viewing_user = tc.User.get_existing_user_by_id(PGDB, ms_session.user_id)
-        users = cls._get_user_list(viewing_user)
+        users = cls._get_user_list(viewing_user, after, limit)
+        cls._set_next_cursor_header(tc.User.get_next_page_cursor(users, limit))
         user_dict_list = [{'user_id': user.user_id, 'username': user.username, 'email_addr': user.email_addr, 
                             'user_statement': user.user_statement, 'metaspace_privileges': user.metaspace_privileges,
                             'is_enabled': user.is_enabled, 'creator': user.creator, 'creation_date': user.creation_date,
@@ -1509,17 +1559,44 @@ class GraphViewPage(object):
                                         'target': 'n%s'%adhoc_edge_dict['target']}}
         return cs_edge_dict
     
+    @classmethod
+    def iter_cat_tree_json(cls, graph_elements):
+        """
+        the json list of cytoscape elements for graph_elements ((element type, adhoc dict) tuples, as from 
+        util.iter_adhoc_graph_elements), yielded in pieces of about params.GRAPH_JSON_CHUNK_SIZE as graph_elements comes in.
+        """
+        buffered_strs, buffered_len = ['['], 1
+        is_first_element = True
+        for element_type, element in graph_elements:
+            if element_type == 'node':
+                element_json = json.dumps(cls._get_cytoscape_node_dict(element))
+            else:
+                element_json = json.dumps(cls._get_cytoscape_edge_dict(element))
+            if not is_first_element:
+                buffered_strs.append(',\n')
+            is_first_element = False
+            buffered_strs.append(element_json)
+            buffered_len += len(element_json) + 2
+            if buffered_len >= params.GRAPH_JSON_CHUNK_SIZE:
+                yield ''.join(buffered_strs)
+                buffered_strs, buffered_len = [], 0
+        buffered_strs.append(']')
+        yield ''.join(buffered_strs)
+    
     @classmethod
     def build_cat_tree_json(cls, cat_tree_dict):
-        node_list, edge_list = [], []
-        for node_id in cat_tree_dict['nodes']:
-            node = cat_tree_dict['nodes'][node_id]
-            node_list.append(cls._get_cytoscape_node_dict(node))
-        for edge_id in cat_tree_dict['edges']:
-            edge = cat_tree_dict['edges'][edge_id]
-            edge_list.append(cls._get_cytoscape_edge_dict(edge))
-        
-        return get_json_string(node_list + edge_list)
+        return ''.join(cls.iter_cat_tree_json(util.iter_graph_dict_elements(cat_tree_dict)))
+    
+    @classmethod
+    def stream_cat_tree_json(cls, graph_elements):
+        """
+        for returning graph json from a page handler:  web.py sends a returned iterator as it's consumed, and since there's 
+        no content length, the server uses a chunked response.  so the first bytes go out as soon as the first rows come 
+        back from neo, and the whole graph never has to be in memory.  privilege checks should happen before calling this, 
+        since the generator doesn't run until web.py starts sending the response.
+        """
+        web.header('Content-Type', 'application/json')
+        return cls.iter_cat_tree_json(graph_elements)
 
 class category_list(BasePage, GraphViewPage):
     @classmethod
@@ -1527,13 +1604,21 @@ class category_list(BasePage, GraphViewPage):
         return NS_PRVLG_CHKR.is_allowed_to_do(DB_TUPLE, NS_PRVLG_CHKR.VIEW_NODESPACE_ACTION, target, actor, should_raise_insufficient_priv_ex)
     
     @classmethod
-    def render_page(cls, ms_session):
+    def _get_user_and_graph_elements(cls, ms_session):
         user = tc.User.get_existing_user_by_id(PGDB, ms_session.user_id)
         nodespace = tc.Nodespace.get_existing_nodespace_by_id(PGDB, web.input().get('nodespace_id'))
         cls.is_allowed_to_use(nodespace, user)
-        
-        cat_tree_info = tc.AdhocNeoQueries.get_nodespace_categories(NEODB, nodespace.nodespace_id)
-        cat_tree_json = cls.build_cat_tree_json(cat_tree_info)
+        return user, tc.AdhocNeoQueries.iter_nodespace_categories(NEODB, nodespace.nodespace_id)
+    
+    @classmethod
+    def render_page_json(cls, ms_session):
+        user, graph_elements = cls._get_user_and_graph_elements(ms_session)
+        return cls.stream_cat_tree_json(graph_elements)
+    
+    @classmethod
+    def render_page_full_html(cls, ms_session):
+        user, graph_elements = cls._get_user_and_graph_elements(ms_session)
+        cat_tree_json = ''.join(cls.iter_cat_tree_json(graph_elements))
         return cls.wrap_content(RENDER.view_graph_template(cat_tree_json), user=user)
 
 class nodespace_overview(BasePage, GraphViewPage):
@@ -1542,21 +1627,95 @@ class nodespace_overview(BasePage, GraphViewPage):
         return NS_PRVLG_CHKR.is_allowed_to_do(DB_TUPLE, NS_PRVLG_CHKR.VIEW_NODESPACE_ACTION, target, actor, should_raise_insufficient_priv_ex)
     
     @classmethod
-    def render_page_json(cls, ms_session):
+    def _get_user_and_graph_elements(cls, ms_session):
         user = tc.User.get_existing_user_by_id(PGDB, ms_session.user_id)
         nodespace = tc.Nodespace.get_existing_nodespace_by_id(PGDB, web.input().get('nodespace_id'))
         cls.is_allowed_to_use(nodespace, user)
-        
-        overview_graph_info = tc.AdhocNeoQueries.get_nodespace_categories_and_writeups(NEODB, nodespace.nodespace_id)
-        overview_graph_json = cls.build_cat_tree_json(overview_graph_info)
-        return overview_graph_json
+        return user, tc.AdhocNeoQueries.iter_nodespace_categories_and_writeups(NEODB, nodespace.nodespace_id)
+    
+    @classmethod
+    def render_page_json(cls, ms_session):
+        user, graph_elements = cls._get_user_and_graph_elements(ms_session)
+        return cls.stream_cat_tree_json(graph_elements)
 
     @classmethod
     def render_page_full_html(cls, ms_session):
-        overview_graph_json = cls.render_page_json(ms_session)
-        user = tc.User.get_existing_user_by_id(PGDB, ms_session.user_id)
+        user, graph_elements = cls._get_user_and_graph_elements(ms_session)
+        overview_graph_json = ''.join(cls.iter_cat_tree_json(graph_elements))
         return cls.wrap_content(RENDER.view_graph_template(overview_graph_json), user=user)
 
+class nodespace_subgraph(BasePage, GraphViewPage):
+    """
+    json only.  part of a nodespace's graph, for expanding it a bit at a time:  see AdhocNeoQueries.get_category_subgraph.  
+    root_node_id is the category to start from (default: the top of the nodespace), and has_more_children in the response 
+    maps the cytoscape id of each category that has children left out to the children_offset to ask for them with.
+    """
+    @classmethod
+    def is_allowed_to_use(cls, target, actor, should_raise_insufficient_priv_ex=True):
+        return NS_PRVLG_CHKR.is_allowed_to_do(DB_TUPLE, NS_PRVLG_CHKR.VIEW_NODESPACE_ACTION, target, actor, should_raise_insufficient_priv_ex)
+    
+    @classmethod
+    def render_page_json(cls, ms_session):
+        user = tc.User.get_existing_user_by_id(PGDB, ms_session.user_id)
+        page_input = web.input(root_node_id=None, max_depth=params.GRAPH_LOD_DEFAULT_MAX_DEPTH, 
+                                children_page_size=params.GRAPH_LOD_DEFAULT_CHILDREN_PAGE_SIZE, children_offset=0)
+        nodespace = tc.Nodespace.get_existing_nodespace_by_id(PGDB, page_input.get('nodespace_id'))
+        cls.is_allowed_to_use(nodespace, user)
+        
+        try:
+            max_depth = min(max(int(page_input.max_depth), 0), params.GRAPH_LOD_MAX_DEPTH)
+            children_page_size = min(max(int(page_input.children_page_size), 1), params.GRAPH_LOD_MAX_CHILDREN_PAGE_SIZE)
+            children_offset = max(int(page_input.children_offset), 0)
+            root_node_id = int(page_input.root_node_id) if util.empty_str_to_none(page_input.root_node_id) is not None else None
+        except ValueError:
+            raise web.badrequest()
+        
+        try:
+            subgraph = tc.AdhocNeoQueries.get_category_subgraph(NEODB, nodespace.nodespace_id, root_node_id, max_depth, 
+                                                                children_page_size, children_offset)
+        except KeyError:
+            # not a category in this nodespace
+            raise web.notfound()
+        
+        elements_json = ''.join(cls.iter_cat_tree_json(util.iter_graph_dict_elements(subgraph)))
+        has_more_children = dict(('n%s' % cat_id, next_offset) for cat_id, next_offset in subgraph['has_more_children'].iteritems())
+        web.header('Content-Type', 'application/json')
+        return '{"elements": %s, "has_more_children": %s}' % (elements_json, get_json_string(has_more_children))
+
+class nodespace_search(BasePage):
+    """
+    json only.  full-text search (see tc.ContentSearch) over one nodespace, or over every nodespace the user can view if 
+    nodespace_id is left out.  content_type is a category, writeup or comment node type (default: writeups).  pass a 
+    response's next_cursor back as cursor to get the next page.
+    """
+    @classmethod
+    def is_allowed_to_use(cls, target, actor, should_raise_insufficient_priv_ex=True):
+        return NS_PRVLG_CHKR.is_allowed_to_do(DB_TUPLE, NS_PRVLG_CHKR.VIEW_NODESPACE_ACTION, target, actor, should_raise_insufficient_priv_ex)
+    
+    @classmethod
+    def render_page_json(cls, ms_session):
+        user = tc.User.get_existing_user_by_id(PGDB, ms_session.user_id)
+        page_input = web.input(nodespace_id=None, q='', content_type=tc.WriteupNode.NODE_TYPE, cursor=None, page_size=params.SEARCH_PAGE_SIZE)
+        
+        if util.empty_str_to_none(page_input.nodespace_id) is not None:
+            nodespace = tc.Nodespace.get_existing_nodespace_by_id(PGDB, page_input.nodespace_id)
+            cls.is_allowed_to_use(nodespace, user)
+            nodespace_ids = [nodespace.nodespace_id]
+        else:
+            nodespaces = tc.Nodespace.get_accessible_nodespaces_by_user_id(PGDB, user.user_id)
+            nodespace_ids = [nodespace.nodespace_id for nodespace in nodespaces if cls.is_allowed_to_use(nodespace, user, False)]
+        
+        if page_input.content_type not in tc.ContentSearch.SEARCHABLE_TYPES:
+            raise web.badrequest()
+        try:
+            page_size = min(max(int(page_input.page_size), 1), params.SEARCH_MAX_PAGE_SIZE)
+            search_results = tc.ContentSearch.get_cache().search(NEODB, nodespace_ids, page_input.q, page_input.content_type, 
+                                                                util.empty_str_to_none(page_input.cursor), page_size)
+        except ValueError:
+            raise web.badrequest()
+        
+        return get_json_string(search_results)
+
 class nga(BasePage):
     @classmethod
     def _get_header_links(cls, user, extra_display_info):
@@ -1609,11 +1768,68 @@ click on a node and see:
 class writeup_list(BasePage):
     pass
 
-class comment_thread_list(BasePage):
-    pass
+class CommentThreadPage(object):
+    @classmethod
+    def is_allowed_to_use(cls, target, actor, should_raise_insufficient_priv_ex=True):
+        return NS_PRVLG_CHKR.is_allowed_to_do(DB_TUPLE, NS_PRVLG_CHKR.VIEW_NODESPACE_ACTION, target, actor, should_raise_insufficient_priv_ex)
+    
+    @classmethod
+    def _get_content_node_for_user(cls, user, unique_node_id, node_types):
+        """
+        the content node with unique_node_id, if it's one of node_types and the user can view its nodespace.  it's only 
+        partially loaded (no body), since the pages just need its nodespace and its place in a thread.
+        """
+        content_node = tc.NodespaceContentNode.get_existing_node_by_unique_id(NEODB, unique_node_id, 
+                                                                            [tc.NodespaceContentNode.NODESPACE_ID_FIELD_NAME, tc.CommentNode.THREAD_PATH_FIELD_NAME])
+        if content_node is None or content_node.NODE_TYPE not in node_types:
+            raise web.notfound()
+        nodespace = tc.Nodespace.get_existing_nodespace_by_id(PGDB, content_node.get_parent_nodespace_id(NEODB))
+        cls.is_allowed_to_use(nodespace, user)
+        return content_node
+    
+    @classmethod
+    def _get_comment_dict(cls, comment):
+        props = comment._properties
+        thread_path = comment.get_thread_path(NEODB)
+        path_ids = tc.CommentNode.parse_thread_path(thread_path)
+        return {'comment_id': props[tc.CommentNode.UNIQUE_NODE_ID_FIELD_NAME], 
+                'parent_comment_id': path_ids[-2] if len(path_ids) > 1 else None,
+                'thread_root_id': path_ids[0],
+                'depth': len(path_ids) - 1, 
+                'thread_path': thread_path,
+                'subject': props[tc.CommentNode.COMMENT_SUBJECT_FIELD_NAME], 
+                'body': comment.get_field(NEODB, tc.CommentNode.COMMENT_BODY_FIELD_NAME)}
 
-class comment_thread_view(BasePage):
-    pass
+class comment_thread_list(BasePage, CommentThreadPage):
+    """json only.  the threads (just their root comments) attached to the category or writeup parent_node_id."""
+    @classmethod
+    def render_page_json(cls, ms_session):
+        user = tc.User.get_existing_user_by_id(PGDB, ms_session.user_id)
+        parent_node = cls._get_content_node_for_user(user, web.input().get('parent_node_id'), [tc.CategoryNode.NODE_TYPE, tc.WriteupNode.NODE_TYPE])
+        thread_roots = tc.CommentNode.get_thread_roots(NEODB, parent_node._properties[tc.TripelNode.UNIQUE_NODE_ID_FIELD_NAME])
+        return get_json_string({'threads': [cls._get_comment_dict(thread_root) for thread_root in thread_roots]})
+
+class comment_thread_view(BasePage, CommentThreadPage):
+    """
+    json only.  the thread that comment_id is in, or a page of it, in tree order.  each comment has its depth and its 
+    parent's id for laying out the tree.  pass a response's next_cursor back as cursor to get the next page.
+    """
+    @classmethod
+    def render_page_json(cls, ms_session):
+        user = tc.User.get_existing_user_by_id(PGDB, ms_session.user_id)
+        page_input = web.input(comment_id=None, cursor=None, page_size=params.COMMENT_THREAD_PAGE_SIZE)
+        comment = cls._get_content_node_for_user(user, page_input.comment_id, [tc.CommentNode.NODE_TYPE])
+        try:
+            page_size = min(max(int(page_input.page_size), 1), params.COMMENT_THREAD_MAX_PAGE_SIZE)
+        except ValueError:
+            raise web.badrequest()
+        
+        thread_root_id = comment.get_thread_root_id(NEODB)
+        # one extra, to find out whether there's another page
+        comments = tc.CommentNode.get_thread_comments(NEODB, thread_root_id, util.empty_str_to_none(page_input.cursor), page_size + 1)
+        next_cursor = comments[page_size - 1]._properties[tc.CommentNode.THREAD_PATH_FIELD_NAME] if len(comments) > page_size else None
+        return get_json_string({'thread_root_id': thread_root_id, 'comments': [cls._get_comment_dict(cmnt) for cmnt in comments[:page_size]], 
+                                'next_cursor': next_cursor})
 
 class category_view(BasePage):
     pass
@@ -1665,7 +1881,7 @@ page_classes = [login_form, login_verify, logout, auth_status,
                 nodespace_list_accessible, nodespace_list_all, user_list_nodespace, user_list_nodespace_absent, user_list_all, 
                 metaspace_access_edit_form, metaspace_access_edit, 
                 nodespace_access_edit_form, nodespace_access_edit, nodespace_access_revoke, nodespace_access_grant, metaspace_command_list,
-                category_list, nodespace_overview, writeup_list, comment_thread_list,
+                category_list, nodespace_overview, nodespace_subgraph, nodespace_search, writeup_list, comment_thread_list, comment_thread_view,
                 comment_create_form, comment_reply_form, comment_edit_form, writeup_create_form, writeup_edit_form,
                 nga, get_locale_messages]
 
@@ -1679,4 +1895,28 @@ urls = tuple(urls_list)
 web.config.debug = params.WEB_PY_DEBUG
 
 app = web.application(urls, globals())
+
+if isinstance(PGDB, tc.ReplicaRoutedDB):
+    def pg_replica_routing_processor(handler):
+        # a client that wrote recently reads from the primary until the cookie's time passes
+        with PGDB.routing_scope(web.cookies().get(params.PG_REPLICA_STICKY_COOKIE_NAME)) as routing_state:
+            try:
+                return handler()
+            finally:
+                if routing_state.did_write:
+                    web.setcookie(params.PG_REPLICA_STICKY_COOKIE_NAME, str(PGDB.get_primary_until()), 
+                                    expires=params.PG_REPLICA_STICKY_SECS, domain=None, secure=True)
+    app.add_processor(pg_replica_routing_processor)
+
+if isinstance(tc.PgUtil.get_primary_db(PGDB), tc.PooledPostgresDB):
+    def pg_request_scope_processor(handler):
+        # each request gets one pooled connection for its queries.  a streamed response (a generator) runs after this 
+        # returns, so its queries just check out a connection apiece.
+        with PGDB.request_scope():
+            return handler()
+    app.add_processor(pg_request_scope_processor)
+    try:
+        PGDB.pool.fill_to_min_size()
+    except Exception:
+        logger.exception('could not open the initial postgres connections')
 application = app.wsgifunc()
@@ -1,6 +1,9 @@
 import os
 import re
+import json
+import array
 import base64
+import bisect
 from threading import Thread
 from datetime import datetime
 import pytz
@@ -50,6 +53,23 @@ def get_file_contents(filename):
     f.close()
     return contents
 
+#about snippet_len characters of text, centered on the first place one of terms (lowercase words) shows up in it, or from 
+#the start if none of them do.  cut at whitespace where possible, with '...' where the text was cut.
+def get_text_snippet(text, terms, snippet_len):
+    if not text:
+        return ''
+    match_positions = [match.start() for match in [re.search(r'\b%s' % re.escape(term), text, re.IGNORECASE | re.UNICODE) for term in terms] if match]
+    start = max(0, min(match_positions) - snippet_len / 2) if match_positions else 0
+    end = min(len(text), start + snippet_len)
+    start = max(0, end - snippet_len)
+    if start > 0:
+        space_idx = text.find(' ', start, start + snippet_len / 4)
+        start = space_idx + 1 if space_idx >= 0 else start
+    if end < len(text):
+        space_idx = text.rfind(' ', end - snippet_len / 4, end)
+        end = space_idx if space_idx > start else end
+    return '%s%s%s' % ('...' if start > 0 else '', text[start:end].strip(), '...' if end < len(text) else '')
+
 def get_websafe_dict_copy(original_dict):
     ret_val = original_dict.copy()
     for key in ret_val.keys():
@@ -108,18 +128,180 @@ def build_adhoc_edge_dict(edge_id, edge_type, source, target, edge_data):
     return {'edge_id': edge_id, 'edge_type': edge_type, 'source': source, 'target': target, 'edge_properties': edge_data}
 
 def build_adhoc_graph_dict(query_results, get_node_and_edge_dicts_fn):
+    return build_graph_dict_from_elements(iter_adhoc_graph_elements(query_results, get_node_and_edge_dicts_fn))
+
+def build_graph_dict_from_elements(graph_elements):
     graph_dict = {'nodes': {}, 'edges': {}}
+    for element_type, element in graph_elements:
+        if element_type == 'node':
+            graph_dict['nodes'][element['node_id']] = element
+        else:
+            graph_dict['edges'][element['edge_id']] = element
+    return graph_dict
+
+#streaming version of build_adhoc_graph_dict:  yields ('node', node dict) and ('edge', edge dict) tuples as it goes 
+#through query_results (which can be any iterable of rows, e.g. NeoUtil.iter_cypher_rows), skipping the nodes and edges 
+#it's already yielded.  each row's nodes come out before its edges.  only the ids seen so far are kept around.
+def iter_adhoc_graph_elements(query_results, get_node_and_edge_dicts_fn):
+    seen_node_ids, seen_edge_ids = CompactIdSet(), CompactIdSet()
     for row in query_results:
         nodes, edges = get_node_and_edge_dicts_fn(row)
-        
         for node in nodes:
-            node_id = node['node_id']
-            if node_id not in graph_dict['nodes']:
-                graph_dict['nodes'][node_id] = node
-        
+            if seen_node_ids.add(node['node_id']):
+                yield 'node', node
         for edge in edges:
-            edge_id = edge['edge_id']
-            if edge_id not in graph_dict['edges']:
-                graph_dict['edges'][edge_id] = edge
+            if seen_edge_ids.add(edge['edge_id']):
+                yield 'edge', edge
+
+#the same tuples as iter_adhoc_graph_elements, for a graph dict that's already been built (all nodes, then all edges).
+def iter_graph_dict_elements(graph_dict):
+    for node in graph_dict['nodes'].itervalues():
+        yield 'node', node
+    for edge in graph_dict['edges'].itervalues():
+        yield 'edge', edge
+
+
+class CompactIdSet(object):
+    """
+    a set of non-negative ints (e.g. unique node/edge ids), split into blocks of 2^16 possible values.  a block holds its 
+    members as a sorted array of 2 byte offsets until it'd be bigger that way than as a bitmap (8KB), at which point 
+    it becomes a bitmap.  so sparse ids cost about 2 bytes each and dense ones about 1 bit each, instead of the few 
+    dozen bytes per entry of a regular set.  anything that isn't a non-negative int goes in a regular set on the side.
+    """
+    BLOCK_BITS = 16
+    ARRAY_MAX_LEN = (1 << BLOCK_BITS) / 16
     
-    return graph_dict
+    def __init__(self):
+        self._blocks = {}
+        self._other_vals = set()
+        self._len = 0
+    
+    def _split(self, val):
+        """returns (block key, offset in block), or None if val doesn't go in a block."""
+        if isinstance(val, (int, long)) and not isinstance(val, bool) and val >= 0:
+            return val >> self.BLOCK_BITS, val & ((1 << self.BLOCK_BITS) - 1)
+        return None
+    
+    def __contains__(self, val):
+        split_val = self._split(val)
+        if split_val is None:
+            return val in self._other_vals
+        block = self._blocks.get(split_val[0])
+        if block is None:
+            return False
+        offset = split_val[1]
+        if isinstance(block, bytearray):
+            return bool(block[offset >> 3] & (1 << (offset & 7)))
+        idx = bisect.bisect_left(block, offset)
+        return idx < len(block) and block[idx] == offset
+    
+    def add(self, val):
+        """unlike set.add, returns whether val was actually added (i.e. False if it was already there)."""
+        split_val = self._split(val)
+        if split_val is None:
+            if val in self._other_vals:
+                return False
+            self._other_vals.add(val)
+            self._len += 1
+            return True
+        
+        block_key, offset = split_val
+        block = self._blocks.setdefault(block_key, array.array('H'))
+        if isinstance(block, bytearray):
+            byte_idx, bit = offset >> 3, 1 << (offset & 7)
+            if block[byte_idx] & bit:
+                return False
+            block[byte_idx] |= bit
+        else:
+            idx = bisect.bisect_left(block, offset)
+            if idx < len(block) and block[idx] == offset:
+                return False
+            block.insert(idx, offset)
+            if len(block) > self.ARRAY_MAX_LEN:
+                bitmap = bytearray((1 << self.BLOCK_BITS) / 8)
+                for member_offset in block:
+                    bitmap[member_offset >> 3] |= 1 << (member_offset & 7)
+                self._blocks[block_key] = bitmap
+        self._len += 1
+        return True
+    
+    def __len__(self):
+        return self._len
+
+
+class _JsonChunkReader(object):
+    """reads json values off of an iterable of string chunks, keeping only the unconsumed part of the current chunk(s)."""
+    WHITESPACE = ' \t\r\n'
+    # what can follow a value in the arrays and objects this reads
+    DELIMITERS = ',]}' + WHITESPACE
+    
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._is_exhausted = False
+    
+    def _read_chunk(self):
+        """appends the next chunk to the buffer (dropping what's been consumed).  returns False if there wasn't one."""
+        if not self._is_exhausted:
+            for chunk in self._chunks:
+                self._buf = self._buf[self._pos:] + chunk
+                self._pos = 0
+                return True
+            self._is_exhausted = True
+        return False
+    
+    def peek(self):
+        """returns the next non-whitespace character without consuming it, or '' at the end of the input."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in self.WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._read_chunk():
+                return ''
+    
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('expected %r in json input, got %r' % (char, self.peek()))
+        self._pos += 1
+    
+    def read_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end_pos = self._decoder.raw_decode(self._buf, self._pos)
+            except ValueError:
+                # probably just incomplete, so try again with more input
+                if not self._read_chunk():
+                    raise
+                continue
+            # a number can look complete when a chunk cuts it off (e.g. "1." or "1e" decodes as 1), so only take it 
+            # once there's a delimiter after it, or there's no more input
+            is_number = isinstance(value, (int, long, float)) and not isinstance(value, bool)
+            if (end_pos < len(self._buf) and (not is_number or self._buf[end_pos] in self.DELIMITERS)) or not self._read_chunk():
+                self._pos = end_pos
+                return value
+
+#incrementally parses a json object that arrives as an iterable of string chunks (e.g. NeoHttpPool.request_stream), and 
+#yields each item of the array under the top level key array_key as soon as it's complete.  the other top level 
+#values get parsed and thrown away.  so memory use is bounded by the biggest single item, not the whole document.
+def iter_json_array_items(chunks, array_key):
+    reader = _JsonChunkReader(chunks)
+    reader.expect('{')
+    while reader.peek() != '}':
+        key = reader.read_value()
+        reader.expect(':')
+        if key == array_key:
+            reader.expect('[')
+            while reader.peek() != ']':
+                yield reader.read_value()
+                if reader.peek() == ',':
+                    reader.expect(',')
+            reader.expect(']')
+        else:
+            reader.read_value()
+        if reader.peek() == ',':
+            reader.expect(',')
+    reader.expect('}')